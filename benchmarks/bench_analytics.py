@@ -0,0 +1,137 @@
+"""
+Статистика активности по сводкам против подсчета по сырым записям.
+
+Заполняет user_activity записями за STATS_WINDOW_DAYS дней в нескольких
+чатах через write_batch (сводки обновляются в той же транзакции) и
+сравнивает:
+
+    запись   — вставка только в user_activity и вместе со сводками;
+    /stats   — агрегация user_activity за окно (иначе без сводок не ответить) и
+               get_chat_stats по activity_chat_daily и activity_daily;
+    выгрузка — iterate_activity_csv по всем чатам, с пиковой памятью.
+
+Запуск: python benchmarks/bench_analytics.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench_analytics.sqlite"))
+os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_analytics.log"))
+
+from config import create_tables, get_chat_stats, iterate_activity_csv, storage, write_batch  # noqa: E402
+from config.analytics import DAY, STATS_TOP_USERS, STATS_WINDOW_DAYS  # noqa: E402
+
+ROWS = int(os.getenv("BENCH_ROWS", "500000"))
+CHATS = int(os.getenv("BENCH_CHATS", "20"))
+USERS = int(os.getenv("BENCH_USERS", "5000"))
+QUERIES = int(os.getenv("BENCH_QUERIES", "50"))
+BATCH = 5000
+CHAT_ID = -1001
+
+
+def _insert_raw(connection, activity):
+    connection.executemany("""
+        INSERT INTO user_activity (user_id, request_time, chat_id)
+        VALUES (?, ?, ?)
+    """, activity)
+
+
+def _clear_raw(connection):
+    connection.execute("DELETE FROM user_activity")
+
+
+def _legacy_stats(connection, chat_id, since, today):
+    # Тот же ответ, что у get_chat_stats, но по сырым записям
+    daily = connection.execute("""
+        SELECT date(request_time), COUNT(*), COUNT(DISTINCT user_id) FROM user_activity
+        WHERE chat_id = ? AND request_time >= ?
+        GROUP BY date(request_time)
+    """, (chat_id, since)).fetchall()
+    leaders = connection.execute("""
+        SELECT user_id, COUNT(*) AS requests FROM user_activity
+        WHERE chat_id = ? AND request_time >= ?
+        GROUP BY user_id
+        ORDER BY requests DESC
+        LIMIT ?
+    """, (chat_id, today, STATS_TOP_USERS)).fetchall()
+    return daily, leaders
+
+
+def activity_rows(count, now):
+    generator = random.Random(1)
+    rows = []
+    for _ in range(count):
+        moment = now - generator.random() * STATS_WINDOW_DAYS * DAY
+        rows.append((
+            generator.randrange(1, USERS + 1),
+            datetime.fromtimestamp(moment, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            CHAT_ID - generator.randrange(CHATS),
+        ))
+    rows.sort(key=lambda row: row[1])
+    return rows
+
+
+def report(label, elapsed, count, unit):
+    print(f"{label:<52} {elapsed * 1000:>9.1f} мс  ({count / elapsed:,.0f} {unit}/с)")
+
+
+async def main():
+    create_tables()
+    now = time.time()
+    rows = activity_rows(ROWS, now)
+
+    started = time.perf_counter()
+    for start in range(0, ROWS, BATCH):
+        await storage.run(_insert_raw, rows[start:start + BATCH])
+    report(f"до: запись {ROWS} событий только в user_activity", time.perf_counter() - started, ROWS, "событий")
+    await storage.run(_clear_raw)
+
+    started = time.perf_counter()
+    for start in range(0, ROWS, BATCH):
+        await write_batch([], rows[start:start + BATCH])
+    report(f"после: запись {ROWS} событий вместе со сводками", time.perf_counter() - started, ROWS, "событий")
+
+    window_start = datetime.fromtimestamp((int(now) // DAY - STATS_WINDOW_DAYS + 1) * DAY, timezone.utc)
+    today = datetime.fromtimestamp(int(now) // DAY * DAY, timezone.utc)
+    since, today = window_start.strftime("%Y-%m-%d %H:%M:%S"), today.strftime("%Y-%m-%d %H:%M:%S")
+
+    started = time.perf_counter()
+    for _ in range(QUERIES):
+        await storage.run(_legacy_stats, CHAT_ID, since, today)
+    report("до: /stats по user_activity", time.perf_counter() - started, QUERIES, "запросов")
+
+    started = time.perf_counter()
+    for _ in range(QUERIES):
+        await get_chat_stats(CHAT_ID, now)
+    report("после: /stats по сводкам", time.perf_counter() - started, QUERIES, "запросов")
+
+    async def export():
+        size = 0
+        async for chunk in iterate_activity_csv(granularity="hourly"):
+            size += len(chunk)
+        return size
+
+    # Время и память замеряются разными проходами: tracemalloc замедляет выполнение
+    started = time.perf_counter()
+    size = await export()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    await export()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    report(f"выгрузка CSV по часам ({size / 2 ** 20:.1f} МБ), пик {peak / 2 ** 20:.1f} МБ", elapsed,
+           size / 2 ** 20, "МБ")
+    storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
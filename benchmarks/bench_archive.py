@@ -0,0 +1,88 @@
+"""
+Архив сообщений: запись, сжатие холодных сегментов и поиск /search.
+
+Заполняет архив миллионом сообщений в нескольких десятках чатов за два
+периода, сжимает прошедший период и старую часть текущего, затем
+замеряет время поиска по частым и редким словам в горячих и сжатых данных.
+
+Запуск: python benchmarks/bench_archive.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.archive import MessageArchive  # noqa: E402
+
+ROWS = int(os.getenv("BENCH_ROWS", "1000000"))
+CHATS = int(os.getenv("BENCH_CHATS", "50"))
+SEARCHES = int(os.getenv("BENCH_SEARCHES", "200"))
+BATCH = 500
+
+VOCABULARY = [f"слово{i}" for i in range(5000)] + ["встреча", "поездка", "билеты", "правила", "бан"]
+
+
+def archive_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 2 ** 20
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+
+async def main():
+    directory = tempfile.mkdtemp()
+    archive = MessageArchive(directory, rollover="month", hot_days=7)
+    rng = random.Random(1)
+    chats = [-1_000_000_000_000 - i for i in range(CHATS)]
+    now = time.time()
+    # Сообщения равномерно за последние 60 дней: два-три файла архива
+    start = now - 60 * 86400
+    step = (now - start) / ROWS
+
+    print(f"Запись: {ROWS} сообщений, {CHATS} чатов, пакеты по {BATCH}")
+    started = time.perf_counter()
+    for offset in range(0, ROWS, BATCH):
+        await archive.write([
+            (rng.choice(chats), rng.randrange(10_000), start + (offset + i) * step,
+             " ".join(rng.choices(VOCABULARY, k=rng.randint(3, 15))))
+            for i in range(min(BATCH, ROWS - offset))
+        ])
+    elapsed = time.perf_counter() - started
+    print(f"{'запись':<40} {elapsed:>8.1f} с  ({ROWS / elapsed:,.0f} сообщений/с)")
+    print(f"{'размер до сжатия':<40} {archive_size(directory):>8.1f} МБ  (файлы: {', '.join(archive.periods())})")
+
+    started = time.perf_counter()
+    compacted = 0
+    while True:
+        count = await archive.maintain(now)
+        compacted += count
+        if not count:
+            break
+    print(f"{'сжатие':<40} {time.perf_counter() - started:>8.1f} с  ({compacted} сообщений)")
+    print(f"{'размер после сжатия':<40} {archive_size(directory):>8.1f} МБ")
+
+    queries = [
+        ("частое слово", "встреча"),
+        ("два слова", "поездка билеты"),
+        ("редкое слово", "слово4242"),
+        ("нет совпадений", "отсутствует"),
+    ]
+    for label, query in queries:
+        samples = []
+        for _ in range(SEARCHES):
+            chat_id = rng.choice(chats)
+            started = time.perf_counter()
+            await archive.search(chat_id, query)
+            samples.append(time.perf_counter() - started)
+        print(f"поиск: {label:<33} p50 {percentile(samples, 0.5):>6.2f} мс  p99 {percentile(samples, 0.99):>6.2f} мс")
+    archive.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,243 @@
+"""
+Нагрузочный прогон настоящих обработчиков без Telegram.
+
+Обработчики StartHandler, InviteButton, EventButton, DepartureHandler,
+MessageHandler, NewMemberHandler и AntiSpamMiddleware регистрируются на FakeClient
+(benchmarks/fake_client.py), которому скармливаются синтетические потоки
+обновлений:
+
+    start         — /start в личке от разных пользователей;
+    flood         — поток сообщений в группе: антиспам их не режет, все доходят до архива;
+    departure     — переписка в группе с сообщениями «Я уехал»;
+    join_wave     — волна заявок на вступление: половина заявителей есть в базе
+                    приглашающего чата, четверть — только в Telegram, остальные отклоняются;
+    invite_storm  — массовые нажатия «Приглашение»;
+    event         — нажатия «Мероприятие» и рассылка упоминаний.
+
+Для каждого сценария печатаются обновлений/с, p50/p99 задержки от
+постановки в очередь до конца обработки, число вызовов API и ошибок,
+среднее время выбора маршрута текстовым маршрутизатором, а также время
+операций с базой по данным db_query_seconds (включает
+ожидание свободного соединения, т. е. конкуренцию за пул).
+
+Пропускная способность при медленном API упирается в число параллельных
+обработчиков (BENCH_WORKERS, в Pyrogram — параметр workers клиента).
+
+Запуск: python benchmarks/bench_load.py [сценарий ...]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench_load.sqlite"))
+os.environ.setdefault("ARCHIVE_DIR", os.path.join(tempfile.mkdtemp(), "archive"))
+os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_load.log"))
+os.environ.setdefault("PERSIST_CONVERSATIONS", "0")
+
+from benchmarks.fake_client import FakeClient  # noqa: E402
+from config import ChatRegistry, create_tables, storage, upsert_users, write_behind  # noqa: E402
+from config.middleware import AntiSpamMiddleware, register_middleware  # noqa: E402
+from handlers import (StartHandler, InviteButton, EventButton, DepartureHandler, MessageHandler,  # noqa: E402
+                      NewMemberHandler, InviteLinkPool, JoinRequestProcessor, MembershipCache, MentionRenderer,
+                      OutboundScheduler)
+from metrics import registry  # noqa: E402
+
+USERS = int(os.getenv("BENCH_USERS", "2000"))
+FLOOD_USERS = int(os.getenv("BENCH_FLOOD_USERS", "100"))
+FLOOD_MESSAGES = int(os.getenv("BENCH_FLOOD_MESSAGES", "40"))
+EVENTS = int(os.getenv("BENCH_EVENTS", "20"))
+API_LATENCY = float(os.getenv("BENCH_API_LATENCY", "0.02"))
+# По умолчанию как в Pyrogram: min(32, cpu_count + 4)
+WORKERS = int(os.getenv("BENCH_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+INVITING_CHAT_ID = -1001
+INVITED_CHAT_ID = -1002
+JOIN_FIRST_USER = 30_000
+
+
+def build(chat_registry: ChatRegistry) -> FakeClient:
+    """
+    Регистрирует обработчики на новом клиенте со свежим состоянием
+    антиспама, кешей и очереди исходящих (без лимитов Telegram).
+    """
+    app = FakeClient(api_latency=API_LATENCY, workers=WORKERS)
+    outbound = OutboundScheduler(global_rate=1e6, private_rate=1e6, group_rate=1e6, group_burst=1_000_000)
+    mentions = MentionRenderer(outbound=outbound)
+    register_middleware(app, AntiSpamMiddleware(app))
+    StartHandler(app)
+    InviteButton(app, chat_registry, membership_cache=MembershipCache(), invite_links=InviteLinkPool(),
+                 outbound=outbound)
+    EventButton(app, chat_registry, mentions=mentions)
+    DepartureHandler(app, chat_registry, outbound=outbound)
+    join_requests = JoinRequestProcessor(chat_registry, MembershipCache(), mentions=mentions, outbound=outbound,
+                                         batch_window=0.05, decision_rate=1e6, decision_burst=1_000_000,
+                                         max_in_flight=WORKERS)
+    join_requests.start()
+    NewMemberHandler(app, join_requests=join_requests)
+    MessageHandler(app)
+    app.outbound = outbound
+    app.join_requests = join_requests
+    return app
+
+
+def scenario_start(app):
+    return [[app.message(user_id, user_id, "/start") for user_id in range(10_000, 10_000 + USERS)]]
+
+
+def scenario_flood(app):
+    return [[
+        app.message(INVITED_CHAT_ID, 20_000 + i % FLOOD_USERS, f"сообщение {i}")
+        for i in range(FLOOD_USERS * FLOOD_MESSAGES)
+    ]]
+
+
+def scenario_departure(app):
+    # Обычная переписка в группе, каждое двадцатое сообщение — об отъезде
+    return [[
+        app.message(INVITED_CHAT_ID, 60_000 + i, "Я уехал на 2 дня" if i % 20 == 0 else f"Всем привет, я тут {i}")
+        for i in range(USERS)
+    ]]
+
+
+def scenario_join_wave(app):
+    app.chat_members[INVITING_CHAT_ID] = set(range(JOIN_FIRST_USER, JOIN_FIRST_USER + USERS * 3 // 4))
+    return [[app.join_request(INVITED_CHAT_ID, user_id) for user_id in range(JOIN_FIRST_USER, JOIN_FIRST_USER + USERS)]]
+
+
+def scenario_invite_storm(app):
+    return [[app.callback(INVITING_CHAT_ID, user_id, "invite") for user_id in range(40_000, 40_000 + USERS)]]
+
+
+def scenario_event(app):
+    users = range(50_000, 50_000 + EVENTS)
+    return [
+        [app.callback(INVITED_CHAT_ID, user_id, "event") for user_id in users],
+        [app.message(user_id, user_id, f"Собираемся в 19:00, повод №{user_id}") for user_id in users],
+    ]
+
+
+SCENARIOS = {
+    "start": scenario_start,
+    "flood": scenario_flood,
+    "departure": scenario_departure,
+    "join_wave": scenario_join_wave,
+    "invite_storm": scenario_invite_storm,
+    "event": scenario_event,
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def db_snapshot():
+    return {
+        metric.labels: (metric.count, list(metric.bucket_counts))
+        for metric in registry.all() if metric.name == "db_query_seconds"
+    }
+
+
+def routing_snapshot():
+    metric = registry.histogram("text_routing_seconds", "Время выбора маршрута для сообщения")
+    return metric.count, metric.sum
+
+
+def routing_report(before):
+    count, total = routing_snapshot()
+    routed = count - before[0]
+    if not routed:
+        return []
+    return [f"    маршрутизация текста     {routed:>7} сообщений  в среднем {(total - before[1]) / routed * 1e6:.1f} мкс"]
+
+
+def join_snapshot(app):
+    return {decision: counter.value for decision, counter in app.join_requests.decided.items()}
+
+
+def join_report(app, before):
+    decided = {
+        decision: counter.value - before[decision] for decision, counter in app.join_requests.decided.items()
+    }
+    if not any(decided.values()):
+        return []
+    batches = app.join_requests.batch_sizes
+    return ["    заявки на вступление     " + ", ".join(f"{decision} {count}" for decision, count in decided.items())
+            + f"; пакетов {batches.count}, в среднем {batches.sum / batches.count:.0f} заявок"]
+
+
+def db_report(before):
+    lines = []
+    for metric in registry.all():
+        if metric.name != "db_query_seconds":
+            continue
+        count, buckets = before.get(metric.labels, (0, [0] * len(metric.bucket_counts)))
+        delta = [after - was for after, was in zip(metric.bucket_counts, buckets)]
+        calls = metric.count - count
+        if not calls:
+            continue
+        bounds = {}
+        for q in (0.5, 0.99):
+            seen = 0
+            bounds[q] = float("inf")
+            for bound, bucket_count in zip(metric.buckets, delta):
+                seen += bucket_count
+                if seen >= q * calls:
+                    bounds[q] = bound
+                    break
+        operation = dict(metric.labels)["operation"]
+        lines.append(f"    db {operation:<26} {calls:>7} вызовов  p50 <= {bounds[0.5] * 1000:g} мс  "
+                     f"p99 <= {bounds[0.99] * 1000:g} мс")
+    return lines
+
+
+async def run(name, chat_registry):
+    app = build(chat_registry)
+    before = db_snapshot()
+    routing_before = routing_snapshot()
+    join_before = join_snapshot(app)
+    elapsed = 0.0
+    for phase in SCENARIOS[name](app):
+        elapsed += await app.replay(phase)
+    # Отложенная запись и исходящие входят в замер
+    started = asyncio.get_running_loop().time()
+    await app.join_requests.stop()
+    await write_behind.flush()
+    # Остановка очереди исходящих дожидается отправки всех поставленных сообщений
+    await app.outbound.stop(drain_timeout=60)
+    elapsed += asyncio.get_running_loop().time() - started
+
+    updates = len(app.latencies)
+    api_calls = sum(app.api_calls.values())
+    print(f"{name:<14} {updates:>7} {updates / elapsed:>10.0f} {percentile(app.latencies, 0.5) * 1000:>9.1f} "
+          f"{percentile(app.latencies, 0.99) * 1000:>9.1f} {api_calls:>9} {app.errors:>7}")
+    for line in routing_report(routing_before) + join_report(app, join_before) + db_report(before):
+        print(line)
+
+
+async def main(names):
+    create_tables()
+    chat_registry = ChatRegistry()
+    await chat_registry.add_pair(INVITING_CHAT_ID, INVITED_CHAT_ID)
+    # Участники приглашающего чата, уже известные базе (для сценария join_wave)
+    await upsert_users([(user_id, f"user{user_id}", f"User{user_id}", INVITING_CHAT_ID)
+                        for user_id in range(JOIN_FIRST_USER, JOIN_FIRST_USER + USERS // 2)])
+
+    print(f"Задержка API {API_LATENCY * 1000:g} мс, обработчиков {WORKERS}; БД: {os.environ['DB_PATH']}")
+    print(f"{'сценарий':<14} {'обновл.':>7} {'обновл./с':>10} {'p50, мс':>9} {'p99, мс':>9} {'API':>9} "
+          f"{'ошибок':>7}")
+    for name in names:
+        await run(name, chat_registry)
+    storage.close()
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(SCENARIOS)
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Неизвестные сценарии: {', '.join(unknown)}; доступны: {', '.join(SCENARIOS)}")
+    asyncio.run(main(selected))
@@ -0,0 +1,79 @@
+"""
+Стоимость записи в лог для вызывающего кода (цикла событий).
+
+"До" — прежняя настройка: setup_logger() вызывался при импорте трех
+модулей, и на логгер вешалось три пары RotatingFileHandler + StreamHandler,
+каждая запись форматировалась и писалась синхронно три раза.
+"После" — setup_logger() с QueueHandler: в вызывающем потоке запись только
+кладется в очередь, форматирование и ввод-вывод выполняет QueueListener.
+
+Вывод в консоль направляется в /dev/null, файл — во временный каталог.
+
+Запуск: python benchmarks/bench_logging.py
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RECORDS = int(os.getenv("BENCH_RECORDS", "50000"))
+TEMP_DIR = tempfile.mkdtemp(prefix="bench_logging_")
+
+
+def legacy_logger(devnull):
+    logger = logging.getLogger("bench_legacy")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for _ in range(3):
+        file_handler = RotatingFileHandler(os.path.join(TEMP_DIR, "legacy.log"), maxBytes=1024 * 1024 * 5,
+                                           backupCount=3, encoding='utf-8')
+        file_handler.setLevel(logging.DEBUG)
+        console_handler = logging.StreamHandler(devnull)
+        console_handler.setLevel(logging.INFO)
+        for handler in (file_handler, console_handler):
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
+    return logger
+
+
+def measure(logger, level):
+    started = time.perf_counter()
+    for i in range(RECORDS):
+        logger.log(level, f"Пользователь {i} отправил сообщение в чат -100{i % 7}")
+    return (time.perf_counter() - started) / RECORDS * 1e6
+
+
+def main():
+    devnull = open(os.devnull, "w")
+    legacy = legacy_logger(devnull)
+
+    os.environ["LOG_FILE"] = os.path.join(TEMP_DIR, "app.log")
+    os.environ["LOG_DEBUG_SAMPLE_RATE"] = "0.1"
+    stderr, sys.stderr = sys.stderr, devnull
+    try:
+        import logger as project_logger
+        current = project_logger.setup_logger()
+
+        print(f"Стоимость записи для вызывающего кода, мкс ({RECORDS} записей)")
+        print(f"{'уровень':>10} {'до':>8} {'после':>8}")
+        for level in (logging.INFO, logging.DEBUG):
+            before = measure(legacy, level)
+            after = measure(current, level)
+            print(f"{logging.getLevelName(level):>10} {before:>8.1f} {after:>8.1f}")
+
+        started = time.perf_counter()
+        project_logger.shutdown_logger()
+        drained = time.perf_counter() - started
+    finally:
+        sys.stderr = stderr
+    print(f"Дозапись очереди фоновым потоком при остановке: {drained:.2f} с")
+    print("DEBUG «после» — с выборкой LOG_DEBUG_SAMPLE_RATE=0.1")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Стоимость одной проверки AntiSpamMiddleware.check_spam при росте числа
+отслеживаемых пользователей.
+
+"До" — прежняя реализация: список на пользователя, list.pop(0) и
+арифметика datetime.now(); словарь пользователей никогда не очищался.
+"После" — SlidingWindowLimiter (deque с maxlen, монотонные часы,
+вытеснение простаивающих пользователей).
+
+Запуск: python benchmarks/bench_rate_limiter.py
+"""
+import os
+import random
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.middleware import SlidingWindowLimiter  # noqa: E402
+
+CHECKS = int(os.getenv("BENCH_CHECKS", "200000"))
+
+
+class LegacyLimiter:
+    def __init__(self):
+        self.user_requests = {}
+
+    def check_spam(self, user_id):
+        current_time = datetime.now()
+        if user_id in self.user_requests:
+            request_times = self.user_requests[user_id]
+            while request_times and (current_time - request_times[0]).total_seconds() > 30:
+                request_times.pop(0)
+            if len(request_times) >= 5:
+                return True
+            request_times.append(current_time)
+        else:
+            self.user_requests[user_id] = [current_time]
+        return False
+
+
+def measure(check, keys):
+    started = time.perf_counter()
+    for key in keys:
+        check(key)
+    return (time.perf_counter() - started) / len(keys) * 1e9
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def main():
+    print("Стоимость проверки, нс (рост с числом пользователей у всех трех колонок — промахи кеша процессора;")
+    print("колонка «dict+deque» — голый доступ к словарю, нижняя граница для любой реализации)")
+    print(f"{'пользователей':>14} {'dict+deque':>11} {'до':>8} {'после':>8} {'после простоя: до / после':>28}")
+    for users in (1_000, 10_000, 100_000):
+        keys = [random.randrange(users) for _ in range(CHECKS)]
+        legacy = LegacyLimiter()
+        limiter = SlidingWindowLimiter(limit=5, window=30.0)
+        clock = FakeClock()
+        idle_limiter = SlidingWindowLimiter(limit=5, window=30.0, clock=clock)
+        baseline = {}
+        # Прогрев: все пользователи уже отслеживаются
+        for user_id in range(users):
+            legacy.check_spam(user_id)
+            limiter.hit(user_id)
+            idle_limiter.hit(user_id)
+            baseline[user_id] = deque(maxlen=5)
+
+        floor = measure(lambda key: baseline[key].append(0.0), keys)
+        before = measure(legacy.check_spam, keys)
+        after = measure(limiter.hit, keys)
+
+        # Через минуту простоя активна лишь тысяча пользователей
+        clock.now += 60
+        for i in range(users):
+            legacy.check_spam(i % 1_000)
+            idle_limiter.hit(i % 1_000)
+        tracked = f"{len(legacy.user_requests)} / {len(idle_limiter)}"
+        print(f"{users:>14} {floor:>11.0f} {before:>8.0f} {after:>8.0f} {tracked:>28}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Очистка messages и user_activity на таблицах в миллион строк.
+
+Сравнивает прежние запросы с подзапросом NOT IN (полный просмотр таблицы
+на каждую вставку) с RetentionEngine, который идет по индексам и трогает
+только пользователей с новой активностью.
+
+Запуск: python benchmarks/bench_retention.py
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import RetentionEngine, ACTIVITY_RETENTION_PER_USER, _create_tables  # noqa: E402
+
+ROWS = int(os.getenv("BENCH_ROWS", "1000000"))
+USERS = int(os.getenv("BENCH_USERS", "10000"))
+TOUCHED_USERS = int(os.getenv("BENCH_TOUCHED_USERS", "200"))
+# Сколько из них между проходами превышают лимит активности на пользователя
+HEAVY_USERS = int(os.getenv("BENCH_HEAVY_USERS", "20"))
+
+
+def populate(connection):
+    _create_tables(connection)
+    base = 1_700_000_000
+    connection.executemany(
+        "INSERT INTO messages (user_id, message_text, sent_at) VALUES (?, ?, datetime(?, 'unixepoch'))",
+        ((i % USERS, "x" * 40, base + i) for i in range(ROWS))
+    )
+    connection.executemany(
+        "INSERT INTO user_activity (user_id, request_time) VALUES (?, datetime(?, 'unixepoch'))",
+        ((i % USERS, base + i) for i in range(ROWS))
+    )
+    connection.commit()
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:<62} {(time.perf_counter() - started) * 1000:>10.1f} мс  ({result})")
+
+
+def legacy_trim(connection, user_id):
+    # Прежний запрос выполнялся после каждой вставки сообщения
+    deleted = connection.execute("""
+        DELETE FROM messages
+        WHERE id NOT IN (SELECT id FROM messages ORDER BY sent_at DESC LIMIT 100)
+    """).rowcount
+    deleted += connection.execute("""
+        DELETE FROM user_activity
+        WHERE id NOT IN (
+            SELECT id FROM user_activity WHERE user_id = ? ORDER BY request_time DESC LIMIT 50
+        )
+    """, (user_id,)).rowcount
+    connection.rollback()
+    return f"удалено бы {deleted}"
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    connection = sqlite3.connect(os.path.join(directory, "retention.sqlite"))
+    print(f"Заполнение: {ROWS} сообщений и {ROWS} записей активности, {USERS} пользователей")
+    populate(connection)
+
+    timed("до: NOT IN на одну вставку", lambda: legacy_trim(connection, 1))
+
+    engine = RetentionEngine(max_users_per_pass=USERS)
+    engine.mark_activity(range(USERS))
+    timed("после: первичная очистка всех пользователей", lambda: engine.apply(connection))
+    connection.commit()
+
+    # Устойчивый режим: немного новых строк между проходами очистки
+    last_time = 1_700_000_000 + ROWS
+    touched = random.sample(range(USERS), TOUCHED_USERS)
+    # Большинству — по одной новой записи, части — больше лимита, чтобы проход
+    # действительно обрезал user_activity, а не только проверял индексы
+    activity = [(user_id, 1) for user_id in touched[HEAVY_USERS:]]
+    activity += [(user_id, ACTIVITY_RETENTION_PER_USER + 10) for user_id in touched[:HEAVY_USERS]]
+    rows = [(user_id, last_time + n * TOUCHED_USERS + i)
+            for i, (user_id, count) in enumerate(activity) for n in range(count)]
+    connection.executemany(
+        "INSERT INTO user_activity (user_id, request_time) VALUES (?, datetime(?, 'unixepoch'))", rows
+    )
+    connection.executemany(
+        "INSERT INTO messages (user_id, message_text, sent_at) VALUES (?, ?, datetime(?, 'unixepoch'))",
+        ((user_id, "y", last_time + i) for i, user_id in enumerate(touched))
+    )
+    engine.mark_activity(touched)
+    timed(f"после: периодический проход ({TOUCHED_USERS} польз., {HEAVY_USERS} сверх лимита)",
+          lambda: engine.apply(connection))
+    connection.commit()
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
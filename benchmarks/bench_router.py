@@ -0,0 +1,107 @@
+"""
+Стоимость выбора обработчика для текстового сообщения.
+
+Сравнивает прежнюю схему — отдельный обработчик Pyrogram с цепочкой
+фильтров на каждую команду и фразу, проверяемые диспетчером по очереди, —
+с TextRouter, который выбирает маршрут за один проход. Обработчики
+пустые, поэтому замеряется только диспетчеризация в группе 0.
+
+Запуск: python benchmarks/bench_router.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_router.log"))
+os.environ.setdefault("PERSIST_CONVERSATIONS", "0")
+
+from pyrogram import filters  # noqa: E402
+
+from benchmarks.fake_client import FakeClient  # noqa: E402
+from handlers import ConversationStore  # noqa: E402
+from handlers.conversations import AWAITING_EVENT_TEXT  # noqa: E402
+from handlers.handlers import DepartureHandler, DEPARTURE_PATTERN  # noqa: E402
+from handlers.router import GROUP, PRIVATE, TextRouter  # noqa: E402
+
+UPDATES = int(os.getenv("BENCH_UPDATES", "20000"))
+GROUP_ID = -1001
+
+
+async def noop(client, message, *args):
+    pass
+
+
+def legacy(app: FakeClient, conversations: ConversationStore):
+    # Регистрация в том виде, в каком она была до маршрутизатора
+    async def departure(client, message):
+        DepartureHandler.parse_departure(message.text)
+
+    async def awaiting_event_text(flt, client, update):
+        return update.from_user is not None and conversations.is_in(update.from_user.id, AWAITING_EVENT_TEXT)
+
+    app.on_message(filters.command("start"))(noop)
+    app.on_message(filters.private & filters.create(awaiting_event_text) & filters.text)(noop)
+    app.on_message(filters.command("search") & filters.group)(noop)
+    app.on_message(filters.text & filters.group)(departure)
+    app.on_message(filters.command("back") & filters.private)(noop)
+    app.on_message(filters.command("set_chats"))(noop)
+
+
+def routed(app: FakeClient, conversations: ConversationStore):
+    router = TextRouter(instrumented=False)
+    router.command("start", noop)
+    router.fallback(lambda message: conversations.is_in(message.from_user.id, AWAITING_EVENT_TEXT), noop, PRIVATE)
+    router.command("search", noop, GROUP)
+    router.phrase(DEPARTURE_PATTERN.pattern, noop, GROUP)
+    router.command("back", noop, PRIVATE)
+    router.command("set_chats", noop)
+    app.on_message(filters.text)(router.dispatch)
+
+
+def workload(app: FakeClient):
+    updates = []
+    for i in range(UPDATES):
+        kind = i % 20
+        if kind < 14:
+            updates.append(app.message(GROUP_ID, 1000 + i % 500, f"Обычное сообщение в группе номер {i}"))
+        elif kind < 16:
+            updates.append(app.message(GROUP_ID, 1000 + i % 500, "длинное сообщение " * 40))
+        elif kind == 16:
+            updates.append(app.message(GROUP_ID, 1000 + i % 500, "Я  уехал на 3 дня"))
+        elif kind == 17:
+            updates.append(app.message(GROUP_ID, 1000 + i % 500, "/search правила"))
+        elif kind == 18:
+            updates.append(app.message(1000 + i % 500, 1000 + i % 500, "/start"))
+        else:
+            updates.append(app.message(1000 + i % 500, 1000 + i % 500, "привет боту"))
+    return updates
+
+
+async def measure(label, register):
+    app = FakeClient(api_latency=0, workers=1)
+    conversations = ConversationStore(persistent=False)
+    await conversations.set(1000, AWAITING_EVENT_TEXT, {"chat_id": GROUP_ID})
+    register(app, conversations)
+    updates = workload(app)
+    started = time.perf_counter()
+    for update, handler_type in updates:
+        await app.dispatch(update, handler_type)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed / len(updates) * 1e6:>8.1f} мкс на сообщение")
+    app.executor.shutdown()
+
+
+async def main():
+    print(f"{UPDATES} сообщений: 70% переписка в группе, 10% длинные, 5% «я уехал», 5% /search, 5% /start, "
+          f"5% текст в личке")
+    await measure("до: фильтры на каждый обработчик", legacy)
+    await measure("после: TextRouter", routed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Пропускная способность MessageHandler до и после перехода на пул соединений.
+
+"До" — прежняя схема: на каждое сообщение новое соединение, commit и close
+прямо в цикле событий. "После" — настоящий MessageHandler: сообщения
+попадают в очередь отложенной записи и сбрасываются пакетами через пул
+соединений (время финального сброса входит в замер).
+
+Запуск: DB_PATH=/tmp/bench.sqlite python -m benchmarks.bench_storage
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.sqlite"))
+os.environ.setdefault("ARCHIVE_DIR", os.path.join(tempfile.mkdtemp(), "archive"))
+
+from config import create_tables, storage, write_behind  # noqa: E402
+from config.config import _create_tables  # noqa: E402
+from config.storage import DB_PATH  # noqa: E402
+
+MESSAGES = int(os.getenv("BENCH_MESSAGES", "2000"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "50"))
+
+
+class CaptureApp:
+    """Минимальная замена Client: запоминает зарегистрированные обработчики."""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def _capture(self, *args, **kwargs):
+        def decorator(func):
+            self.callbacks.append(func)
+            return func
+        return decorator
+
+    on_message = on_callback_query = on_chat_join_request = _capture
+
+
+def legacy_add_message(user_id, message_text):
+    connection = sqlite3.connect(DB_PATH)
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO messages (user_id, message_text) VALUES (?, ?)", (user_id, message_text))
+    cursor.execute("""
+        DELETE FROM messages
+        WHERE id NOT IN (SELECT id FROM messages ORDER BY sent_at DESC LIMIT 100)
+    """)
+    connection.commit()
+    connection.close()
+
+
+async def legacy_handle_message(client, message):
+    legacy_add_message(message.from_user.id, message.text)
+
+
+def make_message(i):
+    return SimpleNamespace(from_user=SimpleNamespace(id=i % 500), chat=SimpleNamespace(id=-1001), text=f"сообщение {i}")
+
+
+async def drive(callback, label, finish=None):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i):
+        async with semaphore:
+            await callback(None, make_message(i))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(MESSAGES)))
+    if finish is not None:
+        await finish()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {MESSAGES / elapsed:>10.0f} сообщений/с")
+
+
+async def main():
+    # Прежняя схема работала в режиме журнала по умолчанию, без WAL
+    with sqlite3.connect(DB_PATH) as connection:
+        _create_tables(connection)
+    await drive(legacy_handle_message, "до (connect на вызов)")
+
+    create_tables()
+
+    from handlers import MessageHandler
+    app = CaptureApp()
+    MessageHandler(app)
+    await drive(app.callbacks[0], "после (пакетная запись)", finish=write_behind.flush)
+    storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
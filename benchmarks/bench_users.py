@@ -0,0 +1,105 @@
+"""
+Пакетный API пользователей: запись, выборка по ID и чтение участников чата.
+
+"До" — прежние операции: add_user по одному пользователю (INSERT OR IGNORE
+в своей транзакции) и запрос на каждого пользователя при выборке по ID.
+"После" — upsert_users одной транзакцией, get_users_by_ids и потоковое
+iterate_users_in_chat по первичному ключу chat_members. Для чтения чата
+дополнительно сравнивается пиковая память с прежним чтением всего списка.
+
+Запуск: python benchmarks/bench_users.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench_users.sqlite"))
+os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_users.log"))
+
+from config import create_tables, get_users_by_ids, iterate_users_in_chat, storage, upsert_users  # noqa: E402
+
+USERS = int(os.getenv("BENCH_USERS", "200000"))
+ROW_BY_ROW = int(os.getenv("BENCH_ROW_BY_ROW", "5000"))
+LOOKUPS = int(os.getenv("BENCH_LOOKUPS", "1000"))
+CHUNK = 500
+CHAT_ID = -1001
+
+
+def _legacy_add_user(connection, user_id, username, full_name, chat_id):
+    connection.execute("""
+        INSERT OR IGNORE INTO users (user_id, username, full_name, chat_id)
+        VALUES (?, ?, ?, ?)
+    """, (user_id, username, full_name, chat_id))
+
+
+def _legacy_get_user(connection, user_id):
+    return connection.execute("SELECT username, full_name FROM users WHERE user_id = ?", (user_id,)).fetchone()
+
+
+def _legacy_get_chat_mentions(connection, chat_id):
+    return connection.execute("""
+        SELECT u.user_id, u.username, u.full_name
+        FROM chat_members m JOIN users u ON u.user_id = m.user_id
+        WHERE m.chat_id = ?
+    """, (chat_id,)).fetchall()
+
+
+def report(label, elapsed, count, unit):
+    print(f"{label:<48} {elapsed * 1000:>9.1f} мс  ({count / elapsed:,.0f} {unit}/с)")
+
+
+async def main():
+    create_tables()
+    rows = [(user_id, f"user{user_id}", f"Пользователь {user_id}", CHAT_ID) for user_id in range(1, USERS + 1)]
+
+    started = time.perf_counter()
+    for row in rows[:ROW_BY_ROW]:
+        await storage.run(_legacy_add_user, *row)
+    report(f"до: add_user по одному ({ROW_BY_ROW})", time.perf_counter() - started, ROW_BY_ROW, "польз.")
+
+    started = time.perf_counter()
+    for start in range(0, USERS, CHUNK):
+        await upsert_users(rows[start:start + CHUNK])
+    report(f"после: upsert_users пакетами по {CHUNK} ({USERS})", time.perf_counter() - started, USERS, "польз.")
+
+    ids = random.Random(1).sample(range(1, USERS + 1), LOOKUPS)
+    started = time.perf_counter()
+    for user_id in ids:
+        await storage.run(_legacy_get_user, user_id)
+    report(f"до: запрос на каждого ({LOOKUPS} ID)", time.perf_counter() - started, LOOKUPS, "польз.")
+
+    started = time.perf_counter()
+    found = await get_users_by_ids(ids)
+    report(f"после: get_users_by_ids ({len(found)} ID)", time.perf_counter() - started, LOOKUPS, "польз.")
+
+    async def materialize():
+        return len(await storage.run(_legacy_get_chat_mentions, CHAT_ID))
+
+    async def stream():
+        count = 0
+        async for _ in iterate_users_in_chat(CHAT_ID):
+            count += 1
+        return count
+
+    for label, read in (("список целиком (get_chat_mentions)", materialize), ("поток iterate_users_in_chat", stream)):
+        # Время и память замеряются разными проходами: tracemalloc замедляет выполнение
+        started = time.perf_counter()
+        count = await read()
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        await read()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report(f"{label}, пик {peak / 2 ** 20:.1f} МБ", elapsed, count, "строк")
+    storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
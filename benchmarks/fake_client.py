@@ -0,0 +1,183 @@
+"""
+Локальная замена Pyrogram Client для нагрузочных замеров без Telegram.
+
+FakeClient принимает настоящие обработчики (декораторы on_message,
+on_callback_query, on_chat_join_request, on_chat_member_updated) и
+диспетчеризует обновления так же, как pyrogram.Dispatcher: группы по
+возрастанию, в группе — первый обработчик с подходящими фильтрами,
+StopPropagation прерывает обработку. Обновления — настоящие объекты
+pyrogram.types, поэтому фильтры и методы вроде reply_text работают без
+изменений. Вызовы API имитируются задержкой и подсчитываются.
+"""
+import asyncio
+import itertools
+import os
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+import pyrogram
+from pyrogram import handlers as pyrogram_handlers
+from pyrogram.enums import ChatMemberStatus, ChatType
+from pyrogram.errors import UserNotParticipant
+from pyrogram.types import CallbackQuery, Chat, ChatJoinRequest, Message, User
+
+BOT_ID = 1
+BOT_USERNAME = "loadtest_bot"
+
+
+class FakeClient:
+    def __init__(self, api_latency: float = 0.0, workers: int = min(32, (os.cpu_count() or 1) + 4)):
+        self.api_latency = api_latency
+        self.workers = workers
+        self.me = User(id=BOT_ID, is_bot=True, first_name="Bot", username=BOT_USERNAME)
+        self.groups = OrderedDict()
+        self.api_calls = Counter()
+        # Составы чатов для get_chat_member: chat_id -> множество ID; в остальных чатах состоят все
+        self.chat_members = {}
+        self.latencies = []
+        self.errors = 0
+        self.loop = None
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="fake_client")
+        self._ids = itertools.count(1)
+
+    # --- регистрация обработчиков, как в pyrogram.methods.decorators ---
+
+    def add_handler(self, handler, group: int = 0):
+        if group not in self.groups:
+            self.groups[group] = []
+            self.groups = OrderedDict(sorted(self.groups.items()))
+        self.groups[group].append(handler)
+        return handler, group
+
+    def _decorator(self, handler_cls, filters=None, group: int = 0):
+        def decorator(func):
+            self.add_handler(handler_cls(func, filters), group)
+            return func
+        return decorator
+
+    def on_message(self, filters=None, group: int = 0):
+        return self._decorator(pyrogram_handlers.MessageHandler, filters, group)
+
+    def on_callback_query(self, filters=None, group: int = 0):
+        return self._decorator(pyrogram_handlers.CallbackQueryHandler, filters, group)
+
+    def on_chat_join_request(self, filters=None, group: int = 0):
+        return self._decorator(pyrogram_handlers.ChatJoinRequestHandler, filters, group)
+
+    def on_chat_member_updated(self, filters=None, group: int = 0):
+        return self._decorator(pyrogram_handlers.ChatMemberUpdatedHandler, filters, group)
+
+    # --- диспетчеризация, как в pyrogram.Dispatcher.handler_worker ---
+
+    async def dispatch(self, update, handler_type):
+        try:
+            for group in self.groups.values():
+                for handler in group:
+                    if not isinstance(handler, handler_type) or not await handler.check(self, update):
+                        continue
+                    try:
+                        await handler.callback(self, update)
+                    except pyrogram.StopPropagation:
+                        raise
+                    except pyrogram.ContinuePropagation:
+                        continue
+                    except Exception:
+                        self.errors += 1
+                    break
+        except pyrogram.StopPropagation:
+            pass
+
+    async def replay(self, updates):
+        """
+        Прогоняет поток обновлений через workers параллельных обработчиков.
+
+        Args:
+            updates: Список пар (update, handler_type).
+
+        Returns:
+            float: Общее время, с.
+        """
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        for packet in updates:
+            queue.put_nowait((time.perf_counter(), packet))
+
+        async def worker():
+            while not queue.empty():
+                enqueued_at, (update, handler_type) = queue.get_nowait()
+                await self.dispatch(update, handler_type)
+                self.latencies.append(time.perf_counter() - enqueued_at)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        return time.perf_counter() - started
+
+    # --- имитация Telegram API ---
+
+    async def _call(self, method: str):
+        self.api_calls[method] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call("send_message")
+        return SimpleNamespace(id=next(self._ids), chat=SimpleNamespace(id=chat_id), text=text)
+
+    async def answer_callback_query(self, callback_query_id, text=None, show_alert=None, **kwargs):
+        await self._call("answer_callback_query")
+        return True
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._call("get_chat_member")
+        members = self.chat_members.get(chat_id)
+        if members is not None and user_id not in members and user_id not in ("me", BOT_ID):
+            raise UserNotParticipant()
+        status = ChatMemberStatus.ADMINISTRATOR if user_id in ("me", BOT_ID) else ChatMemberStatus.MEMBER
+        return SimpleNamespace(status=status, is_member=True)
+
+    async def create_chat_invite_link(self, chat_id, name=None, expire_date=None, member_limit=None, **kwargs):
+        await self._call("create_chat_invite_link")
+        return SimpleNamespace(invite_link=f"https://t.me/+fake{next(self._ids)}")
+
+    async def approve_chat_join_request(self, chat_id, user_id):
+        await self._call("approve_chat_join_request")
+        return True
+
+    async def decline_chat_join_request(self, chat_id, user_id):
+        await self._call("decline_chat_join_request")
+        return True
+
+    async def restrict_chat_member(self, chat_id, user_id, permissions, until_date=None):
+        await self._call("restrict_chat_member")
+        return True
+
+    # --- построение обновлений ---
+
+    def user(self, user_id: int) -> User:
+        return User(id=user_id, is_bot=False, first_name=f"User{user_id}", username=f"user{user_id}")
+
+    def message(self, chat_id: int, user_id: int, text: str):
+        chat_type = ChatType.PRIVATE if chat_id > 0 else ChatType.SUPERGROUP
+        message = Message(
+            id=next(self._ids), chat=Chat(id=chat_id, type=chat_type), from_user=self.user(user_id),
+            text=text, date=datetime.now(), client=self
+        )
+        return message, pyrogram_handlers.MessageHandler
+
+    def callback(self, chat_id: int, user_id: int, data: str):
+        origin, _ = self.message(chat_id, BOT_ID, "Приветствую тебя, Шарьинец!")
+        callback_query = CallbackQuery(
+            id=str(next(self._ids)), from_user=self.user(user_id), chat_instance=str(chat_id),
+            message=origin, data=data, client=self
+        )
+        return callback_query, pyrogram_handlers.CallbackQueryHandler
+
+    def join_request(self, chat_id: int, user_id: int):
+        request = ChatJoinRequest(
+            chat=Chat(id=chat_id, type=ChatType.SUPERGROUP), from_user=self.user(user_id),
+            date=datetime.now(), client=self
+        )
+        return request, pyrogram_handlers.ChatJoinRequestHandler
@@ -0,0 +1,4 @@
+from .hashing import ConsistentHashRing
+from .routing import routing_key, pack, unpack
+from .ingress import Ingress
+from .worker import run_worker
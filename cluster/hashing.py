@@ -0,0 +1,60 @@
+import bisect
+import hashlib
+
+# Виртуальных точек на узел: чем больше, тем равномернее распределение
+REPLICAS = 512
+
+
+def _hash(value) -> int:
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class ConsistentHashRing:
+    """
+    Кольцо согласованного хеширования.
+
+    Каждый узел представлен replicas точками на кольце; ключ относится к
+    первому узлу по часовой стрелке от своего хеша. При добавлении или
+    удалении узла меняется владелец только у ~1/N ключей.
+    """
+
+    def __init__(self, nodes=(), replicas: int = REPLICAS):
+        self.replicas = replicas
+        self._points = []  # отсортированные хеши точек
+        self._owners = {}  # хеш точки -> узел
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(set(self._owners.values()))
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node):
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.pop(bisect.bisect_left(self._points, point))
+
+    def node_for(self, key):
+        """
+        Возвращает узел, отвечающий за ключ.
+
+        Args:
+            key: Ключ маршрутизации (например, ID пользователя).
+
+        Returns:
+            Узел или None, если кольцо пусто.
+        """
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key))
+        if index == len(self._points):
+            index = 0
+        return self._owners[self._points[index]]
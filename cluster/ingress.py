@@ -0,0 +1,96 @@
+import asyncio
+import multiprocessing
+import os
+from contextlib import contextmanager
+
+from pyrogram import Client
+from pyrogram.handlers import RawUpdateHandler
+
+from cluster.hashing import ConsistentHashRing
+from cluster.routing import pack, routing_key
+from cluster.worker import run_worker
+from logger import setup_logger
+from metrics import registry
+
+logger = setup_logger()
+
+STOP_TIMEOUT = 30.0
+
+
+@contextmanager
+def _environment(overrides: dict):
+    # Дочерний процесс (spawn) получает копию окружения на момент запуска
+    saved = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class Ingress:
+    """
+    Принимающий процесс: получает все обновления бота и раздает их
+    процессам-обработчикам.
+
+    Сырые обновления сериализуются в TL и отправляются в очередь процесса,
+    выбранного согласованным хешированием по ID пользователя (или чата).
+    Процессы-обработчики разбирают их и выполняют обычные обработчики бота;
+    ответы в Telegram они отправляют сами через свои сессии.
+    """
+
+    def __init__(self, app: Client, worker_count: int):
+        self.app = app
+        self.worker_count = worker_count
+        self.ring = ConsistentHashRing(range(worker_count))
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = []
+        self.processes = []
+        self.routed = [
+            registry.counter("cluster_updates_routed_total", "Передано обновлений обработчику",
+                             labels={"worker": str(index)})
+            for index in range(worker_count)
+        ]
+
+    def _worker_environment(self, index: int) -> dict:
+        # У каждого процесса свой файл лога и порт метрик
+        base, ext = os.path.splitext(os.getenv("LOG_FILE", "app.log"))
+        overrides = {"LOG_FILE": f"{base}.worker{index}{ext}"}
+        port = int(os.getenv("METRICS_PORT", "9464"))
+        if port:
+            overrides["METRICS_PORT"] = str(port + 1 + index)
+        return overrides
+
+    def start(self):
+        for index in range(self.worker_count):
+            queue = self._context.Queue()
+            process = self._context.Process(
+                target=run_worker, args=(index, self.worker_count, queue), name=f"bot-worker-{index}", daemon=False
+            )
+            with _environment(self._worker_environment(index)):
+                process.start()
+            self.queues.append(queue)
+            self.processes.append(process)
+        self.app.add_handler(RawUpdateHandler(self.on_raw_update))
+        logger.info(f"Запущено процессов-обработчиков: {self.worker_count}")
+
+    async def on_raw_update(self, client, update, users, chats):
+        index = self.ring.node_for(routing_key(update))
+        self.queues[index].put(pack(update, users, chats))
+        self.routed[index].inc()
+
+    async def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"Процесс {process.name} не остановился за {STOP_TIMEOUT} с, завершаем")
+                process.terminate()
+        self.processes.clear()
+        self.queues.clear()
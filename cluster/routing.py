@@ -0,0 +1,61 @@
+from io import BytesIO
+
+from pyrogram.raw.core import TLObject
+
+# Пути к ID в сырых обновлениях Telegram в порядке предпочтения: сначала
+# пользователь (антиспам, диалоги и кеш участников привязаны к нему), затем чат
+KEY_PATHS = (
+    ("user_id",),
+    ("message", "from_id", "user_id"),
+    ("message", "peer_id", "user_id"),
+    ("message", "peer_id", "channel_id"),
+    ("message", "peer_id", "chat_id"),
+    ("channel_id",),
+    ("chat_id",),
+    ("peer", "user_id"),
+    ("peer", "channel_id"),
+    ("peer", "chat_id"),
+)
+
+
+def routing_key(update) -> int:
+    """
+    Ключ маршрутизации сырого обновления.
+
+    Все обновления одного пользователя получают один ключ и попадают в один
+    процесс-обработчик, поэтому его состояние (лимиты антиспама, диалог с
+    ботом) остается локальным для процесса.
+
+    Args:
+        update: Сырое обновление (pyrogram.raw.base.Update).
+
+    Returns:
+        int: ID пользователя или чата; 0, если ни одного нет.
+    """
+    for path in KEY_PATHS:
+        value = update
+        for attribute in path:
+            value = getattr(value, attribute, None)
+            if value is None:
+                break
+        if isinstance(value, int):
+            return value
+    return 0
+
+
+def pack(update, users: dict, chats: dict) -> tuple:
+    """
+    Сериализует обновление в байты TL для передачи другому процессу.
+    """
+    return update.write(), [user.write() for user in users.values()], [chat.write() for chat in chats.values()]
+
+
+def unpack(packet: tuple) -> tuple:
+    """
+    Восстанавливает (update, users, chats) в том виде, в каком их передает
+    Pyrogram в очередь диспетчера.
+    """
+    update, users, chats = packet
+    users = [TLObject.read(BytesIO(data)) for data in users]
+    chats = [TLObject.read(BytesIO(data)) for data in chats]
+    return TLObject.read(BytesIO(update)), {user.id: user for user in users}, {chat.id: chat for chat in chats}
@@ -0,0 +1,75 @@
+import asyncio
+import os
+
+from cluster.routing import unpack
+
+# Как часто ведущий процесс проверяет таймеры, поставленные другими процессами
+CLUSTER_TIMER_POLL = float(os.getenv("CLUSTER_TIMER_POLL", "5"))
+
+
+def run_worker(index: int, count: int, updates):
+    """
+    Точка входа процесса-обработчика.
+
+    Args:
+        index (int): Номер процесса (0 — ведущий).
+        count (int): Всего процессов-обработчиков.
+        updates: multiprocessing.Queue с пакетами обновлений от ingress.
+    """
+    asyncio.run(_serve(index, count, updates))
+
+
+async def _serve(index: int, count: int, updates):
+    # Импорт здесь: модули бота настраиваются уже в дочернем процессе
+    from bot import (create_client, register_handlers, load_state, start_services, stop_client_services,
+                     stop_services, logger)
+    from handlers import outbound, timer_service
+    from logger import shutdown_logger
+
+    await load_state()
+    # Обновления приходят от ingress, сам клиент их не получает
+    app = create_client(f"Inviting_Event_bot_worker{index}", no_updates=True)
+    register_handlers(app)
+    outbound.set_share(1 / count)
+    timer_service.idle_check = CLUSTER_TIMER_POLL
+
+    tasks = []
+    handler_tasks = []
+    loop = asyncio.get_running_loop()
+    try:
+        async with app:
+            # При no_updates диспетчер не запускает своих обработчиков — запускаем их сами
+            dispatcher = app.dispatcher
+            for _ in range(app.workers):
+                dispatcher.locks_list.append(asyncio.Lock())
+                handler_tasks.append(asyncio.create_task(dispatcher.handler_worker(dispatcher.locks_list[-1])))
+
+            try:
+                tasks = await start_services(app, leader=index == 0, watch_registry=True)
+                logger.info(f"Обработчик {index + 1}/{count} запущен")
+
+                while True:
+                    packet = await loop.run_in_executor(None, updates.get)
+                    if packet is None:
+                        break
+                    try:
+                        update, users, chats = unpack(packet)
+                        # Как в Client.handle_updates: сохраняем access_hash пользователей и чатов
+                        # в сессию, иначе ответы им потребуют лишнего resolve_peer
+                        await app.fetch_peers(list(users.values()))
+                        await app.fetch_peers(list(chats.values()))
+                        dispatcher.updates_queue.put_nowait((update, users, chats))
+                    except Exception as e:
+                        logger.error(f"Не удалось обработать обновление: {e}")
+
+                for _ in handler_tasks:
+                    dispatcher.updates_queue.put_nowait(None)
+                await asyncio.gather(*handler_tasks)
+            finally:
+                await stop_client_services(tasks)
+    except Exception as e:
+        logger.critical(f"Ошибка в обработчике {index}: {e}", exc_info=True)
+    finally:
+        await stop_services()
+        logger.info(f"Обработчик {index + 1}/{count} остановлен")
+        shutdown_logger()
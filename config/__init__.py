@@ -1,2 +1,11 @@
-from .config import (connect_db, create_tables, load_config, save_chat, add_user, log_user_activity,
-                     cleanup_inactive_users, get_users_in_chat, update_chat_data, add_existing_users_to_db, get_chat_members)
\ No newline at end of file
+from .storage import storage, Storage, ConnectionPool
+from .config import (create_tables, migrate_schema, add_existing_users_to_db, write_batch, RetentionEngine, retention,
+                     apply_retention, upsert_users, import_progress, remove_chat_member, adjust_sync_checkpoint,
+                     sync_chat_members, sync_chats, schedule_sync, stop_sync_tasks, user_full_name, get_user_chat_ids,
+                     get_users_by_ids, iterate_users_in_chat)
+from .migrations import MIGRATIONS, SCHEMA_VERSION, apply_migrations
+from .archive import MessageArchive, message_archive
+from .analytics import get_chat_stats, iterate_activity_csv, export_activity_csv, trim_rollups
+from .write_behind import write_behind, WriteBehindQueue
+from .registry import ChatRegistry, ChatPair, chat_registry
+from .state import StateBackend, MemoryStateBackend, SQLiteStateBackend, create_state_backend, state_backend
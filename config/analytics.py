@@ -0,0 +1,222 @@
+import csv
+import io
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from config.storage import storage
+from logger import setup_logger
+
+logger = setup_logger()
+
+HOUR = 3600
+DAY = 24 * HOUR
+# Сколько дней хранить почасовые и подневные сводки
+ACTIVITY_HOURLY_DAYS = int(os.getenv("ACTIVITY_HOURLY_DAYS", "14"))
+ACTIVITY_DAILY_DAYS = int(os.getenv("ACTIVITY_DAILY_DAYS", "400"))
+STATS_WINDOW_DAYS = 7
+STATS_TOP_USERS = 5
+EXPORT_PAGE_SIZE = 5000
+
+# Детализация выгрузки: таблица сводки, столбец периода, длина периода и его формат
+GRANULARITIES = {
+    "hourly": ("activity_hourly", "hour", HOUR, "%Y-%m-%d %H:00"),
+    "daily": ("activity_daily", "day", DAY, "%Y-%m-%d"),
+}
+CSV_HEADER = ("chat_id", "period", "user_id", "requests")
+
+# Разобранные часы: отметки времени одного часа разбираются один раз
+_hours = {}
+
+
+def hour_of(request_time: str) -> int:
+    """
+    Номер часа от начала эпохи для отметки в формате CURRENT_TIMESTAMP (UTC).
+    """
+    key = request_time[:13]
+    hour = _hours.get(key)
+    if hour is None:
+        if len(_hours) > 1024:
+            _hours.clear()
+        moment = datetime.strptime(key, "%Y-%m-%d %H").replace(tzinfo=timezone.utc)
+        hour = _hours[key] = int(moment.timestamp()) // HOUR
+    return hour
+
+
+def format_period(period: int, granularity: str) -> str:
+    _, _, length, period_format = GRANULARITIES[granularity]
+    return datetime.fromtimestamp(period * length, timezone.utc).strftime(period_format)
+
+
+# Обновление сводок по записям активности (в транзакции записи этих строк)
+def rollup_activity(connection, activity):
+    """
+    Прибавляет записи активности к почасовым и подневным сводкам.
+
+    Записи сначала агрегируются в памяти, поэтому на пакет приходится по
+    одной строке UPSERT на (чат, час, пользователь) и (чат, день,
+    пользователь). Итоги дня по чату обновляют триггеры activity_daily.
+
+    Args:
+        connection: Соединение с базой.
+        activity: Строки (user_id, request_time, chat_id); строки без чата не учитываются.
+
+    Returns:
+        int: Сколько почасовых строк затронуто.
+    """
+    hourly = Counter()
+    for user_id, request_time, chat_id in activity:
+        if chat_id is not None:
+            hourly[(chat_id, hour_of(request_time), user_id)] += 1
+    if not hourly:
+        return 0
+    daily = Counter()
+    for (chat_id, hour, user_id), requests in hourly.items():
+        daily[(chat_id, hour // 24, user_id)] += requests
+
+    connection.executemany("""
+        INSERT INTO activity_hourly (chat_id, hour, user_id, requests)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (chat_id, hour, user_id) DO UPDATE SET requests = requests + excluded.requests
+    """, [(*key, requests) for key, requests in hourly.items()])
+    connection.executemany("""
+        INSERT INTO activity_daily (chat_id, day, user_id, requests)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (chat_id, day, user_id) DO UPDATE SET requests = requests + excluded.requests
+    """, [(*key, requests) for key, requests in daily.items()])
+    return len(hourly)
+
+
+# Удаление устаревших сводок (по индексам на час и день)
+def _trim_rollups(connection, now, hourly_days, daily_days):
+    hour = int(now) // HOUR - hourly_days * 24
+    day = int(now) // DAY - daily_days
+    deleted = connection.execute("DELETE FROM activity_hourly WHERE hour < ?", (hour,)).rowcount
+    deleted += connection.execute("DELETE FROM activity_daily WHERE day < ?", (day,)).rowcount
+    connection.execute("DELETE FROM activity_chat_daily WHERE day < ?", (day,))
+    return deleted
+
+
+async def trim_rollups(now: float = None, hourly_days: int = ACTIVITY_HOURLY_DAYS,
+                       daily_days: int = ACTIVITY_DAILY_DAYS) -> int:
+    return await storage.run(_trim_rollups, now or time.time(), hourly_days, daily_days)
+
+# Статистика чата по готовым сводкам
+def _get_chat_stats(connection, chat_id, day, days, top):
+    daily = connection.execute("""
+        SELECT day, requests, users FROM activity_chat_daily
+        WHERE chat_id = ? AND day > ? AND day <= ?
+        ORDER BY day
+    """, (chat_id, day - days, day)).fetchall()
+    leaders = connection.execute("""
+        SELECT user_id, requests FROM activity_daily
+        WHERE chat_id = ? AND day = ?
+        ORDER BY requests DESC
+        LIMIT ?
+    """, (chat_id, day, top)).fetchall()
+    return daily, leaders
+
+
+async def get_chat_stats(chat_id: int, now: float = None, days: int = STATS_WINDOW_DAYS,
+                         top: int = STATS_TOP_USERS) -> dict:
+    """
+    Статистика активности чата.
+
+    Читаются только итоги чата за days дней и top строк подневной сводки
+    за сегодня, поэтому время ответа не зависит от объема активности.
+
+    Args:
+        chat_id (int): ID чата.
+        now (float): Момент отсчета (по умолчанию текущее время).
+        days (int): Длина окна в днях, включая сегодняшний (UTC).
+        top (int): Сколько самых активных пользователей дня вернуть.
+
+    Returns:
+        dict: today_requests, today_users — за сегодня; window_requests,
+            average_users — за окно; top — [(user_id, requests)] за сегодня.
+    """
+    day = int(now or time.time()) // DAY
+    daily, leaders = await storage.run(_get_chat_stats, chat_id, day, days, top)
+    today = daily[-1] if daily and daily[-1][0] == day else (day, 0, 0)
+    return {
+        "today_requests": today[1],
+        "today_users": today[2],
+        "window_requests": sum(requests for _, requests, _ in daily),
+        "average_users": sum(users for _, _, users in daily) / days,
+        "top": leaders,
+    }
+
+# Страница сводки для выгрузки (по первичному ключу, после заданной строки)
+def _get_rollup_page(connection, granularity, chat_id, since, after, limit):
+    table, column, _, _ = GRANULARITIES[granularity]
+    if chat_id is None:
+        return connection.execute(f"""
+            SELECT chat_id, {column}, user_id, requests FROM {table}
+            WHERE (chat_id, {column}, user_id) > (?, ?, ?) AND {column} >= ?
+            ORDER BY chat_id, {column}, user_id
+            LIMIT ?
+        """, (*after, since, limit)).fetchall()
+    return connection.execute(f"""
+        SELECT chat_id, {column}, user_id, requests FROM {table}
+        WHERE chat_id = ? AND ({column}, user_id) > (?, ?) AND {column} >= ?
+        ORDER BY {column}, user_id
+        LIMIT ?
+    """, (chat_id, *after[1:], since, limit)).fetchall()
+
+
+async def iterate_activity_csv(chat_id: int = None, granularity: str = "daily", since: float = 0,
+                               page_size: int = EXPORT_PAGE_SIZE):
+    """
+    Потоково выгружает сводку активности в CSV.
+
+    Сводка читается страницами по первичному ключу; между страницами
+    соединение не удерживается, в памяти — только текущая страница.
+
+    Args:
+        chat_id (int): ID чата или None — все чаты.
+        granularity (str): "hourly" или "daily".
+        since (float): Начало выгрузки (unix-время).
+        page_size (int): Сколько строк читать за один запрос.
+
+    Yields:
+        str: Фрагменты CSV: заголовок, затем по фрагменту на страницу.
+    """
+    _, _, length, _ = GRANULARITIES[granularity]
+    since = int(since) // length
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue()
+
+    after = (float("-inf"), float("-inf"), float("-inf"))
+    labels = {}  # период -> подпись; периодов намного меньше, чем строк
+    while True:
+        page = await storage.run(_get_rollup_page, granularity, chat_id, since, after, page_size)
+        buffer.seek(0)
+        buffer.truncate()
+        for row_chat_id, period, user_id, requests in page:
+            label = labels.get(period)
+            if label is None:
+                label = labels[period] = format_period(period, granularity)
+            writer.writerow((row_chat_id, label, user_id, requests))
+        if page:
+            yield buffer.getvalue()
+        if len(page) < page_size:
+            return
+        after = page[-1][:3]
+
+
+async def export_activity_csv(path: str, chat_id: int = None, granularity: str = "daily",
+                              since: float = 0) -> int:
+    """
+    Записывает выгрузку iterate_activity_csv в файл.
+
+    Returns:
+        int: Размер файла в байтах.
+    """
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        async for chunk in iterate_activity_csv(chat_id, granularity, since):
+            file.write(chunk)
+    logger.info(f"Выгрузка активности ({granularity}) записана в {path}")
+    return os.path.getsize(path)
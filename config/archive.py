@@ -0,0 +1,341 @@
+import asyncio
+import json
+import os
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from config.storage import Storage
+from logger import setup_logger
+
+logger = setup_logger()
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# Период одного файла архива: day, week или month
+ARCHIVE_ROLLOVER = os.getenv("ARCHIVE_ROLLOVER", "month")
+# Сообщения старше ARCHIVE_HOT_DAYS сжимаются в сегменты
+ARCHIVE_HOT_DAYS = float(os.getenv("ARCHIVE_HOT_DAYS", "7"))
+# Сколько файлов хранить (0 — все)
+ARCHIVE_KEEP_FILES = int(os.getenv("ARCHIVE_KEEP_FILES", "0"))
+SEGMENT_SIZE = 256
+# Сколько сообщений сжимать за один проход, чтобы не держать долгую транзакцию
+COMPACT_BATCH = 20_000
+# Сколько файлов держать открытыми; поиск идет по всем периодам, поэтому лимит
+# стоит задавать не меньше числа хранимых файлов
+MAX_OPEN_FILES = int(os.getenv("ARCHIVE_MAX_OPEN_FILES", "12"))
+MAX_CACHED_SEGMENTS = 64
+SEARCH_LIMIT = 10
+
+PERIOD_FORMATS = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m"}
+
+
+def period_of(timestamp: float, rollover: str = ARCHIVE_ROLLOVER) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(PERIOD_FORMATS[rollover])
+
+
+def chat_token(chat_id: int) -> str:
+    # Токен чата в индексе FTS: «-100123» -> «cm100123»
+    return "c" + str(chat_id).replace("-", "m")
+
+
+def fts_query(chat_id: int, query: str) -> str:
+    """
+    Строит запрос FTS5: все слова запроса в заданном чате.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 из пользовательского
+    ввода не интерпретируются.
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+    return " AND ".join([f"chat:{chat_token(chat_id)}"] + words)
+
+
+# Схема файла архива; auto_vacuum задается до создания таблиц
+def _create_archive_tables(connection):
+    connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS archived_messages (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER,
+            sent_at REAL NOT NULL,
+            text TEXT,
+            segment_id INTEGER
+        )
+    """)
+    connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_archived_messages_chat_time ON archived_messages (chat_id, sent_at)
+    """)
+    connection.execute("""
+        CREATE INDEX IF NOT EXISTS idx_archived_messages_hot ON archived_messages (sent_at) WHERE segment_id IS NULL
+    """)
+    # Сжатые сегменты: текст до SEGMENT_SIZE сообщений одного чата в zlib(JSON)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS archive_segments (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            payload BLOB NOT NULL
+        )
+    """)
+    # Индекс без копии текста: сам текст хранится в archived_messages или в сегменте
+    connection.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS archived_messages_fts USING fts5(
+            text, chat, content='', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    connection.execute("""
+        CREATE TRIGGER IF NOT EXISTS archived_messages_ai AFTER INSERT ON archived_messages BEGIN
+            INSERT INTO archived_messages_fts (rowid, text, chat)
+            VALUES (new.id, new.text, 'c' || replace(new.chat_id, '-', 'm'));
+        END
+    """)
+    connection.execute("CREATE TABLE IF NOT EXISTS archive_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+
+# Пакетная запись сообщений; индекс FTS пополняет триггер
+def _insert_archived(connection, rows):
+    connection.executemany("""
+        INSERT INTO archived_messages (chat_id, user_id, sent_at, text) VALUES (?, ?, ?, ?)
+    """, rows)
+
+# Сжатие сообщений старше cutoff в сегменты по чатам
+def _compact_archive(connection, cutoff, segment_size, batch):
+    connection.execute("BEGIN IMMEDIATE")
+    rows = connection.execute("""
+        SELECT id, chat_id, text FROM archived_messages
+        WHERE segment_id IS NULL AND sent_at < ?
+        ORDER BY chat_id, id
+        LIMIT ?
+    """, (cutoff, batch)).fetchall()
+
+    chunks = []
+    for id_, chat_id, text in rows:
+        if not chunks or chunks[-1][0] != chat_id or len(chunks[-1][1]) >= segment_size:
+            chunks.append((chat_id, {}))
+        chunks[-1][1][id_] = text
+
+    for chat_id, texts in chunks:
+        payload = zlib.compress(json.dumps(texts, ensure_ascii=False).encode(), 6)
+        segment_id = connection.execute("""
+            INSERT INTO archive_segments (chat_id, first_id, last_id, payload) VALUES (?, ?, ?, ?)
+        """, (chat_id, min(texts), max(texts), payload)).lastrowid
+        connection.executemany(
+            "UPDATE archived_messages SET text = NULL, segment_id = ? WHERE id = ?",
+            ((segment_id, id_) for id_ in texts)
+        )
+    return len(rows)
+
+
+# Освобождение страниц после сжатия; запечатанный файл переписывается целиком
+def _vacuum_archive(connection, full=False):
+    connection.execute("VACUUM" if full else "PRAGMA incremental_vacuum")
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _get_meta(connection, key):
+    row = connection.execute("SELECT value FROM archive_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(connection, key, value):
+    connection.execute("""
+        INSERT INTO archive_meta (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    """, (key, value))
+
+# Поиск: новые сообщения первыми (по rowid индекса FTS)
+def _search_archive(connection, query, limit):
+    ids = [row[0] for row in connection.execute("""
+        SELECT rowid FROM archived_messages_fts WHERE archived_messages_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+    """, (query, limit))]
+    if not ids:
+        return []
+    placeholders = ",".join("?" * len(ids))
+    rows = connection.execute(f"""
+        SELECT id, chat_id, user_id, sent_at, text, segment_id FROM archived_messages
+        WHERE id IN ({placeholders}) ORDER BY id DESC
+    """, ids).fetchall()
+    segment_ids = {row[5] for row in rows if row[4] is None and row[5] is not None}
+    segments = {}
+    if segment_ids:
+        placeholders = ",".join("?" * len(segment_ids))
+        segments = dict(connection.execute(
+            f"SELECT id, payload FROM archive_segments WHERE id IN ({placeholders})", list(segment_ids)
+        ).fetchall())
+    return rows, segments
+
+
+class MessageArchive:
+    """
+    Архив сообщений с полнотекстовым поиском.
+
+    Сообщения пишутся пакетами в файл текущего периода (ARCHIVE_ROLLOVER),
+    старые периоды лежат в отдельных файлах и при переполнении просто
+    удаляются целиком. Внутри файла сообщения индексированы по
+    (chat_id, sent_at), а индекс FTS5 без копии текста содержит токен чата,
+    поэтому поиск пересекает списки только в нужном чате. Сообщения старше
+    hot_days сжимаются zlib-сегментами по SEGMENT_SIZE сообщений чата;
+    при выдаче результатов сегменты распаковываются и кешируются.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, rollover: str = ARCHIVE_ROLLOVER,
+                 hot_days: float = ARCHIVE_HOT_DAYS, keep_files: int = ARCHIVE_KEEP_FILES,
+                 segment_size: int = SEGMENT_SIZE, max_open_files: int = MAX_OPEN_FILES):
+        if rollover not in PERIOD_FORMATS:
+            raise ValueError(f"Неизвестный период архива: {rollover}")
+        self.directory = directory
+        self.rollover = rollover
+        self.hot_days = hot_days
+        self.keep_files = keep_files
+        self.segment_size = segment_size
+        self.max_open_files = max_open_files
+        self._files = OrderedDict()  # period -> Storage
+        self._created = set()  # периоды, схема которых уже создана этим процессом
+        self._sealed = set()  # запечатанные периоды: maintain их больше не открывает
+        self._segments = OrderedDict()  # (period, segment_id) -> {id: text}
+
+    def path_for(self, period: str) -> str:
+        return os.path.join(self.directory, f"messages-{period}.sqlite")
+
+    def periods(self):
+        """
+        Периоды, для которых есть файлы, от новых к старым.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith("messages-") and name.endswith(".sqlite")]
+        return sorted((name[len("messages-"):-len(".sqlite")] for name in names), reverse=True)
+
+    async def _open(self, period: str) -> Storage:
+        storage = self._files.get(period)
+        if storage is not None:
+            self._files.move_to_end(period)
+            return storage
+        os.makedirs(self.directory, exist_ok=True)
+        storage = Storage(self.path_for(period), pool_size=2)
+        if period not in self._created:
+            # Схема создается в пуле потоков и один раз на файл, а не при каждом открытии
+            await storage.run(_create_archive_tables)
+            self._created.add(period)
+        opened = self._files.get(period)
+        if opened is not None:
+            # Файл успел открыть другой вызов, пока создавалась схема
+            await asyncio.to_thread(storage.close)
+            return opened
+        self._files[period] = storage
+        while len(self._files) > self.max_open_files:
+            _, evicted = self._files.popitem(last=False)
+            # close ждет завершения запросов к файлу, поэтому не в цикле событий
+            await asyncio.to_thread(evicted.close)
+        return storage
+
+    async def write(self, rows):
+        """
+        Записывает пакет сообщений.
+
+        Args:
+            rows: Кортежи (chat_id, user_id, sent_at, text), sent_at — unix time.
+        """
+        by_period = {}
+        for row in rows:
+            by_period.setdefault(period_of(row[2], self.rollover), []).append(row)
+        for period, period_rows in by_period.items():
+            await (await self._open(period)).run(_insert_archived, period_rows)
+
+    def _decode(self, period: str, segment_id: int, payload: bytes) -> dict:
+        key = (period, segment_id)
+        texts = self._segments.get(key)
+        if texts is None:
+            texts = {int(id_): text for id_, text in json.loads(zlib.decompress(payload)).items()}
+            self._segments[key] = texts
+            while len(self._segments) > MAX_CACHED_SEGMENTS:
+                self._segments.popitem(last=False)
+        else:
+            self._segments.move_to_end(key)
+        return texts
+
+    async def search(self, chat_id: int, query: str, limit: int = SEARCH_LIMIT) -> list:
+        """
+        Ищет сообщения чата, содержащие все слова запроса.
+
+        Args:
+            chat_id (int): ID чата.
+            query (str): Слова для поиска.
+            limit (int): Максимум результатов.
+
+        Returns:
+            list: Словари с полями chat_id, user_id, sent_at, text — от новых к старым.
+        """
+        if not query.split():
+            return []
+        match = fts_query(chat_id, query)
+        results = []
+        for period in self.periods():
+            found = await (await self._open(period)).run(_search_archive, match, limit - len(results))
+            if not found:
+                continue
+            rows, segments = found
+            for id_, row_chat_id, user_id, sent_at, text, segment_id in rows:
+                if text is None and segment_id is not None:
+                    text = self._decode(period, segment_id, segments[segment_id]).get(id_)
+                results.append({"chat_id": row_chat_id, "user_id": user_id, "sent_at": sent_at, "text": text})
+            if len(results) >= limit:
+                break
+        return results
+
+    async def maintain(self, now: float = None) -> int:
+        """
+        Сжимает остывшие сообщения и удаляет лишние файлы архива.
+
+        Файлы прошедших периодов сжимаются полностью и помечаются
+        запечатанными, в текущем сжимаются сообщения старше hot_days.
+        Запечатанные файлы при следующих проходах не открываются.
+
+        Returns:
+            int: Сколько сообщений сжато.
+        """
+        now = time.time() if now is None else now
+        current = period_of(now, self.rollover)
+        periods = self.periods()
+        compacted = 0
+        for period in periods:
+            if period in self._sealed:
+                continue
+            storage = await self._open(period)
+            if period != current and await storage.run(_get_meta, "sealed"):
+                self._sealed.add(period)
+                continue
+            cutoff = now - self.hot_days * 86400 if period == current else float("inf")
+            count = await storage.run(_compact_archive, cutoff, self.segment_size, COMPACT_BATCH)
+            compacted += count
+            if count:
+                await storage.run(_vacuum_archive)
+            elif period != current:
+                await storage.run(_set_meta, "sealed", "1")
+                await storage.run(_vacuum_archive, True)
+                self._sealed.add(period)
+
+        if self.keep_files and len(periods) > self.keep_files:
+            for period in periods[self.keep_files:]:
+                storage = self._files.pop(period, None)
+                if storage is not None:
+                    await asyncio.to_thread(storage.close)
+                self._created.discard(period)
+                self._sealed.discard(period)
+                for suffix in ("", "-wal", "-shm"):
+                    path = self.path_for(period) + suffix
+                    if os.path.exists(path):
+                        os.remove(path)
+                logger.info(f"Удален файл архива {self.path_for(period)}")
+        return compacted
+
+    def close(self):
+        for storage in self._files.values():
+            storage.close()
+        self._files.clear()
+
+
+message_archive = MessageArchive()
@@ -1,202 +1,427 @@
-import sqlite3
+import asyncio
+import os
+import threading
+import time
+
+from pyrogram.enums import ChatMemberStatus
+
 from logger import setup_logger
+from config.analytics import rollup_activity
+from config.migrations import apply_migrations
+from config.storage import storage
 
 logger = setup_logger()
 
-# Подключение к базе данных
-def connect_db():
-    try:
-        connection = sqlite3.connect("identifier.sqlite")
-        if connection is None:
-            raise Exception("Не удалось подключиться к базе данных")
-        return connection
-    except Exception as e:
-        logger.error(f"Ошибка подключения к базе данных: {e}")
-        return None
+# Создание и обновление схемы базы данных (см. config/migrations.py)
+def _create_tables(connection):
+    return apply_migrations(connection)
+
 
-# Создание необходимых таблиц
 def create_tables():
-    connection = connect_db()
-    cursor = connection.cursor()
-
-    # Таблица для хранения ID чатов
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_type TEXT NOT NULL,
-            chat_id INTEGER NOT NULL UNIQUE
-        )
-    """)
-
-    # Таблица для хранения пользователей
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL UNIQUE,
-            username TEXT,
-            full_name TEXT,
-            joined_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            chat_id INTEGER,
-            FOREIGN KEY(chat_id) REFERENCES chats(chat_id) ON DELETE CASCADE
-        )
-    """)
-
-    # Таблица для хранения сообщений
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            message_text TEXT,
-            sent_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Таблица для отслеживания активности пользователей
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_activity (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            request_time DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    connection.commit()
-    connection.close()
-
-# Загрузка конфигурации
-def load_config():
-    connection = connect_db()
-    cursor = connection.cursor()
-    cursor.execute("SELECT chat_type, chat_id FROM chats")
-    chats = {row[0]: row[1] for row in cursor.fetchall()}
-    connection.close()
-    return chats
-
-# Сохранение ID чата
-def save_chat(chat_type, chat_id):
-    connection = connect_db()
-    cursor = connection.cursor()
-    cursor.execute("""
-        INSERT OR REPLACE INTO chats (chat_type, chat_id) VALUES (?, ?)
-    """, (chat_type, chat_id))
-    connection.commit()
-    connection.close()
-
-# Добавление пользователя в базу данных
-def add_user(user_id, username, full_name, chat_id):
-    connection = connect_db()
-    cursor = connection.cursor()
-    cursor.execute("""
-        INSERT OR IGNORE INTO users (user_id, username, full_name, chat_id)
-        VALUES (?, ?, ?, ?)
-    """, (user_id, username, full_name, chat_id))
-    connection.commit()
-    connection.close()
-
-# Добавление сообщения в базу данных
-def add_message(user_id, message_text):
-    connection = connect_db()
-    cursor = connection.cursor()
-    cursor.execute("""
-        INSERT INTO messages (user_id, message_text)
-        VALUES (?, ?)
-    """, (user_id, message_text))
-    cursor.execute("""
-        DELETE FROM messages
-        WHERE id NOT IN (
-            SELECT id FROM messages
-            ORDER BY sent_at DESC
-            LIMIT 100
-        )
-    """)
-    connection.commit()
-    connection.close()
-
-# Логирование активности пользователя
-def log_user_activity(user_id):
-    connection = connect_db()
-    cursor = connection.cursor()
-    cursor.execute("""
-        INSERT INTO user_activity (user_id)
-        VALUES (?)
-    """, (user_id,))
-    cursor.execute("""
-        DELETE FROM user_activity
-        WHERE id NOT IN (
-            SELECT id
-            FROM user_activity
-            WHERE user_id = ?
-            ORDER BY request_time DESC
-            LIMIT 50
-        )
-    """, (user_id,))
-    connection.commit()
-    connection.close()
-
-# Очистка неактивных пользователей
-def cleanup_inactive_users():
-    connection = connect_db()
-    cursor = connection.cursor()
-    cursor.execute("""
-        DELETE FROM users 
-        WHERE chat_id NOT IN (SELECT chat_id FROM chats)
-    """)
-    connection.commit()
-    connection.close()
-
-# Получение всех пользователей из чата
-def get_users_in_chat(chat_id):
-    connection = connect_db()
-    cursor = connection.cursor()
-    cursor.execute("SELECT username, full_name FROM users WHERE chat_id = ?", (chat_id,))
-    users = cursor.fetchall()
-    connection.close()
+    return storage.run_sync(_create_tables)
+
+
+async def migrate_schema():
+    return await storage.run(_create_tables)
+
+# Размер пакета при импорте участников чата
+IMPORT_CHUNK_SIZE = 500
+
+# Максимальный возраст контрольной точки синхронизации (секунды)
+SYNC_MAX_AGE = float(os.getenv("SYNC_MAX_AGE", str(7 * 24 * 3600)))
+
+# Политика хранения: последние сообщения (всего) и последние запросы каждого пользователя
+MESSAGES_RETENTION = 100
+ACTIVITY_RETENTION_PER_USER = 50
+
+
+class RetentionEngine:
+    """
+    Инкрементальная очистка таблиц messages и user_activity.
+
+    Вставки не удаляют ничего сами: они лишь отмечают пользователей, у которых
+    появилась новая активность. Очистка выполняется периодически и затрагивает
+    только отмеченных пользователей. Оба запроса идут по индексам
+    (sent_at и (user_id, request_time)), поэтому стоимость очистки зависит от
+    числа удаляемых строк, а не от размера таблицы.
+    """
+
+    def __init__(self, messages_limit: int = MESSAGES_RETENTION,
+                 activity_limit: int = ACTIVITY_RETENTION_PER_USER, max_users_per_pass: int = 1000):
+        self.messages_limit = messages_limit
+        self.activity_limit = activity_limit
+        self.max_users_per_pass = max_users_per_pass
+        self._dirty_users = set()
+        self._lock = threading.Lock()
+
+    def mark_activity(self, user_ids):
+        with self._lock:
+            self._dirty_users.update(user_ids)
+
+    def _take_dirty_users(self):
+        with self._lock:
+            if len(self._dirty_users) <= self.max_users_per_pass:
+                users, self._dirty_users = self._dirty_users, set()
+            else:
+                users = {self._dirty_users.pop() for _ in range(self.max_users_per_pass)}
+        return users
+
+    def apply(self, connection):
+        """
+        Удаляет устаревшие строки.
+
+        Args:
+            connection: Соединение с базой данных.
+
+        Returns:
+            tuple: Количество удаленных сообщений и записей активности.
+        """
+        deleted_messages = connection.execute("""
+            DELETE FROM messages
+            WHERE id IN (
+                SELECT id FROM messages
+                ORDER BY sent_at DESC, id DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (self.messages_limit,)).rowcount
+
+        deleted_activity = 0
+        for user_id in self._take_dirty_users():
+            deleted_activity += connection.execute("""
+                DELETE FROM user_activity
+                WHERE id IN (
+                    SELECT id FROM user_activity
+                    WHERE user_id = ?
+                    ORDER BY request_time DESC, id DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (user_id, self.activity_limit)).rowcount
+        return deleted_messages, deleted_activity
+
+
+retention = RetentionEngine()
+
+
+async def apply_retention():
+    return await storage.run(retention.apply)
+
+# Пакетная запись сообщений и активности (используется очередью отложенной записи)
+def _write_batch(connection, messages, activity):
+    if messages:
+        connection.executemany("""
+            INSERT INTO messages (user_id, message_text, sent_at)
+            VALUES (?, ?, ?)
+        """, messages)
+    if activity:
+        connection.executemany("""
+            INSERT INTO user_activity (user_id, request_time, chat_id)
+            VALUES (?, ?, ?)
+        """, activity)
+        # Сводки обновляются в той же транзакции, что и сырые записи
+        rollup_activity(connection, activity)
+        retention.mark_activity({row[0] for row in activity})
+
+
+async def write_batch(messages, activity):
+    await storage.run(_write_batch, messages, activity)
+
+# Размер страницы при потоковом чтении участников чата
+USERS_PAGE_SIZE = 1000
+
+
+def _get_chat_users_page(connection, chat_id, after_user_id, limit):
+    # Продолжение по ключу: диапазон первичного ключа (chat_id, user_id) без OFFSET
+    return connection.execute("""
+        SELECT m.user_id, u.username, u.full_name
+        FROM chat_members m JOIN users u ON u.user_id = m.user_id
+        WHERE m.chat_id = ? AND m.user_id > ?
+        ORDER BY m.user_id
+        LIMIT ?
+    """, (chat_id, after_user_id, limit)).fetchall()
+
+
+async def iterate_users_in_chat(chat_id, page_size=USERS_PAGE_SIZE):
+    """
+    Потоково перебирает участников чата страницами по page_size строк.
+
+    Соединение не удерживается между страницами, поэтому перебор большого
+    чата не блокирует пул и не держит в памяти весь список.
+
+    Args:
+        chat_id (int): ID чата.
+        page_size (int): Сколько строк читать за один запрос.
+
+    Yields:
+        tuple: (user_id, username, full_name) в порядке user_id.
+    """
+    after_user_id = float("-inf")
+    while True:
+        page = await storage.run(_get_chat_users_page, chat_id, after_user_id, page_size)
+        for row in page:
+            yield row
+        if len(page) < page_size:
+            return
+        after_user_id = page[-1][0]
+
+# Пользователи по списку ID
+# Не больше стольких параметров в одном запросе (лимит SQLite — 999 в старых версиях)
+LOOKUP_CHUNK_SIZE = 500
+
+
+def _get_users_by_ids(connection, user_ids):
+    users = {}
+    for start in range(0, len(user_ids), LOOKUP_CHUNK_SIZE):
+        chunk = user_ids[start:start + LOOKUP_CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        for user_id, username, full_name in connection.execute(
+            f"SELECT user_id, username, full_name FROM users WHERE user_id IN ({placeholders})", chunk
+        ):
+            users[user_id] = (username, full_name)
     return users
 
-# Обновление данных о чатах
-def update_chat_data(inviting_chat_id, invited_chat_id):
-    connection = connect_db()
-    cursor = connection.cursor()
-    cursor.execute("""
-        UPDATE users
-        SET chat_id = ?
-        WHERE chat_id = ?
-    """, (inviting_chat_id, invited_chat_id))
-    connection.commit()
-    connection.close()
+
+async def get_users_by_ids(user_ids):
+    """
+    Возвращает данные пользователей одним обращением к базе.
+
+    Args:
+        user_ids: ID пользователей.
+
+    Returns:
+        dict: user_id -> (username, full_name); отсутствующих в базе нет в словаре.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    return await storage.run(_get_users_by_ids, user_ids)
+
+# Чаты, в которых состоит пользователь
+def _get_user_chat_ids(connection, user_id):
+    return [row[0] for row in connection.execute("SELECT chat_id FROM chat_members WHERE user_id = ?", (user_id,))]
+
+
+async def get_user_chat_ids(user_id):
+    return await storage.run(_get_user_chat_ids, user_id)
+
+# Пакетное добавление/обновление пользователей и их членства в чатах
+def _upsert_users(connection, rows):
+    # Строка пользователя не переписывается, если имя не изменилось
+    connection.executemany("""
+        INSERT INTO users (user_id, username, full_name, chat_id)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            username = excluded.username,
+            full_name = excluded.full_name
+        WHERE users.username IS NOT excluded.username OR users.full_name IS NOT excluded.full_name
+    """, rows)
+    now = time.time()
+    connection.executemany("""
+        INSERT OR IGNORE INTO chat_members (chat_id, user_id, joined_at) VALUES (?, ?, ?)
+    """, ((chat_id, user_id, now) for user_id, _, _, chat_id in rows if chat_id is not None))
+
+
+async def upsert_users(rows):
+    """
+    Добавляет или обновляет пользователей одной транзакцией.
+
+    Args:
+        rows: Кортежи (user_id, username, full_name, chat_id); chat_id=None —
+            только данные пользователя, без членства в чате.
+    """
+    await storage.run(_upsert_users, rows)
+
+
+def user_full_name(user):
+    return user.first_name + (f" {user.last_name}" if user.last_name else "")
+
+# Удаление пользователя из чата (вышел или исключен)
+def _remove_chat_member(connection, user_id, chat_id):
+    connection.execute("DELETE FROM chat_members WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+
+
+async def remove_chat_member(user_id, chat_id):
+    await storage.run(_remove_chat_member, user_id, chat_id)
+
+
+def _sweep_chat_members(connection, chat_id, seen_ids):
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS seen_members (user_id INTEGER PRIMARY KEY)")
+    connection.execute("DELETE FROM seen_members")
+    connection.executemany("INSERT OR IGNORE INTO seen_members (user_id) VALUES (?)", ((i,) for i in seen_ids))
+    removed = connection.execute("""
+        DELETE FROM chat_members
+        WHERE chat_id = ? AND user_id NOT IN (SELECT user_id FROM seen_members)
+    """, (chat_id,)).rowcount
+    connection.execute("DELETE FROM seen_members")
+    return removed
+
+# Контрольные точки синхронизации участников
+def _get_sync_checkpoint(connection, chat_id):
+    return connection.execute(
+        "SELECT synced_at, member_count FROM sync_checkpoints WHERE chat_id = ?", (chat_id,)
+    ).fetchone()
+
+
+def _save_sync_checkpoint(connection, chat_id, member_count):
+    connection.execute("""
+        INSERT INTO sync_checkpoints (chat_id, synced_at, member_count) VALUES (?, ?, ?)
+        ON CONFLICT(chat_id) DO UPDATE SET
+            synced_at = excluded.synced_at,
+            member_count = excluded.member_count
+    """, (chat_id, time.time(), member_count))
+
+
+def _adjust_sync_checkpoint(connection, chat_id, delta):
+    connection.execute(
+        "UPDATE sync_checkpoints SET member_count = member_count + ? WHERE chat_id = ?", (delta, chat_id)
+    )
+
+
+async def adjust_sync_checkpoint(chat_id, delta):
+    await storage.run(_adjust_sync_checkpoint, chat_id, delta)
+
+# Прогресс импорта участников по чатам: {chat_id: {"imported": ..., "total": ..., "done": ...}}
+import_progress = {}
 
 # Добавление существующих пользователей из чата в базу данных
-async def add_existing_users_to_db(app, chat_id):
-    connection = connect_db()
+async def add_existing_users_to_db(app, chat_id, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Импортирует участников чата потоково, записывая их пакетами.
+
+    Args:
+        app (Client): Экземпляр Pyrogram клиента.
+        chat_id (int): ID чата.
+        chunk_size (int): Размер пакета (одна транзакция executemany).
+
+    Returns:
+        int: Количество импортированных пользователей.
+    """
+    progress = import_progress[chat_id] = {"imported": 0, "total": None, "done": False}
+    chunk = []
+    seen_ids = set()
+    walked = 0  # участники в проходе, включая ботов, — как в get_chat_members_count
+
+    try:
+        progress["total"] = await app.get_chat_members_count(chat_id)
+    except Exception as e:
+        logger.warning(f"Не удалось получить размер чата {chat_id}: {e}")
 
     try:
-        members = []
         async for member in app.get_chat_members(chat_id):
-            if member.user.is_bot or member.status == "kicked":
-                continue  # Пропускаем ботов и заблокированных пользователей
-
-            add_user(
-                user_id=member.user.id,
-                username=member.user.username,
-                full_name=member.user.first_name + (f" {member.user.last_name}" if member.user.last_name else ""),
-                chat_id=chat_id
-            )
-            members.append(member)
+            if member.status == ChatMemberStatus.BANNED:
+                continue  # Пропускаем заблокированных пользователей
+            walked += 1
+            if member.user.is_bot:
+                continue  # Ботов в базу не добавляем
 
-        connection.commit()
-        logger.info(f"Добавлено {len(members)} пользователей из чата {chat_id}.")
+            seen_ids.add(member.user.id)
+            chunk.append((member.user.id, member.user.username, user_full_name(member.user), chat_id))
+            if len(chunk) >= chunk_size:
+                await upsert_users(chunk)
+                progress["imported"] += len(chunk)
+                chunk = []
+                logger.info(f"Импорт чата {chat_id}: {progress['imported']} из {progress['total'] or '?'}")
+
+        if chunk:
+            await upsert_users(chunk)
+            progress["imported"] += len(chunk)
+
+        # Telegram усекает список участников больших групп: ушедших удаляем,
+        # только если проход вернул всех, иначе удалились бы и не попавшие в список
+        if walked == progress["total"]:
+            removed = await storage.run(_sweep_chat_members, chat_id, seen_ids)
+        else:
+            removed = 0
+            logger.warning(f"Чат {chat_id}: получено {walked} участников из {progress['total'] or '?'}, "
+                           f"ушедшие не удаляются")
+        if progress["total"] is not None:
+            await storage.run(_save_sync_checkpoint, chat_id, progress["total"])
+        logger.info(f"Добавлено {progress['imported']} пользователей из чата {chat_id}, удалено ушедших: {removed}.")
     except Exception as e:
         logger.error(f"Ошибка при добавлении существующих пользователей: {e}")
     finally:
-        connection.close()
+        progress["done"] = True
+    return progress["imported"]
 
-# Получение списка участников чата
-async def get_chat_members(app, chat_id):
-    members = []
-    try:
-        async for member in app.get_chat_members(chat_id):
-            if member.user and member.status != "left":
-                members.append(member)
-    except Exception as e:
-        logger.error(f"Ошибка при получении участников чата: {e}")
-    return members
\ No newline at end of file
+
+# Инкрементальная синхронизация участников
+async def sync_chat_members(app, chat_id, max_age=SYNC_MAX_AGE):
+    """
+    Синхронизирует участников чата, по возможности без полного прохода.
+
+    Пока бот работает, MembershipSyncHandler поддерживает базу и счетчик
+    участников в контрольной точке по событиям chat_member. При старте
+    достаточно сравнить счетчик с get_chat_members_count: если они совпадают
+    и контрольная точка не старше max_age, полный проход не нужен.
+
+    Args:
+        app (Client): Экземпляр Pyrogram клиента.
+        chat_id (int): ID чата.
+        max_age (float): Максимальный возраст контрольной точки в секундах.
+
+    Returns:
+        bool: True, если был выполнен полный проход.
+    """
+    checkpoint = await storage.run(_get_sync_checkpoint, chat_id)
+    if checkpoint is not None:
+        synced_at, member_count = checkpoint
+        if time.time() - synced_at < max_age:
+            try:
+                current_count = await app.get_chat_members_count(chat_id)
+            except Exception as e:
+                logger.warning(f"Не удалось получить размер чата {chat_id}: {e}")
+                current_count = None
+            if current_count == member_count:
+                logger.info(f"Чат {chat_id} синхронизирован, полный проход не требуется")
+                return False
+            logger.info(f"Чат {chat_id}: участников {current_count}, в контрольной точке {member_count}")
+
+    await add_existing_users_to_db(app, chat_id)
+    return True
+
+
+async def sync_chats(app, chat_ids):
+    """
+    Синхронизирует участников нескольких чатов параллельно.
+
+    Args:
+        app (Client): Экземпляр Pyrogram клиента.
+        chat_ids (list): ID чатов; пустые значения пропускаются.
+    """
+    chat_ids = [chat_id for chat_id in chat_ids if chat_id]
+    results = await asyncio.gather(*(sync_chat_members(app, chat_id) for chat_id in chat_ids), return_exceptions=True)
+    for chat_id, result in zip(chat_ids, results):
+        if isinstance(result, Exception):
+            logger.error(f"Ошибка синхронизации участников чата {chat_id}: {result}", exc_info=result)
+
+
+# Фоновые синхронизации, запущенные во время работы бота: {chat_id: Task}
+sync_tasks = {}
+
+# Запуск синхронизации чатов в фоне
+def schedule_sync(app, chat_ids):
+    """
+    Запускает синхронизацию участников в фоне, сохраняя ссылки на задачи.
+
+    Для чата, синхронизация которого еще идет, новая задача не создается.
+
+    Args:
+        app (Client): Экземпляр Pyrogram клиента.
+        chat_ids (list): ID чатов; пустые значения пропускаются.
+    """
+    for chat_id in chat_ids:
+        if not chat_id:
+            continue
+        task = sync_tasks.get(chat_id)
+        if task is None or task.done():
+            sync_tasks[chat_id] = asyncio.create_task(sync_chats(app, [chat_id]))
+
+# Остановка фоновых синхронизаций
+async def stop_sync_tasks():
+    """
+    Отменяет незавершенные фоновые синхронизации и дожидается их.
+    """
+    tasks = [task for task in sync_tasks.values() if not task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    sync_tasks.clear()
@@ -1,92 +1,256 @@
 import logging
-from datetime import datetime
+import re
+import time
+from collections import OrderedDict, deque
+
 from pyrogram import Client
+from pyrogram.enums import ChatType
+from pyrogram.types import CallbackQuery
+
+from metrics import registry
 
 logger = logging.getLogger('project_logger')
 
 
+# Лимиты по командам: ключ -> (количество запросов, окно в секундах)
+DEFAULT_LIMITS = {
+    "default": (5, 30.0),
+    "invite": (3, 60.0),
+    "event": (3, 60.0),
+}
+MAX_TRACKED_USERS = 100_000
+# Команда в начале текста: «/name» или «/name@bot»
+COMMAND_RE = re.compile(r"/([A-Za-z0-9_]+)(?:@([A-Za-z0-9_]+))?(?:\s|$)")
+# Сколько простаивающих ключей можно вытеснить за одну проверку
+EVICTIONS_PER_PASS = 64
+
+
+class SlidingWindowLimiter:
+    """
+    Ограничитель запросов со скользящим окном.
+
+    Для каждого ключа хранится deque последних limit разрешенных запросов
+    (maxlen отбрасывает старые записи за O(1)), время берется из
+    монотонных часов. Ключи лежат в OrderedDict в порядке последнего
+    обращения, поэтому простаивающие пользователи вытесняются с начала
+    словаря небольшими порциями; момент следующей очистки известен заранее,
+    и в обычной проверке она стоит одного сравнения.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = MAX_TRACKED_USERS, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        self._requests = OrderedDict()  # key -> deque[timestamp]
+        self._next_eviction = 0.0
+
+    def __len__(self):
+        return len(self._requests)
+
+    def hit(self, key) -> bool:
+        """
+        Регистрирует запрос.
+
+        Args:
+            key: Ключ (обычно ID пользователя).
+
+        Returns:
+            bool: True, если запрос разрешен, False — если лимит превышен.
+        """
+        now = self.clock()
+        if now >= self._next_eviction or len(self._requests) >= self.max_keys:
+            self._evict(now)
+
+        requests = self._requests.get(key)
+        if requests is None:
+            requests = self._requests[key] = deque(maxlen=self.limit)
+        else:
+            self._requests.move_to_end(key)
+            if len(requests) == self.limit and now - requests[0] < self.window:
+                return False
+        requests.append(now)
+        return True
+
+    def _evict(self, now: float):
+        # Вытесняем ограниченную порцию, чтобы ни одна проверка не стала долгой
+        for _ in range(EVICTIONS_PER_PASS):
+            if not self._requests:
+                self._next_eviction = now + self.window
+                return
+            key, requests = next(iter(self._requests.items()))
+            idle_since = requests[-1]
+            if len(self._requests) >= self.max_keys or now - idle_since >= self.window:
+                del self._requests[key]
+            else:
+                self._next_eviction = idle_since + self.window
+                return
+        self._next_eviction = now
+
 class AntiSpamMiddleware:
-    def __init__(self, app: Client):
+    def __init__(self, app: Client, limits: dict = None, max_tracked_users: int = MAX_TRACKED_USERS):
         self.app = app
-        self.user_requests = {}  # Словарь для отслеживания запросов пользователей
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        # Отдельный ограничитель для каждой команды с собственным лимитом
+        self.limiters = {
+            command: SlidingWindowLimiter(limit, window, max_tracked_users)
+            for command, (limit, window) in self.limits.items()
+        }
+        self.warnings = SlidingWindowLimiter(1, max(window for _, window in self.limits.values()), max_tracked_users)
+
+        self.updates_total = registry.counter("middleware_updates_total", "Обновлений прошло через middleware")
+        self.rejected_total = registry.counter("middleware_rejected_total", "Обновлений отклонено как спам")
 
-    async def check_spam(self, user_id: int) -> bool:
+    @staticmethod
+    def command_of(event, bot_username: str = None) -> str:
         """
-        Проверяет, является ли запрос спамом.
+        Определяет команду, к которой относится событие.
+
+        Middleware выполняется раньше filters.command и маршрутизатора
+        текста, поэтому message.command еще не заполнен: команда берется
+        из первого слова текста.
 
         Args:
-            user_id (int): ID пользователя.
+            event: Объект события (сообщение или callback).
+            bot_username (str): Имя бота; команды, адресованные другому боту, не учитываются.
 
         Returns:
-            bool: True, если это спам, иначе False.
+            str: Имя команды или "default".
+        """
+        data = getattr(event, "data", None)
+        if isinstance(data, str):
+            return data
+        text = getattr(event, "text", None)
+        if text and text.startswith("/"):
+            match = COMMAND_RE.match(text)
+            if match is not None:
+                name, mention = match.groups()
+                if mention is None or bot_username is None or mention.lower() == bot_username.lower():
+                    return name.lower()
+        return "default"
+
+    @staticmethod
+    def chat_id_of(event) -> int:
         """
-        current_time = datetime.now()
+        Определяет чат события (для callback — чат исходного сообщения).
 
-        if user_id in self.user_requests:
-            request_times = self.user_requests[user_id]
+        Args:
+            event: Объект события.
+
+        Returns:
+            int: ID чата или None.
+        """
+        chat = getattr(event, "chat", None)
+        if chat is None and getattr(event, "message", None) is not None:
+            chat = event.message.chat
+        return chat.id if chat is not None else None
 
-            # Удаляем старые записи (старше 30 секунд)
-            while request_times and (current_time - request_times[0]).total_seconds() > 30:
-                request_times.pop(0)
+    @staticmethod
+    def is_directed(event, command: str) -> bool:
+        """
+        Проверяет, адресовано ли событие боту: callback, личный чат или команда.
 
-            # Если количество запросов превышает 5 за последние 30 секунд
-            if len(request_times) >= 5:
-                return True
+        Обычные сообщения в группах лимитами не ограничиваются, иначе активные
+        участники выпадали бы из архива и синхронизации участников.
 
-            # Добавляем текущий запрос
-            request_times.append(current_time)
-        else:
-            # Инициализируем список запросов для нового пользователя
-            self.user_requests[user_id] = [current_time]
+        Args:
+            event: Объект события.
+            command (str): Результат command_of.
+
+        Returns:
+            bool: True, если к событию применяются лимиты.
+        """
+        if isinstance(event, CallbackQuery) or command != "default":
+            return True
+        chat = getattr(event, "chat", None)
+        return chat is not None and chat.type in (ChatType.PRIVATE, ChatType.BOT)
+
+    async def check_spam(self, user_id: int, command: str = "default") -> bool:
+        """
+        Проверяет, является ли запрос спамом.
+
+        Args:
+            user_id (int): ID пользователя.
+            command (str): Команда, для которой применяется лимит.
 
-        return False
+        Returns:
+            bool: True, если это спам, иначе False.
+        """
+        limiter = self.limiters.get(command) or self.limiters["default"]
+        return not limiter.hit(user_id)
 
-    async def process_event(self, event):
+    async def process_event(self, event) -> bool:
         """
         Обрабатывает событие и проверяет на наличие спама.
 
         Args:
             event: Объект события (сообщение или callback).
+
+        Returns:
+            bool: True, если событие можно передать обработчикам, False — если это спам.
         """
+        self.updates_total.inc()
         try:
             user_id = event.from_user.id if hasattr(event, 'from_user') and event.from_user else None
             if not user_id:
-                return  # Пропускаем события без пользователя
-
-            # Проверяем на спам
-            if await self.check_spam(user_id):
-                chat_id = event.chat.id if hasattr(event, 'chat') else event.message.chat.id
-                await self.app.send_message(
-                    chat_id=chat_id,
-                    text="Слишком много запросов! Пожалуйста, подождите 30 секунд."
-                )
-                return
+                return True  # Пропускаем события без пользователя
+
+            # Проверяем на спам только обращения к боту
+            command = self.command_of(event, getattr(self.app.me, "username", None))
+            if self.is_directed(event, command) and await self.check_spam(user_id, command):
+                self.rejected_total.inc()
+                # Предупреждаем не чаще одного раза за окно и никогда — в группу
+                _, window = self.limits.get(command, self.limits["default"])
+                if self.warnings.hit(user_id):
+                    text = f"Слишком много запросов! Пожалуйста, подождите {int(window)} секунд."
+                    if isinstance(event, CallbackQuery):
+                        await event.answer(text, show_alert=True)
+                    elif event.chat.type in (ChatType.PRIVATE, ChatType.BOT):
+                        await self.app.send_message(chat_id=event.chat.id, text=text)
+                return False
 
             # Логируем активность пользователя
-            from config import log_user_activity
-            log_user_activity(user_id)
+            from config import write_behind
+            await write_behind.log_activity(user_id, self.chat_id_of(event))
         except Exception as e:
             logger.error(f"Ошибка в процессе проверки спама: {e}")
+        return True
+
+
+# Группа обработчиков middleware: выполняется раньше всех остальных (группа 0 и выше)
+MIDDLEWARE_GROUP = -1
 
 
 # Регистрация middleware
-def register_middleware(app: Client):
+def register_middleware(app: Client, anti_spam_middleware: AntiSpamMiddleware = None) -> AntiSpamMiddleware:
     """
     Регистрирует middleware для приложения.
 
+    Обработчики middleware стоят в отдельной группе MIDDLEWARE_GROUP и
+    вызываются один раз на каждое обновление до обработчиков из
+    handlers/handlers.py. Лимиты применяются к командам, callback-запросам
+    и личным сообщениям; если запрос признан спамом, распространение
+    обновления останавливается и до базы данных оно не доходит. Обычные
+    сообщения в группах всегда проходят дальше, только учитываясь в
+    активности и метриках.
+
     Args:
         app (Client): Экземпляр Pyrogram клиента.
+        anti_spam_middleware (AntiSpamMiddleware): Готовый экземпляр middleware.
+
+    Returns:
+        AntiSpamMiddleware: Зарегистрированный экземпляр.
     """
-    anti_spam_middleware = AntiSpamMiddleware(app)
-
-    @app.on_message()
-    async def on_message(message):
-        await anti_spam_middleware.process_event(message)
-        # Передаем управление следующим обработчикам
-        app.dispatcher.trigger_handlers(message)
-
-    @app.on_callback_query()
-    async def on_callback_query(callback_query):
-        await anti_spam_middleware.process_event(callback_query)
-        # Передаем управление следующим обработчикам
-        app.dispatcher.trigger_handlers(callback_query)
\ No newline at end of file
+    anti_spam_middleware = anti_spam_middleware or AntiSpamMiddleware(app)
+
+    @app.on_message(group=MIDDLEWARE_GROUP)
+    async def on_message(client, message):
+        if not await anti_spam_middleware.process_event(message):
+            message.stop_propagation()
+
+    @app.on_callback_query(group=MIDDLEWARE_GROUP)
+    async def on_callback_query(client, callback_query):
+        if not await anti_spam_middleware.process_event(callback_query):
+            callback_query.stop_propagation()
+
+    return anti_spam_middleware
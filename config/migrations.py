@@ -0,0 +1,239 @@
+from logger import setup_logger
+
+logger = setup_logger()
+
+
+# Версия 1: исходная схема (таблицы существующих баз уже в ней)
+def _initial_schema(cursor):
+    # Таблица для хранения ID чатов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_type TEXT NOT NULL,
+            chat_id INTEGER NOT NULL UNIQUE
+        )
+    """)
+
+    # Таблица для хранения пользователей
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL UNIQUE,
+            username TEXT,
+            full_name TEXT,
+            joined_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            chat_id INTEGER,
+            FOREIGN KEY(chat_id) REFERENCES chats(chat_id) ON DELETE CASCADE
+        )
+    """)
+
+    # Таблица для хранения сообщений
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            message_text TEXT,
+            sent_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица для отслеживания активности пользователей
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_activity (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            request_time DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# Версия 2: синхронизация участников, пары чатов, таймеры, разделяемое состояние
+def _bot_state(cursor):
+    # Контрольные точки синхронизации участников чатов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_checkpoints (
+            chat_id INTEGER PRIMARY KEY,
+            synced_at REAL NOT NULL,
+            member_count INTEGER NOT NULL
+        )
+    """)
+
+    # Пары чатов: из какого чата приглашают и в какой
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_pairs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inviting_chat_id INTEGER NOT NULL,
+            invited_chat_id INTEGER NOT NULL UNIQUE,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_pairs_inviting ON chat_pairs (inviting_chat_id)")
+
+    # Отложенные действия (снятие ограничений, напоминания); индекс по due_at
+    # позволяет выбирать ближайшие таймеры без просмотра всей таблицы
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS timers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            due_at REAL NOT NULL,
+            payload TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            UNIQUE(kind, chat_id, user_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_timers_due_at ON timers (due_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_timers_user ON timers (user_id)")
+
+    # Разделяемое состояние процессов-обработчиков (диалоги, версия реестра чатов)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS shared_state (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL,
+            PRIMARY KEY (namespace, key)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_shared_state_expires_at ON shared_state (expires_at)")
+
+    # Индексы для очистки по политике хранения
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_sent_at ON messages (sent_at)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_activity_user_time ON user_activity (user_id, request_time)
+    """)
+
+
+# Версия 3: участники чатов — связь многие-ко-многим вместо users.chat_id
+def _chat_members(cursor):
+    # Первичный ключ (chat_id, user_id) обслуживает выборки по чату,
+    # отдельный индекс — выборки чатов пользователя
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_members (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            joined_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_members_user ON chat_members (user_id)")
+    cursor.execute("""
+        INSERT OR IGNORE INTO chat_members (chat_id, user_id, joined_at)
+        SELECT chat_id, user_id, COALESCE(CAST(strftime('%s', joined_at) AS REAL), CAST(strftime('%s', 'now') AS REAL))
+        FROM users
+        WHERE chat_id IS NOT NULL
+    """)
+
+
+# Версия 4: чат в записях активности и почасовые/подневные сводки по ней
+def _activity_rollups(cursor):
+    cursor.execute("ALTER TABLE user_activity ADD COLUMN chat_id INTEGER")
+
+    # Сводки по (чат, пользователь): час и день — номера от начала эпохи (UTC)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS activity_hourly (
+            chat_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            requests INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, hour, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_hourly_hour ON activity_hourly (hour)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS activity_daily (
+            chat_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            requests INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, day, user_id)
+        ) WITHOUT ROWID
+    """)
+    # Индекс обслуживает и самых активных пользователей дня (без сортировки),
+    # и удаление устаревших дней
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_activity_daily_top ON activity_daily (day, chat_id, requests)
+    """)
+
+    # Итоги дня по чату поддерживаются триггерами: новая строка activity_daily —
+    # новый активный пользователь, изменение requests — прирост запросов.
+    # Устаревшие дни удаляются из обеих таблиц сразу, поэтому триггера на удаление нет
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS activity_chat_daily (
+            chat_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            requests INTEGER NOT NULL,
+            users INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, day)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS activity_daily_ai AFTER INSERT ON activity_daily BEGIN
+            INSERT INTO activity_chat_daily (chat_id, day, requests, users)
+            VALUES (new.chat_id, new.day, new.requests, 1)
+            ON CONFLICT (chat_id, day) DO UPDATE SET
+                requests = requests + excluded.requests,
+                users = users + 1;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS activity_daily_au AFTER UPDATE OF requests ON activity_daily BEGIN
+            UPDATE activity_chat_daily
+            SET requests = requests + new.requests - old.requests
+            WHERE chat_id = new.chat_id AND day = new.day;
+        END
+    """)
+
+
+# Миграции по порядку: номер версии, описание, функция(cursor).
+# Новые изменения схемы добавляются только в конец списка.
+MIGRATIONS = [
+    (1, "исходная схема", _initial_schema),
+    (2, "состояние бота", _bot_state),
+    (3, "участники чатов", _chat_members),
+    (4, "сводки активности", _activity_rollups),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(connection) -> int:
+    """
+    Приводит схему базы к последней версии.
+
+    Версия хранится в PRAGMA user_version, поэтому на актуальной базе
+    выполняется один запрос. Каждая миграция применяется в своей транзакции
+    вместе с записью новой версии; BEGIN IMMEDIATE не дает нескольким
+    процессам применить одну миграцию дважды.
+
+    Args:
+        connection: Соединение с базой.
+
+    Returns:
+        int: Сколько миграций применено.
+    """
+    if schema_version(connection) >= SCHEMA_VERSION:
+        return 0
+
+    applied = 0
+    for version, description, migration in MIGRATIONS:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Версию перечитываем под блокировкой: ее мог поднять другой процесс
+            if schema_version(connection) >= version:
+                connection.rollback()
+                continue
+            migration(connection.cursor())
+            connection.execute(f"PRAGMA user_version = {version}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        applied += 1
+        logger.info(f"Схема базы данных обновлена до версии {version}: {description}")
+    return applied
@@ -0,0 +1,143 @@
+import asyncio
+import os
+from collections import namedtuple
+
+from config.state import StateBackend, state_backend as default_state_backend
+from config.storage import storage
+from logger import setup_logger
+
+logger = setup_logger()
+
+# Как часто процессы-обработчики проверяют, не изменил ли реестр другой процесс
+WATCH_INTERVAL = float(os.getenv("CHAT_REGISTRY_WATCH_INTERVAL", "5"))
+# Версия реестра в хранилище состояния: увеличивается при каждом изменении пар
+VERSION_NAMESPACE = "chat_registry"
+VERSION_KEY = "version"
+
+ChatPair = namedtuple("ChatPair", ["inviting_chat_id", "invited_chat_id"])
+
+
+def _load_pairs(connection):
+    pairs = connection.execute("SELECT inviting_chat_id, invited_chat_id FROM chat_pairs ORDER BY id").fetchall()
+    if pairs:
+        return pairs
+
+    # Перенос единственной пары из старой таблицы chats
+    legacy = dict(connection.execute("SELECT chat_type, chat_id FROM chats").fetchall())
+    inviting_chat_id, invited_chat_id = legacy.get("INVITING_CHAT"), legacy.get("INVITED_CHAT")
+    if inviting_chat_id and invited_chat_id:
+        _save_pair(connection, inviting_chat_id, invited_chat_id)
+        return [(inviting_chat_id, invited_chat_id)]
+    return []
+
+
+def _save_pair(connection, inviting_chat_id, invited_chat_id):
+    connection.execute("""
+        INSERT INTO chat_pairs (inviting_chat_id, invited_chat_id) VALUES (?, ?)
+        ON CONFLICT(invited_chat_id) DO UPDATE SET inviting_chat_id = excluded.inviting_chat_id
+    """, (inviting_chat_id, invited_chat_id))
+
+
+def _delete_pair(connection, invited_chat_id):
+    connection.execute("DELETE FROM chat_pairs WHERE invited_chat_id = ?", (invited_chat_id,))
+
+
+class ChatRegistry:
+    """
+    Реестр пар чатов (приглашающий -> приглашаемый).
+
+    Пары хранятся в таблице chat_pairs и индексируются в памяти по обоим
+    ролям, поэтому обработчики определяют пару для любого обновления за O(1).
+    Изменения через /set_chats применяются сразу, без перезапуска; другие
+    процессы узнают о них по версии в хранилище состояния (см. watch).
+    """
+
+    def __init__(self, backend: StateBackend = None):
+        self.backend = backend or default_state_backend
+        self._by_invited = {}  # invited_chat_id -> ChatPair
+        self._by_inviting = {}  # inviting_chat_id -> [ChatPair]
+        self._version = None
+
+    def _index(self, pairs):
+        by_invited = {}
+        by_inviting = {}
+        for inviting_chat_id, invited_chat_id in pairs:
+            pair = ChatPair(inviting_chat_id, invited_chat_id)
+            by_invited[invited_chat_id] = pair
+            by_inviting.setdefault(inviting_chat_id, []).append(pair)
+        self._by_invited, self._by_inviting = by_invited, by_inviting
+
+    async def reload(self):
+        self._index(await storage.run(_load_pairs))
+
+    async def add_pair(self, inviting_chat_id: int, invited_chat_id: int) -> ChatPair:
+        """
+        Сохраняет пару и сразу делает ее доступной обработчикам.
+
+        Args:
+            inviting_chat_id (int): ID чата, участники которого получают приглашения.
+            invited_chat_id (int): ID чата, в который приглашают.
+
+        Returns:
+            ChatPair: Сохраненная пара.
+        """
+        await storage.run(_save_pair, inviting_chat_id, invited_chat_id)
+        pairs = [pair for pair in self._by_invited.values() if pair.invited_chat_id != invited_chat_id]
+        pairs.append(ChatPair(inviting_chat_id, invited_chat_id))
+        self._index(pairs)
+        self._version = await self.backend.incr(VERSION_NAMESPACE, VERSION_KEY)
+        return pairs[-1]
+
+    async def remove_pair(self, invited_chat_id: int):
+        await storage.run(_delete_pair, invited_chat_id)
+        self._index([pair for pair in self._by_invited.values() if pair.invited_chat_id != invited_chat_id])
+        self._version = await self.backend.incr(VERSION_NAMESPACE, VERSION_KEY)
+
+    async def watch(self, interval: float = WATCH_INTERVAL):
+        """
+        Перечитывает пары, когда их изменил другой процесс.
+
+        Args:
+            interval (float): Период проверки версии, с.
+        """
+        self._version = await self.backend.get(VERSION_NAMESPACE, VERSION_KEY)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                version = await self.backend.get(VERSION_NAMESPACE, VERSION_KEY)
+                if version != self._version:
+                    await self.reload()
+                    self._version = version
+                    logger.info(f"Реестр чатов перечитан (версия {version}): пар {len(self)}")
+            except Exception as e:
+                logger.error(f"Ошибка проверки версии реестра чатов: {e}")
+
+    def __len__(self):
+        return len(self._by_invited)
+
+    def pairs(self):
+        return list(self._by_invited.values())
+
+    def by_invited(self, chat_id: int):
+        return self._by_invited.get(chat_id)
+
+    def by_inviting(self, chat_id: int):
+        return self._by_inviting.get(chat_id, ())
+
+    def is_invited(self, chat_id: int) -> bool:
+        return chat_id in self._by_invited
+
+    def is_tracked(self, chat_id: int) -> bool:
+        return chat_id in self._by_invited or chat_id in self._by_inviting
+
+    def invited_chat_ids(self):
+        return list(self._by_invited)
+
+    def inviting_chat_ids(self):
+        return list(self._by_inviting)
+
+    def all_chat_ids(self):
+        return list(dict.fromkeys(self.inviting_chat_ids() + self.invited_chat_ids()))
+
+
+chat_registry = ChatRegistry()
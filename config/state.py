@@ -0,0 +1,145 @@
+import json
+import os
+import time
+
+from config.storage import storage
+
+# sqlite — общее для всех процессов состояние, memory — локальная замена для одного процесса и проверок
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+
+
+class StateBackend:
+    """
+    Хранилище разделяемого состояния «пространство имен -> ключ -> значение».
+
+    Значения сериализуются в JSON, у записи может быть срок действия.
+    Через него процессы-обработчики видят общее состояние (диалоги,
+    версия реестра чатов), не обращаясь к памяти друг друга.
+    """
+
+    async def get(self, namespace: str, key):
+        raise NotImplementedError
+
+    async def set(self, namespace: str, key, value, ttl: float = None):
+        raise NotImplementedError
+
+    async def delete(self, namespace: str, key):
+        raise NotImplementedError
+
+    async def items(self, namespace: str) -> dict:
+        raise NotImplementedError
+
+    async def incr(self, namespace: str, key) -> int:
+        raise NotImplementedError
+
+
+class MemoryStateBackend(StateBackend):
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._data = {}  # (namespace, key) -> (expires_at, value)
+
+    def _live(self, namespace, key):
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= self.clock():
+            del self._data[(namespace, key)]
+            return None
+        return entry
+
+    async def get(self, namespace: str, key):
+        entry = self._live(namespace, str(key))
+        return None if entry is None else json.loads(entry[1])
+
+    async def set(self, namespace: str, key, value, ttl: float = None):
+        expires_at = self.clock() + ttl if ttl is not None else None
+        self._data[(namespace, str(key))] = (expires_at, json.dumps(value))
+
+    async def delete(self, namespace: str, key):
+        self._data.pop((namespace, str(key)), None)
+
+    async def items(self, namespace: str) -> dict:
+        keys = [key for ns, key in self._data if ns == namespace]
+        return {key: json.loads(entry[1]) for key in keys if (entry := self._live(namespace, key)) is not None}
+
+    async def incr(self, namespace: str, key) -> int:
+        value = (await self.get(namespace, key) or 0) + 1
+        await self.set(namespace, key, value)
+        return value
+
+
+# Чтение значения с учетом срока действия
+def _get_state(connection, namespace, key, now):
+    row = connection.execute("""
+        SELECT value FROM shared_state
+        WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)
+    """, (namespace, key, now)).fetchone()
+    return json.loads(row[0]) if row else None
+
+# Запись значения
+def _set_state(connection, namespace, key, value, expires_at):
+    connection.execute("""
+        INSERT INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+    """, (namespace, key, json.dumps(value), expires_at))
+
+# Удаление значения
+def _delete_state(connection, namespace, key):
+    connection.execute("DELETE FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key))
+
+# Все действующие значения пространства имен; истекшие удаляются по индексу expires_at
+def _state_items(connection, namespace, now):
+    connection.execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+    cursor = connection.execute("SELECT key, value FROM shared_state WHERE namespace = ?", (namespace,))
+    return {key: json.loads(value) for key, value in cursor.fetchall()}
+
+# Атомарное увеличение счетчика внутри одной транзакции
+def _incr_state(connection, namespace, key):
+    connection.execute("""
+        INSERT INTO shared_state (namespace, key, value) VALUES (?, ?, '1')
+        ON CONFLICT(namespace, key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+    """, (namespace, key))
+    return int(connection.execute(
+        "SELECT value FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key)
+    ).fetchone()[0])
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Разделяемое состояние в таблице shared_state той же базы SQLite.
+    """
+
+    async def get(self, namespace: str, key):
+        return await storage.run(_get_state, namespace, str(key), time.time())
+
+    async def set(self, namespace: str, key, value, ttl: float = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        await storage.run(_set_state, namespace, str(key), value, expires_at)
+
+    async def delete(self, namespace: str, key):
+        await storage.run(_delete_state, namespace, str(key))
+
+    async def items(self, namespace: str) -> dict:
+        return await storage.run(_state_items, namespace, time.time())
+
+    async def incr(self, namespace: str, key) -> int:
+        return await storage.run(_incr_state, namespace, str(key))
+
+
+def create_state_backend(kind: str = STATE_BACKEND) -> StateBackend:
+    """
+    Создает хранилище разделяемого состояния.
+
+    Args:
+        kind (str): "sqlite" или "memory".
+
+    Returns:
+        StateBackend: Экземпляр хранилища.
+    """
+    backends = {"sqlite": SQLiteStateBackend, "memory": MemoryStateBackend}
+    if kind not in backends:
+        raise ValueError(f"Неизвестное хранилище состояния: {kind}")
+    return backends[kind]()
+
+
+state_backend = create_state_backend()
@@ -0,0 +1,187 @@
+import asyncio
+import functools
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from logger import setup_logger
+from metrics import METRICS_ENABLED, registry
+
+logger = setup_logger()
+
+DB_PATH = os.getenv("DB_PATH", "identifier.sqlite")
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# Настройки соединения: WAL позволяет читать параллельно с записью,
+# synchronous=NORMAL убирает fsync на каждый commit (в WAL это безопасно)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений с SQLite.
+
+    Соединения создаются лениво, не привязаны к потоку и переиспользуются,
+    поэтому кеш подготовленных выражений sqlite3 (cached_statements) живет
+    столько же, сколько и процесс.
+    """
+
+    def __init__(self, path: str = DB_PATH, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path,
+            timeout=5,
+            check_same_thread=False,
+            cached_statements=256
+        )
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def release(self, connection: sqlite3.Connection):
+        if self._closed:
+            connection.close()
+            return
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+class Storage:
+    """
+    Асинхронный фасад над пулом соединений.
+
+    Каждая операция — это функция вида ``func(connection, *args)``, которая
+    выполняется в отдельном потоке внутри одной транзакции, поэтому обработчики
+    Pyrogram не блокируют цикл событий на записи в базу.
+    """
+
+    def __init__(self, path: str = DB_PATH, pool_size: int = POOL_SIZE, instrumented: bool = METRICS_ENABLED):
+        self.pool = ConnectionPool(path, pool_size)
+        self.instrumented = instrumented
+        self._executor = None
+        self._query_time = {}  # func -> Histogram
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.pool.size,
+                thread_name_prefix="storage"
+            )
+        return self._executor
+
+    def run_sync(self, func, *args, **kwargs):
+        """
+        Выполняет операцию синхронно в транзакции.
+
+        Args:
+            func: Функция, первым аргументом принимающая соединение.
+
+        Returns:
+            Результат func.
+        """
+        if not self.instrumented:
+            with self.pool.connection() as connection:
+                with connection:
+                    return func(connection, *args, **kwargs)
+
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as connection:
+                with connection:
+                    return func(connection, *args, **kwargs)
+        except Exception:
+            registry.counter("db_errors_total", "Ошибок при работе с базой",
+                             labels={"operation": func.__name__.lstrip("_")}).inc()
+            raise
+        finally:
+            self._observe(func, time.perf_counter() - started)
+
+    def _observe(self, func, elapsed: float):
+        histogram = self._query_time.get(func)
+        if histogram is None:
+            histogram = self._query_time[func] = registry.histogram(
+                "db_query_seconds", "Время выполнения операции с базой (включая ожидание соединения)",
+                labels={"operation": func.__name__.lstrip("_")}
+            )
+        histogram.observe(elapsed)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Выполняет операцию в пуле потоков, не блокируя цикл событий.
+
+        Args:
+            func: Функция, первым аргументом принимающая соединение.
+
+        Returns:
+            Результат func.
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.run_sync, func, *args, **kwargs)
+        return await loop.run_in_executor(self._get_executor(), call)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.pool.close()
+        logger.info("Соединения с базой данных закрыты")
+
+
+storage = Storage()
@@ -0,0 +1,92 @@
+import json
+import time
+
+from config.storage import storage
+
+
+# Постановка таймера; повторная постановка того же вида для пользователя переносит срок
+def _schedule_timer(connection, kind, chat_id, user_id, due_at, payload):
+    connection.execute("""
+        INSERT INTO timers (kind, chat_id, user_id, due_at, payload, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(kind, chat_id, user_id) DO UPDATE SET
+            due_at = excluded.due_at,
+            payload = excluded.payload,
+            attempts = 0
+    """, (kind, chat_id, user_id, due_at, json.dumps(payload) if payload is not None else None, time.time()))
+
+
+async def schedule_timer(kind, chat_id, user_id, due_at, payload=None):
+    await storage.run(_schedule_timer, kind, chat_id, user_id, due_at, payload)
+
+# Время ближайшего таймера (MIN по индексу due_at)
+def _next_timer_due(connection):
+    return connection.execute("SELECT MIN(due_at) FROM timers").fetchone()[0]
+
+
+async def next_timer_due():
+    return await storage.run(_next_timer_due)
+
+# Пакет наступивших таймеров
+def _get_due_timers(connection, now, limit):
+    cursor = connection.execute("""
+        SELECT id, kind, chat_id, user_id, due_at, payload, attempts
+        FROM timers
+        WHERE due_at <= ?
+        ORDER BY due_at
+        LIMIT ?
+    """, (now, limit))
+    return [
+        {
+            "id": row[0], "kind": row[1], "chat_id": row[2], "user_id": row[3], "due_at": row[4],
+            "payload": json.loads(row[5]) if row[5] else None, "attempts": row[6]
+        }
+        for row in cursor.fetchall()
+    ]
+
+
+async def get_due_timers(now, limit):
+    return await storage.run(_get_due_timers, now, limit)
+
+# Удаление выполненных таймеров
+def _delete_timers(connection, timer_ids):
+    connection.executemany("DELETE FROM timers WHERE id = ?", ((timer_id,) for timer_id in timer_ids))
+
+
+async def delete_timers(timer_ids):
+    await storage.run(_delete_timers, timer_ids)
+
+# Перенос таймера после неудачной попытки
+def _retry_timers(connection, retries):
+    connection.executemany(
+        "UPDATE timers SET due_at = ?, attempts = attempts + 1 WHERE id = ?", retries
+    )
+
+
+async def retry_timers(retries):
+    await storage.run(_retry_timers, retries)
+
+# Таймеры пользователя (кто и до какого времени ограничен)
+def _get_user_timers(connection, user_id, kind=None):
+    query = "SELECT id, kind, chat_id, user_id, due_at FROM timers WHERE user_id = ?"
+    params = [user_id]
+    if kind is not None:
+        query += " AND kind = ?"
+        params.append(kind)
+    return connection.execute(query, params).fetchall()
+
+
+async def get_user_timers(user_id, kind=None):
+    return await storage.run(_get_user_timers, user_id, kind)
+
+# Отмена таймеров пользователя
+def _cancel_user_timers(connection, user_id, chat_id=None):
+    if chat_id is None:
+        return connection.execute("DELETE FROM timers WHERE user_id = ?", (user_id,)).rowcount
+    return connection.execute(
+        "DELETE FROM timers WHERE user_id = ? AND chat_id = ?", (user_id, chat_id)
+    ).rowcount
+
+
+async def cancel_user_timers(user_id, chat_id=None):
+    return await storage.run(_cancel_user_timers, user_id, chat_id)
@@ -0,0 +1,178 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from config.analytics import trim_rollups
+from config.archive import message_archive
+from config.config import write_batch, apply_retention
+from logger import setup_logger
+from metrics import registry
+
+logger = setup_logger()
+
+FLUSH_SIZE = int(os.getenv("WRITE_BEHIND_FLUSH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "60"))
+
+
+def _timestamp():
+    # Формат совпадает с CURRENT_TIMESTAMP в SQLite (UTC)
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class WriteBehindQueue:
+    """
+    Буфер отложенной записи сообщений и активности пользователей.
+
+    Строки копятся в памяти и сбрасываются одной транзакцией executemany,
+    когда набирается flush_size строк или проходит flush_interval секунд.
+    Если в буфере max_pending строк, добавление ждет завершения сброса,
+    поэтому память ограничена. Раз в retention_interval секунд после сброса
+    запускается очистка по политике хранения, сводок активности и сжатие архива.
+
+    Сообщения с известным чатом дополнительно пишутся в архив (archive)
+    тем же сбросом.
+    """
+
+    def __init__(self, flush_size: int = FLUSH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING, retention_interval: float = RETENTION_INTERVAL,
+                 archive=message_archive):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention_interval = retention_interval
+        self.archive = archive
+        self._last_retention = time.monotonic()
+        self._messages = deque()
+        self._activity = deque()
+        self._archived = deque()
+        self._wakeup = None
+        self._flush_lock = None
+        self._task = None
+
+        self.queue_depth = registry.gauge("write_behind_queue_depth", "Строк ожидает записи")
+        self.flush_latency = registry.histogram("write_behind_flush_seconds", "Длительность сброса буфера")
+        self.rows_written = registry.counter("write_behind_rows_written_total", "Записано строк")
+        self.rows_failed = registry.counter("write_behind_rows_failed_total", "Потеряно строк при ошибке записи")
+
+    @property
+    def pending(self) -> int:
+        return len(self._messages) + len(self._activity) + len(self._archived)
+
+    def _get_wakeup(self) -> asyncio.Event:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def _get_flush_lock(self) -> asyncio.Lock:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        return self._flush_lock
+
+    async def _enqueue(self, buffer: deque, row: tuple):
+        if self.pending >= self.max_pending:
+            await self.flush()
+        buffer.append(row)
+        pending = self.pending
+        self.queue_depth.set(pending)
+        if pending >= self.flush_size:
+            self._get_wakeup().set()
+
+    async def add_message(self, user_id: int, message_text: str, chat_id: int = None):
+        await self._enqueue(self._messages, (user_id, message_text, _timestamp()))
+        if chat_id is not None and self.archive is not None:
+            await self._enqueue(self._archived, (chat_id, user_id, time.time(), message_text))
+
+    async def log_activity(self, user_id: int, chat_id: int = None):
+        await self._enqueue(self._activity, (user_id, _timestamp(), chat_id))
+
+    async def flush(self):
+        """
+        Записывает все накопленные строки одной транзакцией.
+        """
+        async with self._get_flush_lock():
+            if not self.pending:
+                return
+            messages = list(self._messages)
+            activity = list(self._activity)
+            archived = list(self._archived)
+            self._messages.clear()
+            self._activity.clear()
+            self._archived.clear()
+            self.queue_depth.set(0)
+
+            started = time.perf_counter()
+            try:
+                await write_batch(messages, activity)
+                self.rows_written.inc(len(messages) + len(activity))
+            except Exception as e:
+                self.rows_failed.inc(len(messages) + len(activity))
+                logger.error(f"Ошибка записи пакета ({len(messages)} сообщений, {len(activity)} событий): {e}")
+            # Архив в отдельных файлах: ошибка в одном не теряет строки другого
+            try:
+                if archived:
+                    await self.archive.write(archived)
+                    self.rows_written.inc(len(archived))
+            except Exception as e:
+                self.rows_failed.inc(len(archived))
+                logger.error(f"Ошибка записи {len(archived)} сообщений в архив: {e}")
+            finally:
+                self.flush_latency.observe(time.perf_counter() - started)
+
+    async def _run(self):
+        wakeup = self._get_wakeup()
+        while True:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            await self.flush()
+            if time.monotonic() - self._last_retention >= self.retention_interval:
+                await self.trim()
+
+    async def trim(self):
+        self._last_retention = time.monotonic()
+        try:
+            deleted_messages, deleted_activity = await apply_retention()
+            logger.debug(f"Очистка: удалено {deleted_messages} сообщений, {deleted_activity} записей активности")
+        except Exception as e:
+            logger.error(f"Ошибка очистки устаревших записей: {e}")
+        try:
+            deleted_rollups = await trim_rollups()
+            logger.debug(f"Очистка: удалено {deleted_rollups} строк сводок активности")
+        except Exception as e:
+            logger.error(f"Ошибка очистки сводок активности: {e}")
+        if self.archive is not None:
+            try:
+                compacted = await self.archive.maintain()
+                logger.debug(f"Архив: сжато {compacted} сообщений")
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания архива: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает фоновый сброс и гарантированно записывает остаток буфера.
+
+        Очистка и обслуживание архива при остановке не выполняются: сжатие и
+        VACUUM могут занять минуты, их сделает периодический проход.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info("Буфер отложенной записи сброшен")
+
+
+write_behind = WriteBehindQueue()
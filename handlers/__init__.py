@@ -1,2 +1,10 @@
 from .handlers import (StartHandler, HelpButton, InviteButton, EventButton, DepartureHandler, MessageHandler,
-                       NewMemberHandler, ChatSelectionHandler)
\ No newline at end of file
+                       SearchHandler, StatsHandler, NewMemberHandler, ChatSelectionHandler, MembershipSyncHandler, is_chat_member)
+from .membership_cache import MembershipCache, membership_cache
+from .invite_links import InviteLinkPool, invite_link_pool
+from .mentions import MentionRenderer, mention_renderer
+from .outbound import OutboundScheduler, outbound
+from .timers import TimerService, timer_service
+from .conversations import ConversationStore, conversation_store
+from .router import TextRouter, text_router
+from .join_requests import JoinRequestProcessor, join_request_processor
@@ -0,0 +1,142 @@
+import os
+import time
+from collections import OrderedDict
+
+from config.state import StateBackend, state_backend as default_state_backend
+from logger import setup_logger
+from metrics import registry
+
+logger = setup_logger()
+
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "600"))
+MAX_CONVERSATIONS = int(os.getenv("MAX_CONVERSATIONS", "10000"))
+PERSIST_CONVERSATIONS = os.getenv("PERSIST_CONVERSATIONS", "1") == "1"
+# Сколько истекших записей удалять за один проход
+EXPIRATIONS_PER_PASS = 64
+
+# Пространство имен диалогов в хранилище состояния
+NAMESPACE = "conversation"
+
+# Состояния диалога
+AWAITING_EVENT_TEXT = "awaiting_event_text"
+
+
+class ConversationStore:
+    """
+    Хранилище состояний диалогов пользователей с ботом.
+
+    У пользователя одно активное состояние с данными и сроком действия.
+    Записи лежат в OrderedDict в порядке истечения срока: истекшие снимаются
+    с начала ограниченными проходами, при переполнении вытесняются самые
+    старые. При persistent=True состояния дублируются в хранилище
+    разделяемого состояния и восстанавливаются при запуске (в том числе
+    другим процессом-обработчиком), но проверка состояния всегда
+    выполняется по памяти.
+    """
+
+    def __init__(self, ttl: float = CONVERSATION_TTL, max_entries: int = MAX_CONVERSATIONS,
+                 persistent: bool = PERSIST_CONVERSATIONS, backend: StateBackend = None, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.backend = backend or default_state_backend
+        self.clock = clock
+        self._entries = OrderedDict()  # user_id -> (expires_at, state, data)
+
+        self.pending = registry.gauge("conversations_pending", "Диалогов ожидает ответа")
+        self.expired = registry.counter("conversations_expired_total", "Диалогов завершено по истечении срока")
+        self.evicted = registry.counter("conversations_evicted_total", "Диалогов вытеснено при переполнении")
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def load(self):
+        """
+        Восстанавливает действующие состояния из хранилища.
+        """
+        if not self.persistent:
+            return
+        entries = await self.backend.items(NAMESPACE)
+        for user_id, entry in sorted(entries.items(), key=lambda item: item[1]["expires_at"]):
+            self._entries[int(user_id)] = (entry["expires_at"], entry["state"], entry["data"])
+        self._expire(self.clock())
+        logger.info(f"Восстановлено диалогов: {len(self._entries)}")
+
+    def _expire(self, now: float):
+        removed = 0
+        while self._entries and removed < EXPIRATIONS_PER_PASS:
+            user_id, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[user_id]
+            removed += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted.inc()
+        if removed:
+            self.expired.inc(removed)
+        self.pending.set(len(self._entries))
+
+    def get(self, user_id: int, state: str = None):
+        """
+        Возвращает данные активного состояния пользователя.
+
+        Args:
+            user_id (int): ID пользователя.
+            state (str): Ожидаемое состояние; None — любое.
+
+        Returns:
+            dict или None, если состояния нет, оно истекло или не совпадает.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, current, data = entry
+        if expires_at <= self.clock():
+            del self._entries[user_id]
+            self.expired.inc()
+            self.pending.set(len(self._entries))
+            return None
+        if state is not None and current != state:
+            return None
+        return data if data is not None else {}
+
+    def is_in(self, user_id: int, state: str) -> bool:
+        return self.get(user_id, state) is not None
+
+    async def set(self, user_id: int, state: str, data: dict = None):
+        """
+        Переводит пользователя в состояние, заменяя предыдущее.
+
+        Args:
+            user_id (int): ID пользователя.
+            state (str): Новое состояние.
+            data (dict): Данные, нужные для продолжения диалога.
+        """
+        now = self.clock()
+        expires_at = now + self.ttl
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = (expires_at, state, data)
+        self._expire(now)
+        if self.persistent:
+            entry = {"state": state, "data": data, "expires_at": expires_at}
+            await self.backend.set(NAMESPACE, user_id, entry, ttl=self.ttl)
+
+    async def pop(self, user_id: int, state: str = None):
+        """
+        Завершает диалог и возвращает его данные.
+
+        Returns:
+            dict или None, если подходящего состояния не было.
+        """
+        data = self.get(user_id, state)
+        if data is None:
+            return None
+        del self._entries[user_id]
+        self.pending.set(len(self._entries))
+        if self.persistent:
+            await self.backend.delete(NAMESPACE, user_id)
+        return data
+
+
+conversation_store = ConversationStore()
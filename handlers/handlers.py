@@ -1,16 +1,48 @@
+import html
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+from pyrogram.enums import ChatMemberStatus, ParseMode
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ChatPermissions
 
 from handlers.BaseHandler import BaseHandler
+from handlers.conversations import (AWAITING_EVENT_TEXT, ConversationStore,
+                                    conversation_store as default_conversation_store)
+from handlers.invite_links import InviteLinkPool, invite_link_pool as default_invite_link_pool
+from handlers.join_requests import JoinRequestProcessor, join_request_processor as default_join_request_processor
+from handlers.membership_cache import ADMIN_STATUSES, MembershipCache, membership_cache as default_membership_cache
+from handlers.mentions import MentionRenderer, mention_renderer as default_mention_renderer
+from handlers.router import GROUP, PRIVATE, normalize, text_router
+from handlers.outbound import (OutboundScheduler, PRIORITY_NOTICE, PRIORITY_REPLY,
+                               outbound as default_outbound)
+from handlers.timers import TimerService, timer_service as default_timer_service
 from pyrogram import Client, filters
-
-from config import save_chat, update_chat_data, add_user
-from config.config import add_message, get_users_in_chat
+from pyrogram.errors import RPCError
+
+from config import (upsert_users, remove_chat_member, adjust_sync_checkpoint, user_full_name,
+                    get_user_chat_ids, get_users_by_ids, schedule_sync, ChatRegistry,
+                    chat_registry as default_chat_registry)
+from config.analytics import GRANULARITIES, STATS_WINDOW_DAYS, export_activity_csv, get_chat_stats
+from config.archive import MessageArchive, message_archive as default_message_archive
+from config.timers import cancel_user_timers, get_user_timers
+from config.write_behind import write_behind
 from logger import setup_logger
 
 logger = setup_logger()
 
+# «Я уехал» или «Я уехал на 3 дня» / «на 5 часов» (по нормализованному тексту)
+DEPARTURE_PATTERN = re.compile(r"я уехал(?: на (\d+) (час|часа|часов|день|дня|дней))?")
+DEFAULT_DEPARTURE = timedelta(minutes=1)
+MAX_DEPARTURE = timedelta(days=365)
+# Для долгих отъездов за час до снятия ограничения отправляется напоминание
+REMINDER_THRESHOLD = timedelta(hours=2)
+# Если приглашающих чатов не больше стольких, при нажатии «Приглашение» проверяются все
+INVITE_FALLBACK_CHATS = int(os.getenv("INVITE_FALLBACK_CHATS", "3"))
+
 
 class StartHandler(BaseHandler):
     def __init__(self, app: Client):
@@ -18,8 +50,7 @@ class StartHandler(BaseHandler):
         self.register_handlers()
 
     def register_handlers(self):
-        @self.app.on_message(filters.command("start"))
-        async def cmd_start(message):
+        async def cmd_start(client, message):
             await message.reply_text(
                 "Приветствую тебя, Шарьинец! Прочитайте описание или воспользуйтесь кнопкой Помощь:",
                 reply_markup=InlineKeyboardMarkup([
@@ -29,6 +60,8 @@ class StartHandler(BaseHandler):
                 ])
             )
 
+        text_router(self.app).command("start", cmd_start)
+
 class HelpButton(BaseHandler):
     def __init__(self, app: Client):
         super().__init__(app)
@@ -36,7 +69,7 @@ class HelpButton(BaseHandler):
 
     def register_handlers(self):
         @self.app.on_callback_query(filters.regex("help"))
-        async def handle_help(callback_query):
+        async def handle_help(client, callback_query):
             await callback_query.message.reply_text(
                 "Список моих возможностей:\n"
                 "• Приглашение - получить пригласительную ссылку\n"
@@ -46,100 +79,219 @@ class HelpButton(BaseHandler):
             await callback_query.answer()
 
 class InviteButton(BaseHandler):
-    def __init__(self, app: Client, inviting_chat_id, invited_chat_id):
+    def __init__(self, app: Client, registry: ChatRegistry = None, membership_cache: MembershipCache = None,
+                 invite_links: InviteLinkPool = None, outbound: OutboundScheduler = None):
         super().__init__(app)
-        self.inviting_chat_id = inviting_chat_id
-        self.invited_chat_id = invited_chat_id
+        self.registry = registry or default_chat_registry
+        self.membership_cache = membership_cache or default_membership_cache
+        self.invite_links = invite_links or default_invite_link_pool
+        self.outbound = outbound or default_outbound
         self.register_handlers()
 
+    async def resolve_pair(self, client: Client, callback_query):
+        """
+        Находит пару чатов, из приглашающего чата которой пришел пользователь.
+
+        Проверяются только чат, где нажата кнопка, и чаты пользователя из
+        базы, поэтому число обращений к API не зависит от размера реестра.
+        Остальные приглашающие чаты перебираются, лишь когда их не больше
+        INVITE_FALLBACK_CHATS (пользователя может не быть в chat_members:
+        список участников усечен или он вступил, пока бот не работал).
+        Ошибка проверки одного чата не прерывает проверку остальных.
+
+        Returns:
+            ChatPair или None.
+        """
+        user_id = callback_query.from_user.id
+        chat_ids = [callback_query.message.chat.id] if callback_query.message else []
+        chat_ids += await get_user_chat_ids(user_id)
+        inviting_chat_ids = self.registry.inviting_chat_ids()
+        if len(inviting_chat_ids) <= INVITE_FALLBACK_CHATS:
+            chat_ids += inviting_chat_ids
+        for chat_id in dict.fromkeys(chat_ids):
+            pairs = self.registry.by_inviting(chat_id)
+            if not pairs:
+                continue
+            try:
+                if await self.membership_cache.is_member(client, chat_id, user_id):
+                    return pairs[0]
+            except RPCError as e:
+                # Например, бота удалили из чата или у него нет прав администратора
+                logger.warning(f"Не удалось проверить участника {user_id} в чате {chat_id}: {e}")
+        return None
+
     def register_handlers(self):
         @self.app.on_callback_query(filters.regex("invite"))
         async def handle_invite(client, callback_query):
             user_id = callback_query.from_user.id
 
             try:
-                # Проверяем права бота в чате
-                bot_member = await client.get_chat_member(self.inviting_chat_id, "me")
-                if bot_member.status not in ["administrator", "creator"]:
-                    await client.send_message(user_id, "Бот не имеет прав для создания пригласительной ссылки.")
+                pair = await self.resolve_pair(client, callback_query)
+                if pair is None:
+                    self.outbound.post(client, user_id, "Не удалось найти вас в группе. Нажмите «Приглашение» "
+                                                        "в сообщении бота внутри самой группы.", PRIORITY_REPLY)
                     return
 
-                chat_member = await client.get_chat_member(self.inviting_chat_id, user_id)
-                if chat_member.status not in ["member", "administrator", "creator"]:
-                    await client.send_message(user_id, "Вы не состоите в группе.")
+                # Проверяем права бота в чате (статус кешируется и обновляется по событиям)
+                if not await self.membership_cache.bot_is_admin(client, pair.inviting_chat_id):
+                    self.outbound.post(client, user_id, "Бот не имеет прав для создания пригласительной ссылки.",
+                                       PRIORITY_REPLY)
                     return
 
-                link = await client.export_chat_invite_link(self.invited_chat_id)
-                await client.send_message(user_id, f"Милости прошу к нашему шалашу: {link}")
+                # Ссылка выдается из заранее созданного пула, основная ссылка чата не сбрасывается
+                link = await self.invite_links.acquire(client, pair.invited_chat_id, user_id)
+                self.outbound.post(client, user_id, f"Милости прошу к нашему шалашу: {link}", PRIORITY_REPLY)
             except Exception as e:
                 logger.error(f"Произошла ошибка: {e}")
             await callback_query.answer()
 
 class EventButton(BaseHandler):
-    def __init__(self, app: Client, chat_id):
+    def __init__(self, app: Client, registry: ChatRegistry = None, mentions: MentionRenderer = None,
+                 conversations: ConversationStore = None):
         super().__init__(app)
-        self.chat_id = chat_id
-        self.waiting_for_event_text = {}
+        self.registry = registry or default_chat_registry
+        self.mentions = mentions or default_mention_renderer
+        self.conversations = conversations or default_conversation_store
         self.register_handlers()
 
     def register_handlers(self):
         @self.app.on_callback_query(filters.regex("event"))
-        async def handle_event(callback_query):
+        async def handle_event(client, callback_query):
             chat_id = callback_query.message.chat.id
-            if chat_id != self.chat_id:
+            if not self.registry.is_invited(chat_id):
                 await callback_query.answer("Эта функция работает только в группе.")
                 return
 
-            users = get_users_in_chat(chat_id)
-            members = [f"@{username}" if username else full_name for username, full_name in users]
-            mention_text = " ".join(members)
-
             await callback_query.message.reply_text("Введите текст для мероприятия:")
-            self.waiting_for_event_text[callback_query.from_user.id] = {
-                "chat_id": chat_id,
-                "mention_text": mention_text
-            }
+            await self.conversations.set(callback_query.from_user.id, AWAITING_EVENT_TEXT, {"chat_id": chat_id})
             await callback_query.answer()
 
-        @self.app.on_message(filters.text & filters.private)
         async def handle_event_text(client, message):
-            if message.from_user.id in self.waiting_for_event_text:
-                data = self.waiting_for_event_text.pop(message.from_user.id)
-                chat_id = data["chat_id"]
-                mention_text = data["mention_text"]
+            data = await self.conversations.pop(message.from_user.id, AWAITING_EVENT_TEXT)
+            if data is None:
+                return
 
-                event_text = message.text
-                await client.send_message(chat_id, f"{mention_text}, {event_text}")
+            # Упоминания берутся из кеша и ставятся в очередь частями; доставки обработчик не ждет
+            await self.mentions.broadcast(client, data["chat_id"], message.text)
+
+        # Сообщения пользователей без ожидаемого состояния отсекаются проверкой в памяти
+        text_router(self.app).fallback(
+            lambda message: self.conversations.is_in(message.from_user.id, AWAITING_EVENT_TEXT),
+            handle_event_text, PRIVATE
+        )
 
 class DepartureHandler(BaseHandler):
-    def __init__(self, app: Client, chat_id):
+    """
+    Временное ограничение участника по сообщению «Я уехал».
+
+    Снятие ограничения и напоминание хранятся как таймеры в SQLite, поэтому
+    переживают перезапуск; вернувшийся раньше пользователь может снять
+    ограничение командой /back в личном чате с ботом.
+    """
+
+    LIFT = "lift_restriction"
+    REMINDER = "departure_reminder"
+
+    def __init__(self, app: Client, registry: ChatRegistry = None, outbound: OutboundScheduler = None,
+                 timers: TimerService = None):
         super().__init__(app)
-        self.chat_id = chat_id
+        self.registry = registry or default_chat_registry
+        self.outbound = outbound or default_outbound
+        self.timers = timers or default_timer_service
+        self.timers.register(self.LIFT, self.lift_restriction)
+        self.timers.register(self.REMINDER, self.send_reminder)
         self.register_handlers()
 
+    @staticmethod
+    def parse_departure(text: str):
+        """
+        Разбирает сообщение об отъезде.
+
+        Args:
+            text (str): Текст сообщения.
+
+        Returns:
+            timedelta или None, если это не сообщение об отъезде.
+        """
+        match = DEPARTURE_PATTERN.fullmatch(normalize(text))
+        if match is None:
+            return None
+        return DepartureHandler.duration_of(match)
+
+    @staticmethod
+    def duration_of(match) -> timedelta:
+        amount, unit = match.groups()
+        if amount is None:
+            return DEFAULT_DEPARTURE
+        unit_delta = timedelta(hours=1) if unit.startswith("час") else timedelta(days=1)
+        return min(int(amount) * unit_delta, MAX_DEPARTURE)
+
+    async def lift_restriction(self, client: Client, timer):
+        chat = await client.get_chat(timer["chat_id"])
+        await client.restrict_chat_member(
+            chat_id=timer["chat_id"],
+            user_id=timer["user_id"],
+            permissions=chat.permissions or ChatPermissions(can_send_messages=True)
+        )
+        self.outbound.post(client, timer["user_id"], "Ограничение снято, добро пожаловать обратно!", PRIORITY_REPLY)
+
+    async def send_reminder(self, client: Client, timer):
+        self.outbound.post(client, timer["user_id"], "Через час ограничение в группе будет снято.", PRIORITY_NOTICE)
+
     def register_handlers(self):
-        @self.app.on_message(filters.text & filters.group)
-        async def handle_departure(client, message):
-            if message.text.lower() == "я уехал" and message.chat.id == self.chat_id:
-                user_id = message.from_user.id
+        router = text_router(self.app)
+
+        async def handle_departure(client, message, match):
+            chat_id = message.chat.id
+            if not self.registry.is_invited(chat_id):
+                return
+            duration = self.duration_of(match)
+
+            user_id = message.from_user.id
+            try:
+                until_date = datetime.now() + duration
+                await client.restrict_chat_member(
+                    chat_id=chat_id,
+                    user_id=user_id,
+                    permissions=ChatPermissions(can_send_messages=False),
+                    until_date=until_date
+                )
+                lift_at = time.time() + duration.total_seconds()
+                await self.timers.schedule(self.LIFT, chat_id, user_id, lift_at)
+                if duration >= REMINDER_THRESHOLD:
+                    await self.timers.schedule(self.REMINDER, chat_id, user_id, lift_at - 3600)
+
+                self.outbound.post(
+                    client,
+                    chat_id,
+                    f"Уважаемый {user_full_name(message.from_user)} сообщил, что уехал, "
+                    f"и был временно исключен из группы.",
+                    PRIORITY_NOTICE
+                )
+                self.outbound.post(client, user_id, "Вы были временно исключены из группы.", PRIORITY_REPLY)
+            except Exception as e:
+                logger.error(f"Произошла ошибка: {e}")
+
+        async def handle_back(client, message):
+            user_id = message.from_user.id
+            timers = await get_user_timers(user_id, self.LIFT)
+            if not timers:
+                await message.reply_text("У вас нет действующих ограничений.")
+                return
+            for _, _, chat_id, _, _ in timers:
                 try:
-                    until_date = datetime.now() + timedelta(minutes=1)
-                    await client.restrict_chat_member(
-                        chat_id=self.chat_id,
-                        user_id=user_id,
-                        permissions=ChatPermissions(can_send_messages=False),
-                        until_date=until_date
-                    )
-                    await client.send_message(
-                        chat_id=self.chat_id,
-                        text=f"Уважаемый {message.from_user.full_name} сообщил, что уехал, и был временно исключен из группы."
-                    )
-                    await client.send_message(
-                        chat_id=user_id,
-                        text="Вы были временно исключены из группы."
-                    )
+                    await self.lift_restriction(client, {"chat_id": chat_id, "user_id": user_id})
+                    await cancel_user_timers(user_id, chat_id)
                 except Exception as e:
-                    logger.error(f"Произошла ошибка: {e}")
+                    logger.error(f"Не удалось досрочно снять ограничение с {user_id} в чате {chat_id}: {e}")
+
+        router.phrase(DEPARTURE_PATTERN.pattern, handle_departure, GROUP)
+        router.command("back", handle_back, PRIVATE)
+
+# Отдельная группа: сообщения записываются, даже если их обработала команда в группе 0
+MESSAGE_LOG_GROUP = 2
+SEARCH_RESULT_LENGTH = 200
+
 
 class MessageHandler(BaseHandler):
     def __init__(self, app: Client):
@@ -147,57 +299,316 @@ class MessageHandler(BaseHandler):
         self.register_handlers()
 
     def register_handlers(self):
-        @self.app.on_message(filters.text)
-        async def handle_message(message):
+        @self.app.on_message(filters.text, group=MESSAGE_LOG_GROUP)
+        async def handle_message(client, message):
+            if not message.from_user:
+                return
             user_id = message.from_user.id
             message_text = message.text
 
-            # Добавляем сообщение в базу данных
-            add_message(user_id, message_text)
+            # Добавляем сообщение в базу данных и в архив чата
+            await write_behind.add_message(user_id, message_text, chat_id=message.chat.id)
 
-class NewMemberHandler(BaseHandler):
-    def __init__(self, app: Client):
+
+class SearchHandler(BaseHandler):
+    """
+    Команда /search: поиск по архиву сообщений текущего чата.
+
+    Доступна только администраторам отслеживаемых чатов.
+    """
+
+    def __init__(self, app: Client, registry: ChatRegistry = None, membership_cache: MembershipCache = None,
+                 archive: MessageArchive = None, outbound: OutboundScheduler = None):
         super().__init__(app)
+        self.registry = registry or default_chat_registry
+        self.membership_cache = membership_cache or default_membership_cache
+        self.archive = archive or default_message_archive
+        self.outbound = outbound or default_outbound
         self.register_handlers()
 
+    @staticmethod
+    def format_results(results: list, elapsed: float) -> str:
+        """
+        Форматирует найденные сообщения для ответа.
+
+        Args:
+            results (list): Результаты MessageArchive.search.
+            elapsed (float): Время поиска в секундах.
+
+        Returns:
+            str: Текст ответа в HTML.
+        """
+        if not results:
+            return f"Ничего не найдено ({elapsed * 1000:.0f} мс)."
+        lines = [f"Найдено сообщений: {len(results)} ({elapsed * 1000:.0f} мс)"]
+        for result in results:
+            sent_at = datetime.fromtimestamp(result["sent_at"]).strftime("%d.%m.%Y %H:%M")
+            text = result["text"] or ""
+            if len(text) > SEARCH_RESULT_LENGTH:
+                text = text[:SEARCH_RESULT_LENGTH] + "…"
+            lines.append(
+                f'{sent_at} <a href="tg://user?id={result["user_id"]}">{result["user_id"]}</a>: {html.escape(text)}'
+            )
+        return "\n\n".join(lines)
+
     def register_handlers(self):
-        @self.app.on_chat_join_request()
-        async def handle_new_member(client, update):
-            user = update.from_user
-            chat_id = update.chat.id
+        async def search(client, message):
+            chat_id = message.chat.id
+            if not self.registry.is_tracked(chat_id):
+                return
+            if await self.membership_cache.get_status(client, chat_id, message.from_user.id) not in ADMIN_STATUSES:
+                self.outbound.post(client, chat_id, "Поиск доступен только администраторам.", PRIORITY_REPLY,
+                                   reply_to_message_id=message.id)
+                return
 
-            # Добавляем пользователя в базу данных
-            add_user(
-                user_id=user.id,
-                username=user.username,
-                full_name=user.first_name,
-                chat_id=chat_id
-            )
-            logger.info(f"User {user.first_name} added to chat {chat_id}")
+            query = " ".join(message.command[1:])
+            if not query:
+                self.outbound.post(client, chat_id, "Используйте формат: /search <слова>", PRIORITY_REPLY,
+                                   reply_to_message_id=message.id)
+                return
 
-            # Приветствуем нового участника
+            started = time.perf_counter()
             try:
-                await client.send_message(chat_id, f"Приветствую, {user.first_name}! Добро пожаловать!")
+                results = await self.archive.search(chat_id, query)
             except Exception as e:
-                logger.error(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                logger.error(f"Ошибка поиска по архиву чата {chat_id}: {e}")
+                self.outbound.post(client, chat_id, "Не удалось выполнить поиск.", PRIORITY_REPLY,
+                                   reply_to_message_id=message.id)
+                return
+            self.outbound.post(client, chat_id, self.format_results(results, time.perf_counter() - started),
+                               PRIORITY_REPLY, reply_to_message_id=message.id, parse_mode=ParseMode.HTML,
+                               disable_web_page_preview=True)
+
+        text_router(self.app).command("search", search, GROUP)
+
+
+class StatsHandler(BaseHandler):
+    """
+    Команда /stats: активность текущего чата по готовым сводкам.
+
+    «/stats» — итоги за сегодня и за неделю и самые активные участники дня;
+    «/stats csv [hourly]» — выгрузка сводки в CSV, отправляется администратору
+    в личные сообщения. Доступна только администраторам отслеживаемых чатов.
+    """
+
+    def __init__(self, app: Client, registry: ChatRegistry = None, membership_cache: MembershipCache = None,
+                 outbound: OutboundScheduler = None):
+        super().__init__(app)
+        self.registry = registry or default_chat_registry
+        self.membership_cache = membership_cache or default_membership_cache
+        self.outbound = outbound or default_outbound
+        self.register_handlers()
+
+    @staticmethod
+    def format_stats(stats: dict, users: dict, days: int = STATS_WINDOW_DAYS) -> str:
+        """
+        Форматирует статистику чата для ответа.
+
+        Args:
+            stats (dict): Результат get_chat_stats.
+            users (dict): Данные пользователей из get_users_by_ids.
+            days (int): Длина окна статистики в днях.
+
+        Returns:
+            str: Текст ответа в HTML.
+        """
+        lines = [
+            f"Сегодня (UTC): запросов {stats['today_requests']}, активных участников {stats['today_users']}",
+            f"За {days} дн.: запросов {stats['window_requests']}, "
+            f"в среднем {stats['average_users']:.1f} активных участников в день",
+        ]
+        if stats["top"]:
+            lines.append("\nСамые активные сегодня:")
+        for place, (user_id, requests) in enumerate(stats["top"], 1):
+            username, full_name = users.get(user_id, (None, None))
+            name = html.escape(full_name or (f"@{username}" if username else str(user_id)))
+            lines.append(f'{place}. <a href="tg://user?id={user_id}">{name}</a> — {requests}')
+        return "\n".join(lines)
+
+    async def send_export(self, client: Client, message, granularity: str):
+        chat_id = message.chat.id
+        path = os.path.join(tempfile.gettempdir(), f"activity_{chat_id}_{granularity}_{message.id}.csv")
+        try:
+            await export_activity_csv(path, chat_id, granularity)
+            # Файл идет через общую очередь: лимиты личного чата и повтор при FloodWait
+            await self.outbound.send_document(client, message.from_user.id, path,
+                                              file_name=f"activity_{chat_id}_{granularity}.csv")
+            text = "Выгрузка отправлена в личные сообщения."
+        except RPCError as e:
+            logger.warning(f"Не удалось отправить выгрузку активности чата {chat_id}: {e}")
+            text = "Не удалось отправить файл: начните диалог с ботом командой /start и повторите."
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        self.outbound.post(client, chat_id, text, PRIORITY_REPLY, reply_to_message_id=message.id)
+
+    def register_handlers(self):
+        async def stats(client, message):
+            chat_id = message.chat.id
+            if not self.registry.is_tracked(chat_id):
+                return
+            if await self.membership_cache.get_status(client, chat_id, message.from_user.id) not in ADMIN_STATUSES:
+                self.outbound.post(client, chat_id, "Статистика доступна только администраторам.", PRIORITY_REPLY,
+                                   reply_to_message_id=message.id)
+                return
+
+            arguments = [argument.lower() for argument in message.command[1:]]
+            if arguments[:1] == ["csv"]:
+                granularity = arguments[1] if len(arguments) > 1 else "daily"
+                if granularity not in GRANULARITIES:
+                    self.outbound.post(client, chat_id, "Используйте формат: /stats csv [hourly|daily]",
+                                       PRIORITY_REPLY, reply_to_message_id=message.id)
+                    return
+                await self.send_export(client, message, granularity)
+                return
+
+            result = await get_chat_stats(chat_id)
+            users = await get_users_by_ids([user_id for user_id, _ in result["top"]])
+            self.outbound.post(client, chat_id, self.format_stats(result, users), PRIORITY_REPLY,
+                               reply_to_message_id=message.id, parse_mode=ParseMode.HTML)
+
+        text_router(self.app).command("stats", stats, GROUP)
+
+class NewMemberHandler(BaseHandler):
+    def __init__(self, app: Client, join_requests: JoinRequestProcessor = None):
+        super().__init__(app)
+        self.join_requests = join_requests or default_join_request_processor
+        self.register_handlers()
+
+    def register_handlers(self):
+        @self.app.on_chat_join_request()
+        async def handle_new_member(client, update):
+            # Заявки проверяются, одобряются и приветствуются пакетами
+            await self.join_requests.submit(client, update)
+
 
 class ChatSelectionHandler(BaseHandler):
-    def __init__(self, app: Client):
+    def __init__(self, app: Client, registry: ChatRegistry = None, membership_cache: MembershipCache = None,
+                 invite_links: InviteLinkPool = None):
         super().__init__(app)
+        self.registry = registry or default_chat_registry
+        self.membership_cache = membership_cache or default_membership_cache
+        self.invite_links = invite_links or default_invite_link_pool
         self.register_handlers()
 
     def register_handlers(self):
-        @self.app.on_message(filters.command("set_chats"))
-        async def set_chats(message):
+        async def set_chats(client, message):
             try:
                 inviting_chat_id, invited_chat_id = map(int, message.text.split()[1:])
-                save_chat("INVITING_CHAT", inviting_chat_id)
-                save_chat("INVITED_CHAT", invited_chat_id)
-
-                update_chat_data(inviting_chat_id, invited_chat_id)
-
-                await message.reply_text(
-                    f"ID чатов установлены:\nINVITING_CHAT: {inviting_chat_id}\nINVITED_CHAT: {invited_chat_id}"
-                )
             except (IndexError, ValueError):
                 await message.reply_text("Используйте формат: /set_chats <inviting_chat_id> <invited_chat_id>")
+                return
+
+            # Пару может настроить только администратор обоих чатов
+            user_id = message.from_user.id
+            for chat_id in (inviting_chat_id, invited_chat_id):
+                if await self.membership_cache.get_status(client, chat_id, user_id) not in ADMIN_STATUSES:
+                    await message.reply_text("Настраивать чаты может только их администратор.")
+                    return
+
+            # Пара сразу доступна обработчикам, перезапуск не нужен
+            await self.registry.add_pair(inviting_chat_id, invited_chat_id)
+            self.invite_links.prefill(client, [invited_chat_id])
+            schedule_sync(client, [inviting_chat_id, invited_chat_id])
+
+            await message.reply_text(
+                f"ID чатов установлены:\nINVITING_CHAT: {inviting_chat_id}\nINVITED_CHAT: {invited_chat_id}"
+            )
+
+        text_router(self.app).command("set_chats", set_chats)
+
+
+def is_chat_member(member) -> bool:
+    if member is None:
+        return False
+    if member.status == ChatMemberStatus.RESTRICTED:
+        return bool(member.is_member)
+    return member.status in (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.MEMBER)
+
+
+class MembershipSyncHandler(BaseHandler):
+    """
+    Поддерживает таблицу пользователей в актуальном состоянии по событиям.
+
+    Вступления и выходы приходят как chat_member обновления и сразу
+    отражаются в базе и в счетчике контрольной точки синхронизации; смена
+    имени пользователя замечается по его сообщениям в группе.
+    """
+
+    def __init__(self, app: Client, registry: ChatRegistry = None, max_tracked_users: int = 100_000,
+                 membership_cache: MembershipCache = None, invite_links: InviteLinkPool = None,
+                 mentions: MentionRenderer = None):
+        super().__init__(app)
+        self.registry = registry or default_chat_registry
+        self.membership_cache = membership_cache or default_membership_cache
+        self.invite_links = invite_links or default_invite_link_pool
+        self.mentions = mentions or default_mention_renderer
+        self.max_tracked_users = max_tracked_users
+        self.known_users = OrderedDict()  # user_id -> (username, full_name)
+        self.register_handlers()
+
+    def _remember(self, user) -> bool:
+        """
+        Запоминает данные пользователя.
+
+        Returns:
+            bool: True, если данные изменились с прошлого раза.
+        """
+        snapshot = (user.username, user_full_name(user))
+        if self.known_users.get(user.id) == snapshot:
+            self.known_users.move_to_end(user.id)
+            return False
+        self.known_users[user.id] = snapshot
+        self.known_users.move_to_end(user.id)
+        if len(self.known_users) > self.max_tracked_users:
+            self.known_users.popitem(last=False)
+        return True
+
+    def register_handlers(self):
+        @self.app.on_chat_member_updated(group=1)
+        async def handle_member_update(client, update):
+            chat_id = update.chat.id
+            user = (update.new_chat_member or update.old_chat_member).user
+
+            # Кеш статусов обновляется для всех чатов, включая статус самого бота
+            if update.new_chat_member is None:
+                self.membership_cache.invalidate(chat_id, user.id)
+            else:
+                self.membership_cache.apply_update(chat_id, update.new_chat_member, is_self=user.is_self)
+
+            if not self.registry.is_tracked(chat_id):
+                return
+
+            was_member = is_chat_member(update.old_chat_member)
+            now_member = is_chat_member(update.new_chat_member)
+
+            try:
+                # Счетчик учитывает и ботов, так же как get_chat_members_count
+                if now_member and not was_member:
+                    await adjust_sync_checkpoint(chat_id, 1)
+                elif was_member and not now_member:
+                    await adjust_sync_checkpoint(chat_id, -1)
+
+                if now_member and not was_member and update.invite_link:
+                    self.invite_links.record_join(chat_id, update.invite_link.invite_link, user.id)
+
+                if user.is_bot:
+                    return
+                if now_member:
+                    self._remember(user)
+                    await upsert_users([(user.id, user.username, user_full_name(user), chat_id)])
+                elif was_member:
+                    self.known_users.pop(user.id, None)
+                    await remove_chat_member(user.id, chat_id)
+                if now_member != was_member:
+                    self.mentions.invalidate(chat_id)
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации участника {user.id} чата {chat_id}: {e}")
+
+        @self.app.on_message(filters.group & ~filters.service, group=1)
+        async def track_user_changes(client, message):
+            user = message.from_user
+            if not user or user.is_bot or not self.registry.is_tracked(message.chat.id):
+                return
+            if self._remember(user):
+                await upsert_users([(user.id, user.username, user_full_name(user), message.chat.id)])
\ No newline at end of file
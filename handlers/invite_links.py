@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+
+from logger import setup_logger
+from metrics import registry
+
+logger = setup_logger()
+
+POOL_SIZE = int(os.getenv("INVITE_POOL_SIZE", "20"))
+LOW_WATERMARK = int(os.getenv("INVITE_POOL_LOW_WATERMARK", "5"))
+LINK_TTL = float(os.getenv("INVITE_LINK_TTL", str(24 * 3600)))
+MEMBER_LIMIT = int(os.getenv("INVITE_LINK_MEMBER_LIMIT", "1"))
+# Ссылку с меньшим остатком срока действия не выдаем
+MIN_REMAINING = 600
+MAX_TRACKED_LINKS = 10_000
+
+
+class InviteLinkPool:
+    """
+    Пул заранее созданных именованных пригласительных ссылок.
+
+    Ссылки создаются через create_chat_invite_link с ограничением по числу
+    вступлений и сроку действия, выдаются из памяти и пополняются в фоне,
+    когда их становится меньше low_watermark. Повторный запрос того же
+    пользователя возвращает уже выданную ему ссылку, пока она действует.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, low_watermark: int = LOW_WATERMARK,
+                 link_ttl: float = LINK_TTL, member_limit: int = MEMBER_LIMIT):
+        self.pool_size = pool_size
+        self.low_watermark = low_watermark
+        self.link_ttl = link_ttl
+        self.member_limit = member_limit
+        self._links = {}  # chat_id -> deque[(invite_link, expires_at)]
+        self._refill_tasks = {}
+        self._counter = 0
+        self.issued = OrderedDict()  # (chat_id, user_id) -> (invite_link, expires_at)
+        self.usage = OrderedDict()  # invite_link -> {"user_id", "issued_at", "joined"}
+
+        self.available = registry.gauge("invite_pool_available", "Готовых пригласительных ссылок")
+        self.created = registry.counter("invite_links_created_total", "Создано пригласительных ссылок")
+        self.pool_misses = registry.counter("invite_pool_misses_total", "Ссылка создана на горячем пути")
+
+    def _update_gauge(self):
+        self.available.set(sum(len(links) for links in self._links.values()))
+
+    async def _create(self, client: Client, chat_id: int):
+        self._counter += 1
+        expires_at = time.time() + self.link_ttl
+        link = await client.create_chat_invite_link(
+            chat_id,
+            name=f"bot-{int(time.time())}-{self._counter}"[:32],
+            expire_date=datetime.fromtimestamp(expires_at),
+            member_limit=self.member_limit
+        )
+        self.created.inc()
+        return link.invite_link, expires_at
+
+    async def refill(self, client: Client, chat_id: int):
+        """
+        Пополняет пул ссылок чата до pool_size.
+
+        Args:
+            client (Client): Экземпляр Pyrogram клиента.
+            chat_id (int): ID чата.
+        """
+        links = self._links.setdefault(chat_id, deque())
+        while len(links) < self.pool_size:
+            try:
+                links.append(await self._create(client, chat_id))
+                self._update_gauge()
+            except FloodWait as e:
+                logger.warning(f"FloodWait при создании ссылки для чата {chat_id}: ждем {e.value} с")
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                logger.error(f"Не удалось создать пригласительную ссылку для чата {chat_id}: {e}")
+                return
+
+    def schedule_refill(self, client: Client, chat_id: int):
+        task = self._refill_tasks.get(chat_id)
+        if task is None or task.done():
+            self._refill_tasks[chat_id] = asyncio.create_task(self.refill(client, chat_id))
+
+    def prefill(self, client: Client, chat_ids):
+        for chat_id in chat_ids:
+            if chat_id:
+                self.schedule_refill(client, chat_id)
+
+    async def acquire(self, client: Client, chat_id: int, user_id: int) -> str:
+        """
+        Выдает пригласительную ссылку пользователю.
+
+        Args:
+            client (Client): Экземпляр Pyrogram клиента.
+            chat_id (int): ID чата, в который приглашаем.
+            user_id (int): ID пользователя, запросившего ссылку.
+
+        Returns:
+            str: Пригласительная ссылка.
+        """
+        now = time.time()
+        issued = self.issued.get((chat_id, user_id))
+        if issued is not None and issued[1] - now > MIN_REMAINING:
+            return issued[0]
+
+        links = self._links.setdefault(chat_id, deque())
+        entry = None
+        while links:
+            candidate = links.popleft()
+            if candidate[1] - now > MIN_REMAINING:
+                entry = candidate
+                break
+        if entry is None:
+            # Пул пуст: создаем ссылку сразу, чтобы не заставлять пользователя ждать
+            self.pool_misses.inc()
+            entry = await self._create(client, chat_id)
+
+        self._track(chat_id, user_id, entry, now)
+        self._update_gauge()
+        if len(links) < self.low_watermark:
+            self.schedule_refill(client, chat_id)
+        return entry[0]
+
+    def _track(self, chat_id, user_id, entry, now):
+        self.issued[(chat_id, user_id)] = entry
+        self.usage[entry[0]] = {"user_id": user_id, "issued_at": now, "joined": 0}
+        for tracked in (self.issued, self.usage):
+            while len(tracked) > MAX_TRACKED_LINKS:
+                tracked.popitem(last=False)
+
+    def record_join(self, chat_id: int, invite_link: str, user_id: int):
+        """
+        Отмечает вступление по выданной ссылке.
+
+        Args:
+            chat_id (int): ID чата.
+            invite_link (str): Ссылка, по которой вступил пользователь.
+            user_id (int): ID вступившего пользователя.
+        """
+        usage = self.usage.get(invite_link)
+        if usage is None:
+            return
+        usage["joined"] += 1
+        issued_to = usage["user_id"]
+        if usage["joined"] >= self.member_limit:
+            self.issued.pop((chat_id, issued_to), None)
+        logger.info(f"Пользователь {user_id} вступил в чат {chat_id} по ссылке, выданной {issued_to}")
+
+
+invite_link_pool = InviteLinkPool()
@@ -0,0 +1,268 @@
+import asyncio
+import os
+import time
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait, RPCError
+
+from config import ChatRegistry, chat_registry as default_chat_registry, iterate_users_in_chat, upsert_users, \
+    user_full_name
+from handlers.membership_cache import MembershipCache, membership_cache as default_membership_cache
+from handlers.mentions import MentionRenderer, mention_renderer as default_mention_renderer
+from handlers.outbound import (OutboundScheduler, PRIORITY_GREETING, TokenBucket, greeting_text,
+                               outbound as default_outbound)
+from logger import setup_logger
+from metrics import registry as metrics_registry
+
+logger = setup_logger()
+
+# Пакет собирается, пока не наберется BATCH_SIZE заявок или не пройдет BATCH_WINDOW секунд
+BATCH_SIZE = int(os.getenv("JOIN_BATCH_SIZE", "100"))
+BATCH_WINDOW = float(os.getenv("JOIN_BATCH_WINDOW", "2.0"))
+MAX_QUEUED = int(os.getenv("JOIN_MAX_QUEUED", "10000"))
+# Темп вызовов approve/decline: Telegram отвечает FloodWait на всплески
+DECISION_RATE = float(os.getenv("JOIN_DECISION_RATE", "20"))
+DECISION_BURST = int(os.getenv("JOIN_DECISION_BURST", "20"))
+# Сколько заявок пакета проверяется и решается одновременно
+MAX_IN_FLIGHT = int(os.getenv("JOIN_MAX_IN_FLIGHT", "8"))
+# Отклонять заявки тех, кого нет в приглашающем чате; 0 — оставлять их администраторам
+DECLINE_UNKNOWN = os.getenv("JOIN_DECLINE_UNKNOWN", "1") == "1"
+# Как долго считать актуальным индекс участников приглашающего чата
+INDEX_TTL = float(os.getenv("JOIN_INDEX_TTL", "600"))
+
+APPROVE = "approve"
+DECLINE = "decline"
+SKIP = "skip"
+# Метка остановки в очереди заявок
+_STOP = object()
+
+
+class JoinRequest:
+    __slots__ = ("client", "chat_id", "user", "received_at")
+
+    def __init__(self, client: Client, chat_id: int, user, received_at: float):
+        self.client = client
+        self.chat_id = chat_id
+        self.user = user
+        self.received_at = received_at
+
+
+class JoinRequestProcessor:
+    """
+    Пакетная обработка заявок на вступление.
+
+    Заявки складываются в очередь и разбираются пакетами. Заявка
+    одобряется, если пользователь состоит в приглашающем чате пары: это
+    проверяется по индексу участников (множество ID, загружаемое потоково
+    из chat_members и живущее INDEX_TTL секунд), а при промахе — через
+    MembershipCache, т. е. вызовом API только для тех, кого нет в базе.
+    Остальные заявки отклоняются (или остаются администраторам при
+    decline_unknown=False). Вызовы approve/decline идут с заданным темпом;
+    одобренные записываются в базу одной транзакцией, и на пакет
+    отправляется одно общее приветствие на чат.
+    """
+
+    def __init__(self, registry: ChatRegistry = None, membership_cache: MembershipCache = None,
+                 mentions: MentionRenderer = None, outbound: OutboundScheduler = None,
+                 batch_size: int = BATCH_SIZE, batch_window: float = BATCH_WINDOW, max_queued: int = MAX_QUEUED,
+                 decision_rate: float = DECISION_RATE, decision_burst: int = DECISION_BURST,
+                 max_in_flight: int = MAX_IN_FLIGHT, decline_unknown: bool = DECLINE_UNKNOWN,
+                 index_ttl: float = INDEX_TTL):
+        self.registry = registry or default_chat_registry
+        self.membership_cache = membership_cache or default_membership_cache
+        self.mentions = mentions or default_mention_renderer
+        self.outbound = outbound or default_outbound
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_queued = max_queued
+        self.decline_unknown = decline_unknown
+        self.index_ttl = index_ttl
+        self.bucket = TokenBucket(decision_rate, decision_burst)
+        self.max_in_flight = max_in_flight
+        self._index = {}  # inviting_chat_id -> (expires_at, set(user_id))
+        self._index_lock = asyncio.Lock()
+        self._queue = None
+        self._task = None
+
+        self.received = metrics_registry.counter("join_requests_received_total", "Получено заявок на вступление")
+        self.decided = {
+            decision: metrics_registry.counter("join_requests_decided_total", "Обработано заявок на вступление",
+                                       labels={"decision": decision})
+            for decision in (APPROVE, DECLINE, SKIP)
+        }
+        self.failed = metrics_registry.counter("join_requests_failed_total",
+                                               "Ошибок при одобрении или отклонении заявок")
+        self.queue_depth = metrics_registry.gauge("join_requests_queue_depth", "Заявок ожидает обработки")
+        self.batch_sizes = metrics_registry.histogram("join_request_batch_size", "Заявок в пакете",
+                                              buckets=(1, 5, 10, 25, 50, 100, 250, 500))
+        self.latency = metrics_registry.histogram("join_request_latency_seconds", "Время от заявки до решения")
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_queued)
+        return self._queue
+
+    async def submit(self, client: Client, request):
+        """
+        Ставит заявку в очередь; при переполнении ждет места.
+
+        Args:
+            client (Client): Экземпляр Pyrogram клиента.
+            request: ChatJoinRequest.
+        """
+        self.received.inc()
+        await self._get_queue().put(JoinRequest(client, request.chat.id, request.from_user, time.monotonic()))
+        self.queue_depth.set(self._get_queue().qsize())
+
+    async def _collect(self) -> list:
+        queue = self._get_queue()
+        batch = [await queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self.queue_depth.set(queue.qsize())
+        return batch
+
+    async def _members_of(self, chat_id: int) -> set:
+        entry = self._index.get(chat_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        # Заявки пакета проверяются параллельно, а индекс загружается один раз
+        async with self._index_lock:
+            entry = self._index.get(chat_id)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            members = {user_id async for user_id, _, _ in iterate_users_in_chat(chat_id)}
+            self._index[chat_id] = (time.monotonic() + self.index_ttl, members)
+            return members
+
+    def invalidate(self, chat_id: int = None):
+        if chat_id is None:
+            self._index.clear()
+        else:
+            self._index.pop(chat_id, None)
+
+    async def decide(self, request: JoinRequest) -> str:
+        """
+        Решение по заявке: APPROVE, DECLINE или SKIP (чат не отслеживается
+        или заявку оставляют администраторам).
+        """
+        pair = self.registry.by_invited(request.chat_id)
+        if pair is None:
+            return SKIP
+        members = await self._members_of(pair.inviting_chat_id)
+        if request.user.id in members:
+            return APPROVE
+        # Пользователь мог вступить после загрузки индекса
+        if await self.membership_cache.is_member(request.client, pair.inviting_chat_id, request.user.id):
+            members.add(request.user.id)
+            return APPROVE
+        return DECLINE if self.decline_unknown else SKIP
+
+    async def _apply(self, request: JoinRequest, decision: str) -> bool:
+        method = (request.client.approve_chat_join_request if decision == APPROVE
+                  else request.client.decline_chat_join_request)
+        for _ in range(2):
+            delay = self.bucket.delay()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self.bucket.delay()
+            self.bucket.consume()
+            try:
+                await method(request.chat_id, request.user.id)
+                return True
+            except FloodWait as e:
+                self.bucket.block(e.value)
+                logger.warning(f"FloodWait {e.value} с при обработке заявок на вступление")
+            except RPCError as e:
+                # Например, заявку уже рассмотрел администратор
+                logger.warning(f"Заявка {request.user.id} в чат {request.chat_id} не обработана: {e}")
+                return False
+        return False
+
+    async def process(self, batch: list):
+        """
+        Обрабатывает пакет заявок.
+
+        Args:
+            batch (list): Заявки JoinRequest.
+        """
+        self.batch_sizes.observe(len(batch))
+        # Повторные заявки одного пользователя в чат обрабатываются один раз
+        unique = {}
+        for request in batch:
+            unique[(request.chat_id, request.user.id)] = request
+
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def handle(request: JoinRequest) -> str:
+            async with semaphore:
+                try:
+                    decision = await self.decide(request)
+                    if decision != SKIP and not await self._apply(request, decision):
+                        self.failed.inc()
+                        return None
+                except Exception as e:
+                    self.failed.inc()
+                    logger.error(f"Ошибка обработки заявки {request.user.id} в чат {request.chat_id}: {e}")
+                    return None
+            self.decided[decision].inc()
+            self.latency.observe(time.monotonic() - request.received_at)
+            return decision
+
+        requests = list(unique.values())
+        decisions = await asyncio.gather(*(handle(request) for request in requests))
+        approved = {}  # chat_id -> [JoinRequest]
+        for request, decision in zip(requests, decisions):
+            if decision == APPROVE:
+                approved.setdefault(request.chat_id, []).append(request)
+
+        if not approved:
+            return
+        await upsert_users([
+            (request.user.id, request.user.username, user_full_name(request.user), chat_id)
+            for chat_id, chat_requests in approved.items() for request in chat_requests
+        ])
+        for chat_id, chat_requests in approved.items():
+            self.mentions.invalidate(chat_id)
+            names = [request.user.first_name for request in chat_requests]
+            self.outbound.post(chat_requests[0].client, chat_id, greeting_text(names), PRIORITY_GREETING)
+            logger.info(f"Одобрено заявок в чат {chat_id}: {len(chat_requests)}")
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+            try:
+                if batch:
+                    await self.process(batch)
+            except Exception as e:
+                logger.error(f"Ошибка обработки пакета заявок на вступление: {e}", exc_info=True)
+            if stopping:
+                return
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает обработку, предварительно разобрав заявки из очереди.
+        """
+        if self._task is None:
+            return
+        # Метка в конце очереди: все заявки до нее будут обработаны
+        await self._get_queue().put(_STOP)
+        await self._task
+        self._task = None
+        self.queue_depth.set(0)
+
+join_request_processor = JoinRequestProcessor()
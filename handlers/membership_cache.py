@@ -0,0 +1,132 @@
+import os
+import time
+from collections import OrderedDict
+
+from pyrogram import Client
+from pyrogram.enums import ChatMemberStatus
+from pyrogram.errors import UserNotParticipant
+
+from metrics import registry
+
+MEMBER_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "300"))
+BOT_STATUS_TTL = float(os.getenv("BOT_STATUS_CACHE_TTL", "3600"))
+MAX_ENTRIES = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "50000"))
+
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+MEMBER_STATUSES = (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+SELF = "me"
+
+# Признак отсутствия записи в кеше (None означает «не состоит в чате»)
+MISSING = object()
+
+
+class MembershipCache:
+    """
+    LRU-кеш статусов участников с ограниченным временем жизни.
+
+    Ключ — (chat_id, user_id); статус самого бота хранится под ключом
+    (chat_id, "me") с более долгим TTL. Записи обновляются по событиям
+    chat_member (см. MembershipSyncHandler), поэтому повторные запросы
+    обслуживаются из памяти.
+    """
+
+    def __init__(self, ttl: float = MEMBER_TTL, bot_ttl: float = BOT_STATUS_TTL, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.bot_ttl = bot_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (chat_id, user_id) -> (expires_at, status)
+
+        self.hits = registry.counter("membership_cache_hits_total", "Попадания в кеш участников")
+        self.misses = registry.counter("membership_cache_misses_total", "Промахи кеша участников")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, chat_id: int, user_id):
+        """
+        Возвращает закешированный статус.
+
+        Returns:
+            Статус ChatMemberStatus, None для не состоящих в чате
+            или MISSING, если записи нет или она устарела.
+        """
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, status = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return status
+
+    def set(self, chat_id: int, user_id, status):
+        ttl = self.bot_ttl if user_id == SELF else self.ttl
+        key = (chat_id, user_id)
+        self._entries[key] = (time.monotonic() + ttl, status)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, chat_id: int, user_id=None):
+        if user_id is not None:
+            self._entries.pop((chat_id, user_id), None)
+            return
+        for key in [key for key in self._entries if key[0] == chat_id]:
+            del self._entries[key]
+
+    def apply_update(self, chat_id: int, member, is_self: bool = False):
+        """
+        Обновляет запись по событию chat_member.
+
+        Args:
+            chat_id (int): ID чата.
+            member: Новый ChatMember или None.
+            is_self (bool): Событие касается самого бота.
+        """
+        if member is None:
+            return
+        user_id = SELF if is_self else member.user.id
+        status = member.status
+        if status == ChatMemberStatus.RESTRICTED and member.is_member:
+            status = ChatMemberStatus.MEMBER
+        self.set(chat_id, user_id, status)
+
+    async def get_status(self, client: Client, chat_id: int, user_id):
+        """
+        Возвращает статус участника, обращаясь к Telegram только при промахе.
+
+        Args:
+            client (Client): Экземпляр Pyrogram клиента.
+            chat_id (int): ID чата.
+            user_id: ID пользователя или "me".
+
+        Returns:
+            Статус ChatMemberStatus или None, если пользователь не в чате.
+        """
+        status = self.get(chat_id, user_id)
+        if status is not MISSING:
+            self.hits.inc()
+            return status
+
+        self.misses.inc()
+        try:
+            member = await client.get_chat_member(chat_id, user_id)
+            status = member.status
+            if status == ChatMemberStatus.RESTRICTED and member.is_member:
+                status = ChatMemberStatus.MEMBER
+        except UserNotParticipant:
+            status = None
+        self.set(chat_id, user_id, status)
+        return status
+
+    async def is_member(self, client: Client, chat_id: int, user_id) -> bool:
+        return await self.get_status(client, chat_id, user_id) in MEMBER_STATUSES
+
+    async def bot_is_admin(self, client: Client, chat_id: int) -> bool:
+        return await self.get_status(client, chat_id, SELF) in ADMIN_STATUSES
+
+
+membership_cache = MembershipCache()
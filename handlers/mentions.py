@@ -0,0 +1,125 @@
+import html
+import os
+import time
+
+from pyrogram import Client
+from pyrogram.enums import ParseMode
+
+from config import iterate_users_in_chat
+from handlers.outbound import OutboundScheduler, PRIORITY_NOTICE, outbound as default_outbound
+from logger import setup_logger
+
+logger = setup_logger()
+
+# Лимит Telegram на длину текста сообщения (в единицах UTF-16)
+MESSAGE_LIMIT = 4096
+CACHE_TTL = float(os.getenv("MENTION_CACHE_TTL", "3600"))
+
+
+def _visible_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def render_mention(user_id: int, username: str, full_name: str):
+    """
+    Готовит упоминание пользователя в HTML-разметке.
+
+    Returns:
+        tuple: HTML-упоминание и длина видимого текста.
+    """
+    if username:
+        mention = f"@{username}"
+        return mention, _visible_length(mention)
+    name = full_name or str(user_id)
+    return f'<a href="tg://user?id={user_id}">{html.escape(name)}</a>', _visible_length(name)
+
+
+def chunk_mentions(mentions, limit: int = MESSAGE_LIMIT, separator: str = " "):
+    """
+    Разбивает упоминания на части, каждая из которых помещается в одно сообщение.
+
+    Args:
+        mentions: Пары (HTML-упоминание, длина видимого текста).
+        limit (int): Максимальная длина видимого текста части.
+        separator (str): Разделитель упоминаний.
+
+    Returns:
+        list: Готовые тексты сообщений.
+    """
+    chunks = []
+    current = []
+    current_length = 0
+    for mention, length in mentions:
+        added = length if not current else length + len(separator)
+        if current and current_length + added > limit:
+            chunks.append(separator.join(current))
+            current, current_length = [], 0
+            added = length
+        current.append(mention)
+        current_length += added
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+class MentionRenderer:
+    """
+    Упоминания всех участников чата для массовых оповещений.
+
+    Разбитый на сообщения список упоминаний кешируется по чату и
+    сбрасывается при вступлении или выходе участников. Пользователи без
+    username упоминаются ссылкой tg://user?id=..., поэтому уведомление
+    получают все. Части отправляются через OutboundScheduler, который
+    соблюдает лимиты чата и повторяет отправку после FloodWait.
+    """
+
+    def __init__(self, cache_ttl: float = CACHE_TTL, outbound: OutboundScheduler = None):
+        self.cache_ttl = cache_ttl
+        self.outbound = outbound or default_outbound
+        self._cache = {}  # chat_id -> (expires_at, chunks)
+
+    def invalidate(self, chat_id: int):
+        self._cache.pop(chat_id, None)
+
+    async def render(self, chat_id: int):
+        """
+        Возвращает упоминания участников чата, разбитые на сообщения.
+
+        Args:
+            chat_id (int): ID чата.
+
+        Returns:
+            list: Тексты сообщений в HTML-разметке.
+        """
+        cached = self._cache.get(chat_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        # Участники читаются страницами: большой чат не занимает соединение пула целиком
+        chunks = chunk_mentions([render_mention(*user) async for user in iterate_users_in_chat(chat_id)])
+        self._cache[chat_id] = (time.monotonic() + self.cache_ttl, chunks)
+        return chunks
+
+    async def broadcast(self, client: Client, chat_id: int, text: str) -> int:
+        """
+        Ставит в очередь текст и упоминания всех участников чата.
+
+        Доставки не дожидается: рассылка в большом чате растягивается на
+        минуты из-за лимитов, и обработчик обновлений не должен быть занят
+        все это время. Ошибки отправки записываются в лог планировщиком.
+
+        Args:
+            client (Client): Экземпляр Pyrogram клиента.
+            chat_id (int): ID чата.
+            text (str): Текст оповещения.
+
+        Returns:
+            int: Количество сообщений, поставленных в очередь.
+        """
+        messages = [html.escape(text)] + await self.render(chat_id)
+        # Планировщик сохраняет порядок внутри приоритета и соблюдает лимиты чата
+        for message in messages:
+            self.outbound.post(client, chat_id, message, PRIORITY_NOTICE, parse_mode=ParseMode.HTML)
+        return len(messages)
+
+mention_renderer = MentionRenderer()
@@ -0,0 +1,361 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import OrderedDict
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+
+from logger import setup_logger
+from metrics import registry
+
+logger = setup_logger()
+
+# Приоритеты: меньше — раньше. Ответы в личку идут впереди уведомлений и приветствий
+PRIORITY_REPLY = 0
+PRIORITY_NOTICE = 1
+PRIORITY_GREETING = 2
+
+# Лимиты Telegram для ботов: ~30 сообщений/с всего, 1/с в личный чат, 20/мин в группу
+GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+PRIVATE_RATE = float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))
+GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+GROUP_BURST = int(os.getenv("OUTBOUND_GROUP_BURST", "5"))
+MAX_IN_FLIGHT = int(os.getenv("OUTBOUND_MAX_IN_FLIGHT", "8"))
+# Сколько секунд при остановке ждать отправки уже поставленных сообщений
+DRAIN_TIMEOUT = float(os.getenv("OUTBOUND_DRAIN_TIMEOUT", "5.0"))
+MAX_RETRIES = 3
+# Сколько имен перечислять в объединенном приветствии
+MAX_GREETING_NAMES = 50
+MAX_TRACKED_CHATS = 10_000
+
+
+# Текст общего приветствия; после MAX_GREETING_NAMES имен указывается только их количество
+def greeting_text(names: list) -> str:
+    if len(names) == 1:
+        return f"Приветствую, {names[0]}! Добро пожаловать!"
+    if len(names) <= MAX_GREETING_NAMES:
+        return f"Приветствую, {', '.join(names[:-1])} и {names[-1]}! Добро пожаловать!"
+    shown = ", ".join(names[:MAX_GREETING_NAMES])
+    return f"Приветствую, {shown} и еще {len(names) - MAX_GREETING_NAMES}! Добро пожаловать!"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """
+        Возвращает, сколько секунд ждать до появления токена (0 — можно отправлять).
+        """
+        now = self.clock()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self):
+        self._refill(self.clock())
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+class OutboundMessage:
+    __slots__ = ("client", "chat_id", "text", "kwargs", "priority", "future", "attempts", "enqueued_at", "method")
+
+    def __init__(self, client, chat_id, text, kwargs, priority, future, method="send_message"):
+        self.client = client
+        self.chat_id = chat_id
+        # Для send_message — текст, для send_document — путь к файлу
+        self.text = text
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundScheduler:
+    """
+    Центральная очередь исходящих сообщений.
+
+    Сообщения выбираются по приоритету (в порядке поступления внутри
+    приоритета) и отправляются, когда есть токены в глобальном ведре и в
+    ведре конкретного чата. Сообщение, чей чат еще не готов, откладывается
+    до нужного момента и не задерживает сообщения в другие чаты. FloodWait
+    блокирует ведро чата на указанное время, после чего отправка
+    повторяется.
+
+    В каждый чат одновременно отправляется не больше одного сообщения:
+    пока оно в пути или отложено, следующие сообщения этого чата ждут в
+    отдельной куче и поступают в очередь по одному, поэтому части рассылки
+    приходят в том порядке, в каком были поставлены.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, private_rate: float = PRIVATE_RATE,
+                 group_rate: float = GROUP_RATE, group_burst: int = GROUP_BURST,
+                 max_in_flight: int = MAX_IN_FLIGHT):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_in_flight = max_in_flight
+        self._chat_buckets = OrderedDict()
+        self._ready = []  # (priority, seq, message)
+        self._deferred = []  # (ready_at, priority, seq, message)
+        self._owners = {}  # chat_id -> seq сообщения, которое сейчас отправляется в чат
+        self._parked = {}  # chat_id -> [(priority, seq, message)], ждущие своей очереди
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._in_flight = None
+        self._deliveries = set()
+        self._task = None
+
+        self.queue_depth = registry.gauge("outbound_queue_depth", "Исходящих сообщений в очереди")
+        self.sent = registry.counter("outbound_sent_total", "Отправлено сообщений")
+        self.failed = registry.counter("outbound_failed_total", "Не удалось отправить сообщений")
+        self.flood_waits = registry.counter("outbound_flood_waits_total", "Получено FloodWait")
+        self.queue_latency = registry.histogram("outbound_queue_seconds", "Время от постановки в очередь до отправки")
+
+    def set_share(self, share: float):
+        """
+        Оставляет процессу долю общих лимитов Telegram.
+
+        Лимиты действуют на бота целиком, поэтому при N процессах-обработчиках
+        каждый получает 1/N глобального лимита и лимита на группу.
+
+        Args:
+            share (float): Доля от 0 до 1.
+        """
+        rate = self.global_bucket.rate * share
+        self.global_bucket = TokenBucket(rate, max(1.0, rate))
+        self.group_rate *= share
+        self.group_burst = max(1, int(self.group_burst * share))
+        self._chat_buckets.clear()
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if chat_id > 0:
+                bucket = TokenBucket(self.private_rate, 1)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._chat_buckets[chat_id] = bucket
+            while len(self._chat_buckets) > MAX_TRACKED_CHATS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+            self._task = asyncio.create_task(self._run())
+
+    def _update_depth(self):
+        parked = sum(len(entries) for entries in self._parked.values())
+        self.queue_depth.set(len(self._ready) + len(self._deferred) + parked)
+
+    def _release(self, chat_id: int):
+        # Чат свободен: в очередь возвращается следующее по порядку сообщение этого чата
+        self._owners.pop(chat_id, None)
+        parked = self._parked.get(chat_id)
+        if parked:
+            heapq.heappush(self._ready, heapq.heappop(parked))
+            if not parked:
+                del self._parked[chat_id]
+            self._wakeup.set()
+
+    def submit(self, client: Client, chat_id: int, text: str, priority: int = PRIORITY_NOTICE,
+               **kwargs) -> asyncio.Future:
+        """
+        Ставит сообщение в очередь, не дожидаясь отправки.
+
+        Args:
+            client (Client): Экземпляр Pyrogram клиента.
+            chat_id (int): ID чата.
+            text (str): Текст сообщения.
+            priority (int): Приоритет (PRIORITY_*).
+            **kwargs: Дополнительные аргументы send_message.
+
+        Returns:
+            asyncio.Future: Завершится отправленным сообщением или исключением.
+        """
+        return self._enqueue(client, chat_id, text, priority, kwargs)
+
+    def _enqueue(self, client: Client, chat_id: int, content, priority: int, kwargs: dict,
+                 method: str = "send_message") -> asyncio.Future:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        message = OutboundMessage(client, chat_id, content, kwargs, priority, future, method)
+        heapq.heappush(self._ready, (priority, next(self._seq), message))
+        self._update_depth()
+        self._wakeup.set()
+        return future
+
+    def post(self, client: Client, chat_id: int, text: str, priority: int = PRIORITY_NOTICE, **kwargs):
+        """
+        Ставит сообщение в очередь; ошибка отправки будет записана в лог.
+        """
+        self.submit(client, chat_id, text, priority, **kwargs).add_done_callback(self._log_failure)
+
+    async def send(self, client: Client, chat_id: int, text: str, priority: int = PRIORITY_NOTICE, **kwargs):
+        """
+        Ставит сообщение в очередь и ждет его отправки.
+
+        Returns:
+            Message: Отправленное сообщение.
+        """
+        return await self.submit(client, chat_id, text, priority, **kwargs)
+
+    async def send_document(self, client: Client, chat_id: int, document: str, priority: int = PRIORITY_REPLY,
+                            **kwargs):
+        """
+        Ставит файл в очередь и ждет его отправки.
+
+        Файл проходит через те же лимиты и повторы при FloodWait, что и
+        сообщения, поэтому удалять его можно только после завершения.
+
+        Args:
+            client (Client): Экземпляр Pyrogram клиента.
+            chat_id (int): ID чата.
+            document (str): Путь к файлу.
+            priority (int): Приоритет (PRIORITY_*).
+            **kwargs: Дополнительные аргументы send_document.
+
+        Returns:
+            Message: Отправленное сообщение.
+        """
+        return await self._enqueue(client, chat_id, document, priority, kwargs, "send_document")
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Не удалось отправить сообщение: {future.exception()}")
+
+    def _promote_deferred(self, now: float):
+        while self._deferred and self._deferred[0][0] <= now:
+            _, priority, seq, message = heapq.heappop(self._deferred)
+            heapq.heappush(self._ready, (priority, seq, message))
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._promote_deferred(now)
+
+            if not self._ready:
+                timeout = self._deferred[0][0] - now if self._deferred else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            global_wait = self.global_bucket.delay()
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+                continue
+
+            priority, seq, message = heapq.heappop(self._ready)
+            owner = self._owners.get(message.chat_id)
+            if owner is None:
+                self._owners[message.chat_id] = seq
+            elif owner != seq:
+                # В чат уже отправляется сообщение: ждем его, чтобы не нарушить порядок
+                heapq.heappush(self._parked.setdefault(message.chat_id, []), (priority, seq, message))
+                continue
+            chat_wait = self._bucket(message.chat_id).delay()
+            if chat_wait > 0:
+                # Чат еще не готов: откладываем, не задерживая остальные чаты
+                heapq.heappush(self._deferred, (now + chat_wait, priority, seq, message))
+                continue
+
+            self.global_bucket.consume()
+            self._bucket(message.chat_id).consume()
+            self._update_depth()
+            await self._in_flight.acquire()
+            delivery = asyncio.create_task(self._deliver(priority, seq, message))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, priority: int, seq: int, message: OutboundMessage):
+        retry = False
+        try:
+            send = getattr(message.client, message.method)
+            result = await send(message.chat_id, message.text, **message.kwargs)
+            self.sent.inc()
+            self.queue_latency.observe(time.monotonic() - message.enqueued_at)
+            if not message.future.done():
+                message.future.set_result(result)
+        except FloodWait as e:
+            self.flood_waits.inc()
+            message.attempts += 1
+            self._bucket(message.chat_id).block(e.value)
+            if message.attempts > MAX_RETRIES:
+                self.failed.inc()
+                if not message.future.done():
+                    message.future.set_exception(e)
+                return
+            logger.warning(f"FloodWait для чата {message.chat_id}: повтор через {e.value} с")
+            # Сообщение остается текущим для чата, следующие ждут его повтора
+            retry = True
+            heapq.heappush(self._deferred, (time.monotonic() + e.value, priority, seq, message))
+            self._update_depth()
+            self._wakeup.set()
+        except Exception as e:
+            self.failed.inc()
+            if not message.future.done():
+                message.future.set_exception(e)
+        finally:
+            if not retry:
+                self._release(message.chat_id)
+            self._in_flight.release()
+
+    async def stop(self, drain_timeout: float = DRAIN_TIMEOUT):
+        """
+        Останавливает отправку.
+
+        Args:
+            drain_timeout (float): Сколько секунд ждать отправки уже поставленных
+                сообщений; не отправленные за это время отменяются.
+        """
+        if self._task is not None and drain_timeout > 0:
+            parked = [entry for entries in self._parked.values() for entry in entries]
+            pending = [entry[-1].future for entry in self._ready + self._deferred + parked] + list(self._deliveries)
+            if pending:
+                await asyncio.wait(pending, timeout=drain_timeout)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        parked = [entry for entries in self._parked.values() for entry in entries]
+        for entry in self._ready + self._deferred + parked:
+            entry[-1].future.cancel()
+        self._ready.clear()
+        self._deferred.clear()
+        self._parked.clear()
+        self._owners.clear()
+        self._update_depth()
+
+
+outbound = OutboundScheduler()
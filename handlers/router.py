@@ -0,0 +1,200 @@
+import re
+import time
+import weakref
+
+from pyrogram import Client, filters
+from pyrogram.enums import ChatType
+
+from instrumentation import handler_name
+from metrics import METRICS_ENABLED, registry
+
+PRIVATE = "private"
+GROUP = "group"
+GROUP_TYPES = (ChatType.GROUP, ChatType.SUPERGROUP)
+
+# Команда: «/name», «/name@bot», затем пробел или конец текста
+COMMAND_RE = re.compile(r"/([A-Za-z0-9_]+)(?:@([A-Za-z0-9_]+))?(?:\s+|$)")
+# Разбор аргументов как в filters.command Pyrogram: кавычки группируют слова
+ARGUMENT_RE = re.compile(r"([\"'])(.*?)(?<!\\)\1|(\S+)")
+# Фразы длиннее этого не сопоставляются: длинные сообщения не нормализуются
+MAX_PHRASE_LENGTH = 64
+
+
+def normalize(text: str) -> str:
+    """
+    Нормализация для сравнения фраз: регистр, «ё», лишние пробелы.
+    """
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+def _scope_of(chat) -> str:
+    if chat.type in (ChatType.PRIVATE, ChatType.BOT):
+        return PRIVATE
+    if chat.type in GROUP_TYPES:
+        return GROUP
+    return None
+
+
+class TextRouter:
+    """
+    Маршрутизатор текстовых сообщений: команды, фразы и диалоги.
+
+    Вместо отдельного обработчика Pyrogram с цепочкой фильтров на каждую
+    команду регистрируется один обработчик, который за один проход
+    определяет маршрут: команда ищется в словаре по имени, фразы
+    сопоставляются одним объединенным регулярным выражением по
+    нормализованному тексту, сообщения без совпадений проверяются
+    условиями диалогов (fallback). Вызывается только обработчик
+    найденного маршрута.
+
+    Команды заполняют message.command так же, как filters.command.
+    """
+
+    def __init__(self, instrumented: bool = METRICS_ENABLED):
+        self.instrumented = instrumented
+        self._commands = {}  # (имя, область) -> обработчик
+        self._phrases = []  # (шаблон, область, обработчик)
+        self._fallbacks = []  # (условие, область, обработчик)
+        self._phrase_re = None
+        self._route_time = {}
+        self.routing_time = registry.histogram("text_routing_seconds", "Время выбора маршрута для сообщения")
+
+    def command(self, name: str, callback, scope: str = None):
+        """
+        Регистрирует команду.
+
+        Args:
+            name (str): Имя команды без «/» (регистр не важен).
+            callback: async callback(client, message).
+            scope (str): PRIVATE, GROUP или None — любые чаты.
+        """
+        self._commands[(name.lower(), scope)] = callback
+
+    def phrase(self, pattern: str, callback, scope: str = None):
+        """
+        Регистрирует фразу.
+
+        Args:
+            pattern (str): Регулярное выражение для всего нормализованного текста.
+            callback: async callback(client, message, match).
+            scope (str): PRIVATE, GROUP или None — любые чаты.
+        """
+        self._phrases.append((re.compile(pattern), scope, callback))
+        self._phrase_re = None
+
+    def fallback(self, predicate, callback, scope: str = None):
+        """
+        Регистрирует обработчик сообщений без команды и фразы.
+
+        Args:
+            predicate: Синхронная проверка predicate(message) -> bool, выполняется в памяти.
+            callback: async callback(client, message).
+            scope (str): PRIVATE, GROUP или None — любые чаты.
+        """
+        self._fallbacks.append((predicate, scope, callback))
+
+    def _compile(self):
+        # Одна альтернатива на фразу; номер сработавшей группы — индекс маршрута
+        alternatives = "|".join(
+            f"(?P<p{index}>{pattern.pattern})" for index, (pattern, _, _) in enumerate(self._phrases)
+        )
+        self._phrase_re = re.compile(alternatives) if alternatives else re.compile(r"(?!)")
+
+    def _command_route(self, client: Client, message, scope: str):
+        match = COMMAND_RE.match(message.text)
+        if match is None:
+            return None
+        name, mention = match.groups()
+        if mention is not None:
+            username = getattr(client.me, "username", None) or ""
+            if mention.lower() != username.lower():
+                return None
+        name = name.lower()
+        callback = self._commands.get((name, scope)) or self._commands.get((name, None))
+        if callback is None:
+            return None
+        message.command = [name] + [
+            re.sub(r"\\([\"'])", r"\1", argument.group(2) or argument.group(3) or "")
+            for argument in ARGUMENT_RE.finditer(message.text, match.end())
+        ]
+        return callback, ()
+
+    def resolve(self, client: Client, message):
+        """
+        Выбирает маршрут для сообщения.
+
+        Returns:
+            tuple: (обработчик, дополнительные аргументы) или None.
+        """
+        text = message.text
+        scope = _scope_of(message.chat)
+        if text.startswith("/"):
+            route = self._command_route(client, message, scope)
+            if route is not None:
+                return route
+
+        if self._phrases and len(text) <= MAX_PHRASE_LENGTH:
+            if self._phrase_re is None:
+                self._compile()
+            match = self._phrase_re.fullmatch(normalize(text))
+            if match is not None:
+                pattern, route_scope, callback = self._phrases[int(match.lastgroup[1:])]
+                if route_scope is None or route_scope == scope:
+                    # Группы шаблона извлекаются только для сработавшей фразы
+                    return callback, (pattern.fullmatch(match.group(0)),)
+
+        for predicate, route_scope, callback in self._fallbacks:
+            if (route_scope is None or route_scope == scope) and predicate(message):
+                return callback, ()
+        return None
+
+    def _observe(self, callback, seconds: float):
+        histogram = self._route_time.get(callback)
+        if histogram is None:
+            histogram = self._route_time[callback] = registry.histogram(
+                "text_route_seconds", "Время обработки сообщения маршрутом", labels={"route": handler_name(callback)}
+            )
+        histogram.observe(seconds)
+
+    async def dispatch(self, client: Client, message):
+        if message.from_user is None:
+            return
+        if not self.instrumented:
+            route = self.resolve(client, message)
+            if route is not None:
+                await route[0](client, message, *route[1])
+            return
+
+        started = time.perf_counter()
+        route = self.resolve(client, message)
+        routed = time.perf_counter()
+        self.routing_time.observe(routed - started)
+        if route is None:
+            return
+        callback, args = route
+        try:
+            await callback(client, message, *args)
+        finally:
+            self._observe(callback, time.perf_counter() - routed)
+
+
+# Один маршрутизатор на клиента: обработчик Pyrogram регистрируется при первом обращении
+_routers = weakref.WeakKeyDictionary()
+
+
+def text_router(app: Client, group: int = 0) -> TextRouter:
+    """
+    Маршрутизатор текстовых сообщений клиента.
+
+    Args:
+        app (Client): Экземпляр Pyrogram клиента.
+        group (int): Группа обработчиков, в которой работает маршрутизатор.
+
+    Returns:
+        TextRouter: Маршрутизатор, общий для всех обработчиков этого клиента.
+    """
+    router = _routers.get(app)
+    if router is None:
+        router = _routers[app] = TextRouter()
+        app.on_message(filters.text, group=group)(router.dispatch)
+    return router
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+
+from pyrogram import Client
+
+from config.timers import delete_timers, get_due_timers, next_timer_due, retry_timers, schedule_timer
+from logger import setup_logger
+from metrics import registry
+
+logger = setup_logger()
+
+BATCH_SIZE = int(os.getenv("TIMER_BATCH_SIZE", "100"))
+CONCURRENCY = int(os.getenv("TIMER_CONCURRENCY", "10"))
+# Если таймеров нет, все равно проверяем базу раз в IDLE_CHECK секунд
+IDLE_CHECK = 300.0
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 60.0
+
+
+class TimerService:
+    """
+    Долговременные таймеры, хранящиеся в SQLite.
+
+    Таблица timers с индексом по due_at играет роль кучи: сервис спит до
+    MIN(due_at), затем выбирает наступившие таймеры пакетами по индексу и
+    выполняет обработчики, зарегистрированные для их вида. Таймеры
+    переживают перезапуск: после старта просроченные выполняются сразу.
+    Неудачная попытка переносится с задержкой, после MAX_ATTEMPTS таймер
+    удаляется.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY, idle_check: float = IDLE_CHECK):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.idle_check = idle_check
+        self._handlers = {}
+        self._client = None
+        self._wakeup = None
+        self._next_due = None
+        self._task = None
+
+        self.fired = registry.counter("timers_fired_total", "Выполнено таймеров")
+        self.failed = registry.counter("timers_failed_total", "Неудачных попыток выполнения таймеров")
+
+    def register(self, kind: str, handler):
+        """
+        Регистрирует обработчик вида таймера.
+
+        Args:
+            kind (str): Вид таймера.
+            handler: Корутина handler(client, timer), где timer — словарь с полями таймера.
+        """
+        self._handlers[kind] = handler
+
+    async def schedule(self, kind: str, chat_id: int, user_id: int, due_at: float, payload=None):
+        """
+        Ставит (или переносит) таймер.
+
+        Args:
+            kind (str): Вид таймера.
+            chat_id (int): ID чата.
+            user_id (int): ID пользователя.
+            due_at (float): Время срабатывания (unix time).
+            payload: Дополнительные данные, сериализуемые в JSON.
+        """
+        await schedule_timer(kind, chat_id, user_id, due_at, payload)
+        if self._wakeup is not None and (self._next_due is None or due_at < self._next_due):
+            self._wakeup.set()
+
+    def start(self, client: Client):
+        self._client = client
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self._next_due = await next_timer_due()
+                now = time.time()
+                if self._next_due is None or self._next_due > now:
+                    timeout = self.idle_check if self._next_due is None else min(self._next_due - now, self.idle_check)
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self.process_due(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки таймеров: {e}")
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def process_due(self, now: float) -> int:
+        """
+        Выполняет один пакет наступивших таймеров.
+
+        Returns:
+            int: Количество выполненных таймеров.
+        """
+        timers = await get_due_timers(now, self.batch_size)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fire(timer):
+            handler = self._handlers.get(timer["kind"])
+            if handler is None:
+                logger.warning(f"Нет обработчика для таймера вида {timer['kind']}")
+                return True
+            async with semaphore:
+                try:
+                    await handler(self._client, timer)
+                    return True
+                except Exception as e:
+                    logger.error(f"Ошибка выполнения таймера {timer['kind']} для {timer['user_id']}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(fire(timer) for timer in timers))
+        done = [timer["id"] for timer, ok in zip(timers, results) if ok or timer["attempts"] + 1 >= MAX_ATTEMPTS]
+        retries = [
+            (now + RETRY_DELAY * (timer["attempts"] + 1), timer["id"])
+            for timer, ok in zip(timers, results) if not ok and timer["attempts"] + 1 < MAX_ATTEMPTS
+        ]
+        if done:
+            await delete_timers(done)
+        if retries:
+            await retry_timers(retries)
+        self.fired.inc(sum(results))
+        self.failed.inc(len(results) - sum(results))
+        return len(timers)
+
+
+timer_service = TimerService()
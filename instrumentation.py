@@ -0,0 +1,268 @@
+import asyncio
+import functools
+import os
+import time
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.handlers import RawUpdateHandler
+
+from logger import setup_logger
+from metrics import METRICS_ENABLED, MetricsRegistry, registry as default_registry
+
+logger = setup_logger()
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 — не поднимать HTTP-сервер
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_SUMMARY_INTERVAL = float(os.getenv("METRICS_SUMMARY_INTERVAL", "300"))
+# Сколько самых затратных рядов показывать в сводке
+SUMMARY_TOP = 5
+
+SUMMARY_METRICS = ("handler_duration_seconds", "db_query_seconds", "telegram_api_seconds")
+# Группа, в которой отмечается первое обновление после запуска (раньше middleware)
+FIRST_UPDATE_GROUP = -100
+
+
+def handler_name(callback) -> str:
+    """
+    Короткое имя обработчика для метки: «StartHandler.start» вместо
+    «StartHandler.register_handlers.<locals>.start».
+    """
+    parts = callback.__qualname__.split(".")
+    return parts[0] if len(parts) == 1 else f"{parts[0]}.{parts[-1]}"
+
+
+def _instrument_callback(callback, metrics: MetricsRegistry):
+    labels = {"handler": handler_name(callback)}
+    duration = metrics.histogram("handler_duration_seconds", "Время выполнения обработчика", labels=labels)
+    errors = metrics.counter("handler_errors_total", "Необработанных исключений в обработчике", labels=labels)
+
+    @functools.wraps(callback)
+    async def wrapper(client, *args):
+        started = time.perf_counter()
+        try:
+            return await callback(client, *args)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def instrument_client(app: Client, metrics: MetricsRegistry = default_registry, enabled: bool = METRICS_ENABLED):
+    """
+    Подключает замеры к клиенту Pyrogram.
+
+    Все обработчики, зарегистрированные после вызова, оборачиваются замером
+    длительности; каждый вызов Telegram API (Client.invoke) замеряется по
+    имени метода, FloodWait считается отдельно. Вызывать до регистрации
+    обработчиков. При enabled=False клиент не изменяется.
+
+    Args:
+        app (Client): Экземпляр Pyrogram клиента.
+        metrics (MetricsRegistry): Реестр метрик.
+        enabled (bool): Включить инструментирование.
+    """
+    if not enabled:
+        return
+
+    add_handler = app.add_handler
+    invoke = app.invoke
+
+    def instrumented_add_handler(handler, group: int = 0):
+        handler.callback = _instrument_callback(handler.callback, metrics)
+        return add_handler(handler, group)
+
+    api_time = {}  # имя метода -> Histogram
+
+    async def instrumented_invoke(query, *args, **kwargs):
+        method = type(query).__name__
+        histogram = api_time.get(method)
+        if histogram is None:
+            histogram = api_time[method] = metrics.histogram(
+                "telegram_api_seconds", "Время вызова Telegram API", labels={"method": method}
+            )
+        started = time.perf_counter()
+        try:
+            return await invoke(query, *args, **kwargs)
+        except FloodWait:
+            metrics.counter("telegram_flood_waits_total", "Получено FloodWait от Telegram API",
+                            labels={"method": method}).inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    app.add_handler = instrumented_add_handler
+    app.invoke = instrumented_invoke
+
+
+def summarize(metrics: MetricsRegistry = default_registry, top: int = SUMMARY_TOP) -> str:
+    """
+    Краткая сводка: самые затратные по суммарному времени ряды обработчиков,
+    запросов к базе и вызовов API.
+
+    Returns:
+        str: Строка для лога.
+    """
+    parts = []
+    for name in SUMMARY_METRICS:
+        series = [metric for metric in metrics.all() if metric.name == name and metric.count]
+        series.sort(key=lambda metric: metric.sum, reverse=True)
+        for metric in series[:top]:
+            label = ",".join(str(value) for _, value in metric.labels)
+            parts.append(f"{name}[{label}] n={metric.count} p50={metric.quantile(0.5)}s "
+                         f"p95={metric.quantile(0.95)}s total={metric.sum:.3f}s")
+    flood_waits = sum(metric.value for metric in metrics.all() if metric.name == "telegram_flood_waits_total")
+    parts.append(f"flood_waits={flood_waits}")
+    return "; ".join(parts)
+
+
+class MetricsServer:
+    """
+    Минимальный HTTP-сервер, отдающий метрики в формате Prometheus по /metrics.
+    """
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT, metrics: MetricsRegistry = default_registry):
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, но их нужно дочитать
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        if self.port and self._server is None:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+class MetricsReporter:
+    """
+    Периодически пишет сводку метрик в лог.
+    """
+
+    def __init__(self, interval: float = METRICS_SUMMARY_INTERVAL, metrics: MetricsRegistry = default_registry):
+        self.interval = interval
+        self.metrics = metrics
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            logger.info(f"Метрики: {summarize(self.metrics)}")
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class StartupProfile:
+    """
+    Разбивка времени запуска по этапам и время до первого обновления.
+
+    Этапы отмечаются вызовом mark по мере завершения; каждый попадает в
+    лог и в метрику startup_phase_seconds. Первое обновление отмечает
+    RawUpdateHandler, который после этого снимается с клиента.
+    """
+
+    def __init__(self, started: float = None, metrics: MetricsRegistry = default_registry):
+        self.started = time.perf_counter() if started is None else started
+        self.metrics = metrics
+        self.phases = []  # (этап, секунды)
+        self.first_update = None
+        self._last = self.started
+        self._handler = None
+        self._group = None
+        self._first_update_event = None
+
+    def mark(self, phase: str):
+        """
+        Завершает этап: время считается от конца предыдущего этапа.
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self.metrics.gauge("startup_phase_seconds", "Длительность этапа запуска",
+                           labels={"phase": phase}).set(now - self._last)
+        self._last = now
+
+    def _get_event(self) -> asyncio.Event:
+        if self._first_update_event is None:
+            self._first_update_event = asyncio.Event()
+        return self._first_update_event
+
+    def attach(self, app: Client, group: int = FIRST_UPDATE_GROUP):
+        self._handler = RawUpdateHandler(self._on_update)
+        app.add_handler(self._handler, group)
+        self._group = group
+
+    async def _on_update(self, client, update, users, chats):
+        if self.first_update is not None:
+            return
+        self.first_update = time.perf_counter() - self.started
+        self.metrics.gauge("startup_first_update_seconds", "Время от запуска до первого обновления").set(
+            self.first_update
+        )
+        self._get_event().set()
+        client.remove_handler(self._handler, self._group)
+        logger.info(f"Первое обновление через {self.first_update * 1000:.0f} мс после запуска")
+
+    async def wait_first_update(self, timeout: float) -> bool:
+        """
+        Ждет первое обновление не дольше timeout секунд.
+
+        Returns:
+            bool: True, если обновление пришло.
+        """
+        try:
+            await asyncio.wait_for(self._get_event().wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def summary(self) -> str:
+        parts = [f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in self.phases]
+        total = self._last - self.started
+        return f"{', '.join(parts)}; всего {total * 1000:.0f} мс"
+
+
+metrics_server = MetricsServer()
+metrics_reporter = MetricsReporter()
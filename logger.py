@@ -1,40 +1,132 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-import tempfile
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOGGER_NAME = 'project_logger'
+LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+LOG_CONSOLE_LEVEL = os.getenv('LOG_CONSOLE_LEVEL', 'INFO').upper()
+# text — привычный однострочный формат, json — одна JSON-запись на строку
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Доля DEBUG-записей, которые попадают в лог (1 — все)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_lock = threading.Lock()
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись как JSON-объект в одну строку.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """
+    Пропускает только долю DEBUG-записей; записи уровня INFO и выше не трогает.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+def _make_formatter() -> logging.Formatter:
+    return JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+
 
 def setup_logger():
-    # Создание основного логгера
-    logger = logging.getLogger('project_logger')
-    logger.setLevel(logging.DEBUG)  # Уровень DEBUG позволит логировать всё
-
-    # Создание временной директории, если её нет
-    temp_dir = tempfile.gettempdir()  # Получаем путь к временной директории <button class="citation-flag" data-index="10">
-    log_file_path = os.path.join(temp_dir, 'app.log', )  # Путь к файлу логов
-
-    # Обработчик для записи в файл
-    # Обработчик для записи в файл с кодировкой UTF-8
-    file_handler = RotatingFileHandler(
-        'app.log',
-        maxBytes=1024 * 1024 * 5,  # 5 MB
-        backupCount=3,
-        encoding='utf-8'  # Кодировка для поддержки русского языка
-    )
-    file_handler.setLevel(logging.DEBUG)  # Все уровни в файл
-
-    # Обработчик для вывода в консоль
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)  # Только INFO и выше в консоль
-
-    # Форматирование логов
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
-
-    # Добавление обработчиков к логгеру
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
-    logger.info(f"Логирование настроено. Логи будут сохраняться в {log_file_path}")  # Информационное сообщение о пути к логам
-
-    return logger
\ No newline at end of file
+    """
+    Возвращает логгер проекта, настраивая его при первом вызове.
+
+    Записи из цикла событий только кладутся в очередь (QueueHandler), а
+    форматирование и запись в файл и консоль выполняет QueueListener в
+    отдельном потоке. Повторные вызовы возвращают уже настроенный логгер
+    и не добавляют обработчиков.
+
+    Returns:
+        logging.Logger: Логгер project_logger.
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return logger
+
+    with _lock:
+        if _listener is not None:
+            return logger
+
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+        formatter = _make_formatter()
+
+        # Обработчик для записи в файл с кодировкой UTF-8
+        file_handler = RotatingFileHandler(
+            LOG_FILE,
+            maxBytes=1024 * 1024 * 5,  # 5 MB
+            backupCount=3,
+            encoding='utf-8'  # Кодировка для поддержки русского языка
+        )
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+
+        # Обработчик для вывода в консоль
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(LOG_CONSOLE_LEVEL)
+        console_handler.setFormatter(formatter)
+
+        queue_handler = QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+        logger.addHandler(queue_handler)
+
+        _listener = QueueListener(queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logger)
+
+    logger.info(f"Логирование настроено. Логи будут сохраняться в {os.path.abspath(LOG_FILE)}")
+
+    return logger
+
+
+def shutdown_logger():
+    """
+    Дописывает оставшиеся в очереди записи и останавливает фоновый поток.
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        logger = logging.getLogger(LOGGER_NAME)
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                logger.removeHandler(handler)
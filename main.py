@@ -1,79 +1,81 @@
-from pyrogram import Client
-import asyncio
-from dotenv import load_dotenv
-import os
+import time
 
-from logger import setup_logger
-from config import load_config, add_existing_users_to_db
-from handlers import StartHandler, HelpButton, InviteButton, EventButton, DepartureHandler, MessageHandler, NewMemberHandler, ChatSelectionHandler
+# Отсчет времени запуска начинается до импорта Pyrogram и модулей бота
+STARTED = time.perf_counter()
 
-# Настройка логирования
-logger = setup_logger()
+from pyrogram import idle  # noqa: E402
+import asyncio  # noqa: E402
+import os  # noqa: E402
 
-# Загрузка переменных окружения
-load_dotenv()
+from bot import (create_client, register_handlers, load_state, start_services, stop_client_services,  # noqa: E402
+                 stop_services, logger)
+from instrumentation import StartupProfile  # noqa: E402
+from logger import shutdown_logger  # noqa: E402
 
+# Число процессов-обработчиков; 1 — все обновления обрабатываются в этом процессе
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
 
 
-# Получение значений из переменных окружения
-TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-API_ID = os.getenv('API_ID')
-API_HASH = os.getenv('API_HASH')
-PROXY_URL = os.getenv('PROXY_URL')
-
-# Загрузка конфигурации
-try:
-    chats = load_config()
-    INVITING_CHAT_ID = chats.get("INVITING_CHAT")
-    INVITED_CHAT_ID = chats.get("INVITED_CHAT")
-except Exception as e:
-    logger.error(f"Ошибка загрузки конфигурации: {e}")
-    INVITING_CHAT_ID = None
-    INVITED_CHAT_ID = None
-
-# Инициализация клиента Pyrogram
-app = Client(
-    "Inviting_Event_bot",
-    api_id=API_ID,
-    api_hash=API_HASH,
-    bot_token=TELEGRAM_BOT_TOKEN,
-    proxy={"enabled": True, "hostname": PROXY_URL.split("//")[1].split(":")[0], "port": int(PROXY_URL.split(":")[-1])} if PROXY_URL else None
-)
-
-# Регистрация обработчиков
-StartHandler(app)
-HelpButton(app)
-InviteButton(app, INVITING_CHAT_ID, INVITED_CHAT_ID)
-EventButton(app, INVITED_CHAT_ID)
-DepartureHandler(app, INVITED_CHAT_ID)
-NewMemberHandler(app)
-ChatSelectionHandler(app)
-MessageHandler(app)
-
 async def main():
     logger.info("Запуск приложения")
+    profile = StartupProfile(STARTED)
+    profile.mark("import")
 
     try:
+        await load_state(profile)
+        # Клиент создается внутри цикла событий, иначе обработчики не регистрируются
+        app = create_client()
+        register_handlers(app)
+        profile.attach(app)
+        profile.mark("handlers")
+
         async with app:
-            # Добавление существующих пользователей из чатов в базу данных
-            if INVITING_CHAT_ID:
-                try:
-                    await add_existing_users_to_db(app, INVITING_CHAT_ID)
-                except Exception as e:
-                    logger.error(f"Ошибка добавления пользователей из чата INVITING_CHAT: {e}", exc_info=True)
+            profile.mark("connect")
+            tasks = []
+            try:
+                tasks = await start_services(app, profile=profile)
+                profile.mark("services")
+                logger.info(f"Запуск: {profile.summary()}")
 
-            if INVITED_CHAT_ID:
-                try:
-                    await add_existing_users_to_db(app, INVITED_CHAT_ID)
-                except Exception as e:
-                    logger.error(f"Ошибка добавления пользователей из чата INVITED_CHAT: {e}", exc_info=True)
+                # Бесконечный цикл работы бота
+                await idle()
+            finally:
+                # Службам, обращающимся к Telegram, нужен еще не остановленный клиент
+                await stop_client_services(tasks)
+    except Exception as e:
+        logger.critical(f"Ошибка при работе бота: {e}", exc_info=True)
+    finally:
+        await stop_services()
+        shutdown_logger()
 
-            # Бесконечный цикл работы бота
+
+async def main_cluster(worker_count: int):
+    from cluster import Ingress
+    from instrumentation import metrics_server
+    from metrics import METRICS_ENABLED
+
+    logger.info(f"Запуск приложения: прием обновлений и {worker_count} процессов-обработчиков")
+    ingress = None
+
+    try:
+        app = create_client()
+        ingress = Ingress(app, worker_count)
+        ingress.start()
+
+        async with app:
+            if METRICS_ENABLED:
+                await metrics_server.start()
+            await idle()
     except Exception as e:
         logger.critical(f"Ошибка при работе бота: {e}", exc_info=True)
+    finally:
+        if ingress is not None:
+            await ingress.stop()
+        await metrics_server.stop()
+        shutdown_logger()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main_cluster(BOT_WORKERS) if BOT_WORKERS > 1 else main())
     except Exception as e:
-        logger.critical(f"Критическая ошибка в основном потоке: {e}", exc_info=True)
\ No newline at end of file
+        logger.critical(f"Критическая ошибка в основном потоке: {e}", exc_info=True)
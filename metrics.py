@@ -0,0 +1,161 @@
+import bisect
+import os
+import threading
+
+# При METRICS_ENABLED=0 инструментирование не подключается и не стоит ничего
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, description: str = "", labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str = "", labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str = "", labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценивает квантиль по границам корзин.
+
+        Args:
+            q (float): Квантиль от 0 до 1.
+
+        Returns:
+            float: Верхняя граница корзины, в которую попадает квантиль.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса.
+
+    Метрика определяется именем и набором меток: одно имя с разными метками
+    (например, handler="StartHandler.start") — это разные ряды одной
+    метрики в выводе Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, description, labels=None, **kwargs):
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(name, description, labels=key[1], **kwargs)
+        return metric
+
+    def counter(self, name: str, description: str = "", labels: dict = None) -> Counter:
+        return self._get_or_create(Counter, name, description, labels)
+
+    def gauge(self, name: str, description: str = "", labels: dict = None) -> Gauge:
+        return self._get_or_create(Gauge, name, description, labels)
+
+    def histogram(self, name: str, description: str = "", buckets=DEFAULT_BUCKETS, labels: dict = None) -> Histogram:
+        return self._get_or_create(Histogram, name, description, labels, buckets=buckets)
+
+    def all(self):
+        return list(self._metrics.values())
+
+    def render(self) -> str:
+        """
+        Формирует текстовое представление метрик в формате Prometheus.
+
+        Returns:
+            str: Текст для ответа на /metrics.
+        """
+        families = {}
+        for metric in self.all():
+            families.setdefault(metric.name, []).append(metric)
+
+        lines = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].description}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_format_labels(metric.labels)} {_format_value(metric.value)}")
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float("inf"),), metric.bucket_counts):
+                    cumulative += bucket_count
+                    le = (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(metric.labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(metric.labels)} {_format_value(metric.sum)}")
+                lines.append(f"{name}_count{_format_labels(metric.labels)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
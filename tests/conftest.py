@@ -0,0 +1,15 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# База, лог и архив тестов — во временном каталоге, а не в рабочем.
+# Переменные задаются до импорта модулей бота: они читают их при загрузке
+_directory = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ["DB_PATH"] = os.path.join(_directory, "identifier.sqlite")
+os.environ["LOG_FILE"] = os.path.join(_directory, "app.log")
+os.environ["ARCHIVE_DIR"] = os.path.join(_directory, "archive")
+atexit.register(shutil.rmtree, _directory, ignore_errors=True)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+from config.archive import MessageArchive, period_of
+from config.storage import Storage
+
+DAY = 86400
+START = 1_700_000_000
+
+
+def rows_for_days(days, chat_id=-100):
+    return [(chat_id, day, START + day * DAY, f"привет день{day}") for day in range(days)]
+
+
+def test_search_across_more_files_than_open_limit(tmp_path, monkeypatch):
+    closed_in = []
+    original_close = Storage.close
+
+    def close(storage):
+        closed_in.append(threading.current_thread() is threading.main_thread())
+        original_close(storage)
+
+    monkeypatch.setattr(Storage, "close", close)
+
+    async def run():
+        archive = MessageArchive(str(tmp_path), rollover="day", max_open_files=2)
+        await archive.write(rows_for_days(5))
+        # Поиск проходит все периоды и по пути вытесняет лишние файлы
+        results = await archive.search(-100, "привет", limit=10)
+        open_files = len(archive._files)
+        created = set(archive._created)
+        archive.close()
+        return results, open_files, created
+
+    results, open_files, created = asyncio.run(run())
+
+    assert [row["user_id"] for row in results] == [4, 3, 2, 1, 0]
+    assert open_files == 2
+    assert created == {period_of(START + day * DAY, "day") for day in range(5)}
+    # Вытесненные файлы закрываются в пуле потоков, а не в цикле событий;
+    # последние два закрывает archive.close() при остановке
+    assert closed_in[:-2] and not any(closed_in[:-2])
+
+
+def test_concurrent_open_of_same_period_keeps_one_storage(tmp_path):
+    async def run():
+        archive = MessageArchive(str(tmp_path), rollover="day", max_open_files=4)
+        period = period_of(START, "day")
+        storages = await asyncio.gather(*(archive._open(period) for _ in range(5)))
+        kept = archive._files[period]
+        archive.close()
+        return storages, kept
+
+    storages, kept = asyncio.run(run())
+
+    assert all(storage is kept for storage in storages)
+
+
+def test_maintain_skips_sealed_periods(tmp_path):
+    async def run():
+        archive = MessageArchive(str(tmp_path), rollover="day", hot_days=0, max_open_files=2)
+        await archive.write(rows_for_days(4))
+        now = START + 3 * DAY + 1
+        first = await archive.maintain(now)
+        # Сжатый файл прошедшего периода запечатывается следующим проходом
+        second = await archive.maintain(now)
+
+        archive.close()
+        await archive.maintain(now)
+        reopened = set(archive._files)
+        results = await archive.search(-100, "день0")
+        archive.close()
+        return first, second, reopened, results
+
+    first, second, reopened, results = asyncio.run(run())
+
+    assert (first, second) == (4, 0)
+    # Прошедшие периоды запечатаны: следующий проход открывает только текущий файл
+    assert reopened == {period_of(START + 3 * DAY, "day")}
+    # Сжатые сообщения по-прежнему находятся
+    assert [row["text"] for row in results] == ["привет день0"]
+
+
+def test_keep_files_removes_oldest(tmp_path):
+    async def run():
+        archive = MessageArchive(str(tmp_path), rollover="day", keep_files=2)
+        await archive.write(rows_for_days(4))
+        await archive.maintain(START + 3 * DAY + 1)
+        periods = archive.periods()
+        archive.close()
+        return periods
+
+    assert asyncio.run(run()) == [period_of(START + day * DAY, "day") for day in (3, 2)]
@@ -0,0 +1,54 @@
+from collections import Counter
+
+from cluster.hashing import ConsistentHashRing
+
+KEYS = range(20_000)
+
+
+def test_empty_ring():
+    ring = ConsistentHashRing()
+
+    assert ring.node_for(1) is None
+    assert len(ring) == 0
+
+
+def test_mapping_is_deterministic():
+    first = ConsistentHashRing(range(4))
+    second = ConsistentHashRing(reversed(range(4)))
+
+    assert all(first.node_for(key) == second.node_for(key) for key in KEYS)
+
+
+def test_keys_spread_evenly():
+    ring = ConsistentHashRing(range(4))
+
+    counts = Counter(ring.node_for(key) for key in KEYS)
+
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > len(KEYS) / 4 * 0.8
+
+
+def test_adding_node_moves_only_its_share():
+    ring = ConsistentHashRing(range(4))
+    before = {key: ring.node_for(key) for key in KEYS}
+
+    ring.add(4)
+
+    moved = [key for key in KEYS if ring.node_for(key) != before[key]]
+    # Переезжают только ключи нового узла, примерно 1/5
+    assert all(ring.node_for(key) == 4 for key in moved)
+    assert len(moved) < len(KEYS) / 5 * 1.3
+
+
+def test_removing_node_keeps_other_keys():
+    ring = ConsistentHashRing(range(4))
+    before = {key: ring.node_for(key) for key in KEYS}
+
+    ring.remove(2)
+
+    assert len(ring) == 3
+    for key in KEYS:
+        if before[key] != 2:
+            assert ring.node_for(key) == before[key]
+        else:
+            assert ring.node_for(key) != 2
@@ -0,0 +1,64 @@
+import html
+import re
+
+from handlers.mentions import chunk_mentions, render_mention
+
+
+def visible(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def visible_html(text: str) -> int:
+    return visible(html.unescape(re.sub(r"<[^>]+>", "", text)))
+
+
+def test_render_mention_counts_utf16_units():
+    # Эмодзи вне BMP занимает две единицы UTF-16
+    mention, length = render_mention(1, None, "Аня 🎉")
+    assert length == 6
+    assert mention == '<a href="tg://user?id=1">Аня 🎉</a>'
+
+    mention, length = render_mention(2, "anna", "Аня")
+    assert (mention, length) == ("@anna", 5)
+
+
+def test_render_mention_escapes_name():
+    mention, length = render_mention(3, None, "<b>&</b>")
+    assert "&lt;b&gt;&amp;&lt;/b&gt;" in mention
+    assert length == len("<b>&</b>")
+
+
+def test_chunks_fit_limit_in_utf16_units():
+    names = ["🎉" * 5, "Иван", "😀😀", "x" * 7] * 50
+    mentions = [render_mention(user_id, None, name) for user_id, name in enumerate(names)]
+    limit = 40
+
+    chunks = chunk_mentions(mentions, limit)
+
+    assert len(chunks) > 1
+    assert all(visible_html(chunk) <= limit for chunk in chunks)
+    # Ни одно упоминание не потеряно и порядок сохранен
+    assert " ".join(chunks) == " ".join(mention for mention, _ in mentions)
+
+
+def test_chunk_boundary_counts_separator():
+    mentions = [("a" * 5, 5), ("b" * 5, 5), ("c", 1)]
+
+    assert chunk_mentions(mentions, 11) == ["aaaaa bbbbb", "c"]
+    assert chunk_mentions(mentions, 10) == ["aaaaa", "bbbbb c"]
+
+
+def test_emoji_counted_as_two_units():
+    # Десять эмодзи — 20 единиц UTF-16, хотя len() дает 10
+    mentions = [("🎉" * 10, visible("🎉" * 10))] * 3
+
+    chunks = chunk_mentions(mentions, 30)
+
+    assert len(chunks) == 3
+
+
+def test_oversized_mention_gets_own_chunk():
+    mentions = [("a", 1), ("b" * 50, 50), ("c", 1)]
+
+    assert chunk_mentions(mentions, 10) == ["a", "b" * 50, "c"]
+    assert chunk_mentions([], 10) == []
@@ -0,0 +1,91 @@
+import sqlite3
+
+from config.migrations import SCHEMA_VERSION, apply_migrations, schema_version
+
+# Схема баз, созданных до появления миграций (user_version = 0)
+V1_SCHEMA = """
+    CREATE TABLE chats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_type TEXT NOT NULL,
+        chat_id INTEGER NOT NULL UNIQUE
+    );
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL UNIQUE,
+        username TEXT,
+        full_name TEXT,
+        joined_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        chat_id INTEGER,
+        FOREIGN KEY(chat_id) REFERENCES chats(chat_id) ON DELETE CASCADE
+    );
+    CREATE TABLE messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        message_text TEXT,
+        sent_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE user_activity (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        request_time DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+
+def columns(connection, table):
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+
+def test_fresh_database():
+    connection = sqlite3.connect(":memory:")
+
+    assert apply_migrations(connection) == SCHEMA_VERSION
+    assert schema_version(connection) == SCHEMA_VERSION
+    assert apply_migrations(connection) == 0
+
+
+def test_upgrades_existing_v1_database(tmp_path):
+    path = str(tmp_path / "legacy.sqlite")
+    connection = sqlite3.connect(path)
+    connection.executescript(V1_SCHEMA)
+    connection.execute("INSERT INTO chats (chat_type, chat_id) VALUES ('INVITING_CHAT', -100)")
+    connection.executemany(
+        "INSERT INTO users (user_id, username, full_name, joined_at, chat_id) VALUES (?, ?, ?, ?, ?)",
+        [(1, "anna", "Анна", "2024-01-02 03:04:05", -100), (2, None, "Борис", "2024-01-03 00:00:00", None)]
+    )
+    connection.execute("INSERT INTO user_activity (user_id, request_time) VALUES (1, '2024-01-02 03:04:05')")
+    connection.commit()
+    connection.close()
+
+    connection = sqlite3.connect(path, isolation_level=None)
+    assert apply_migrations(connection) == SCHEMA_VERSION
+    assert schema_version(connection) == SCHEMA_VERSION
+
+    # Данные сохранены, участники перенесены из users.chat_id
+    assert connection.execute("SELECT user_id, full_name FROM users ORDER BY user_id").fetchall() == [
+        (1, "Анна"), (2, "Борис")
+    ]
+    assert connection.execute("SELECT chat_id, user_id, joined_at FROM chat_members").fetchall() == [
+        (-100, 1, 1704164645.0)
+    ]
+    assert "chat_id" in columns(connection, "user_activity")
+    assert connection.execute("SELECT user_id, chat_id FROM user_activity").fetchall() == [(1, None)]
+    for table in ("sync_checkpoints", "chat_pairs", "timers", "shared_state", "activity_daily"):
+        assert columns(connection, table)
+
+    # Повторный запуск ничего не меняет
+    assert apply_migrations(connection) == 0
+    connection.close()
+
+
+def test_resumes_from_recorded_version():
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    connection.executescript(V1_SCHEMA)
+    connection.execute("PRAGMA user_version = 2")
+
+    # Версии 1 и 2 уже применены, выполняются только оставшиеся
+    assert apply_migrations(connection) == SCHEMA_VERSION - 2
+    assert columns(connection, "chat_members")
+    assert not connection.execute(
+        "SELECT name FROM sqlite_master WHERE name = 'sync_checkpoints'"
+    ).fetchall()
@@ -0,0 +1,107 @@
+import asyncio
+import random
+
+from pyrogram.errors import FloodWait
+
+from handlers.outbound import PRIORITY_NOTICE, PRIORITY_REPLY, OutboundScheduler
+
+
+def fast_scheduler(**kwargs):
+    # Лимиты не мешают тесту: проверяется порядок, а не темп
+    return OutboundScheduler(global_rate=10_000, private_rate=10_000, group_rate=10_000, group_burst=10, **kwargs)
+
+
+class FlakyClient:
+    """
+    Клиент со случайной задержкой отправки и периодическими FloodWait.
+    """
+
+    def __init__(self, seed=0, flood_every=None):
+        self.random = random.Random(seed)
+        self.flood_every = flood_every
+        self.calls = 0
+        self.delivered = {}  # chat_id -> [text]
+        self.concurrent = {}  # chat_id -> сколько отправок сейчас в пути
+        self.max_concurrent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        self.concurrent[chat_id] = self.concurrent.get(chat_id, 0) + 1
+        self.max_concurrent = max(self.max_concurrent, self.concurrent[chat_id])
+        try:
+            await asyncio.sleep(self.random.uniform(0, 0.003))
+            # FloodWait получают первая отправка и каждая flood_every-я после нее
+            if self.flood_every and (self.calls - 1) % self.flood_every == 0:
+                raise FloodWait(value=0)
+            self.delivered.setdefault(chat_id, []).append(text)
+            return text
+        finally:
+            self.concurrent[chat_id] -= 1
+
+    async def send_document(self, chat_id, document, **kwargs):
+        return await self.send_message(chat_id, ("document", document, kwargs.get("file_name")))
+
+
+def test_chat_order_survives_latency_and_flood_wait():
+    async def run():
+        scheduler = fast_scheduler()
+        client = FlakyClient(flood_every=7)
+        chats = [-101, -102, -103, 5]
+        expected = {chat_id: [f"{chat_id}:{n}" for n in range(40)] for chat_id in chats}
+        futures = [scheduler.submit(client, chat_id, expected[chat_id][n]) for n in range(40) for chat_id in chats]
+        await asyncio.wait_for(asyncio.gather(*futures), timeout=10)
+        await scheduler.stop()
+        return client, expected, scheduler
+
+    client, expected, scheduler = asyncio.run(run())
+
+    assert client.delivered == expected
+    assert client.max_concurrent == 1
+    assert scheduler.flood_waits.value > 0
+
+
+def test_priority_applies_across_chats():
+    async def run():
+        scheduler = fast_scheduler(max_in_flight=1)
+        client = FlakyClient()
+        order = []
+        futures = [scheduler.submit(client, chat_id, text, priority)
+                   for chat_id, text, priority in [(-1, "notice", PRIORITY_NOTICE), (2, "reply", PRIORITY_REPLY)]]
+        for future in futures:
+            future.add_done_callback(lambda done: order.append(done.result()))
+        await asyncio.gather(*futures)
+        await scheduler.stop()
+        return order
+
+    assert asyncio.run(run()) == ["reply", "notice"]
+
+
+def test_document_keeps_chat_order():
+    async def run():
+        scheduler = fast_scheduler()
+        # Файл получает FloodWait и повторяется, сообщение после него ждет
+        client = FlakyClient(flood_every=100)
+        await asyncio.gather(
+            scheduler.send_document(client, 7, "/tmp/export.csv", file_name="export.csv"),
+            scheduler.send(client, 7, "after"),
+        )
+        await scheduler.stop()
+        return client.delivered[7]
+
+    assert asyncio.run(run()) == [("document", "/tmp/export.csv", "export.csv"), "after"]
+
+
+def test_stop_cancels_undelivered():
+    async def run():
+        scheduler = OutboundScheduler(global_rate=10_000, private_rate=0.001)
+        client = FlakyClient()
+        first = scheduler.submit(client, 9, "first")
+        second = scheduler.submit(client, 9, "second")
+        await first
+        await scheduler.stop(drain_timeout=0.05)
+        return second, client.delivered
+
+    second, delivered = asyncio.run(run())
+
+    assert second.cancelled()
+    assert delivered == {9: ["first"]}
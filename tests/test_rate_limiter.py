@@ -0,0 +1,70 @@
+from config.middleware import SlidingWindowLimiter
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_allows_limit_requests_per_window():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(3, 10.0, clock=clock)
+
+    assert [limiter.hit(1) for _ in range(4)] == [True, True, True, False]
+    # Другой ключ считается отдельно
+    assert limiter.hit(2)
+
+
+def test_window_slides_from_oldest_request():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(2, 10.0, clock=clock)
+
+    assert limiter.hit(1)
+    clock.now += 6
+    assert limiter.hit(1)
+    clock.now += 3
+    assert not limiter.hit(1)
+    # Первый запрос вышел из окна, второй еще в нем
+    clock.now += 1
+    assert limiter.hit(1)
+    assert not limiter.hit(1)
+
+
+def test_rejected_requests_do_not_extend_window():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(1, 10.0, clock=clock)
+
+    assert limiter.hit(1)
+    for _ in range(5):
+        clock.now += 1
+        assert not limiter.hit(1)
+    clock.now += 5
+    assert limiter.hit(1)
+
+
+def test_idle_keys_are_evicted():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(2, 10.0, clock=clock)
+
+    for key in range(10):
+        limiter.hit(key)
+    assert len(limiter) == 10
+
+    clock.now += 11
+    limiter.hit("active")
+    assert len(limiter) == 1
+
+
+def test_max_keys_bounds_memory():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(2, 10.0, max_keys=5, clock=clock)
+
+    for key in range(50):
+        limiter.hit(key)
+    assert len(limiter) <= 5
+    # Вытесняются давно не обращавшиеся ключи
+    assert limiter.hit(49)
+    assert not limiter.hit(49)
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from config.config import RetentionEngine, _create_tables
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    _create_tables(connection)
+    yield connection
+    connection.close()
+
+
+def add_messages(connection, count, start=0):
+    connection.executemany(
+        "INSERT INTO messages (user_id, message_text, sent_at) VALUES (?, ?, datetime(?, 'unixepoch'))",
+        ((1, f"m{i}", 1_700_000_000 + i) for i in range(start, start + count))
+    )
+
+
+def add_activity(connection, user_id, count, start=0):
+    connection.executemany(
+        "INSERT INTO user_activity (user_id, request_time) VALUES (?, datetime(?, 'unixepoch'))",
+        ((user_id, 1_700_000_000 + i) for i in range(start, start + count))
+    )
+
+
+def activity_count(connection, user_id):
+    return connection.execute("SELECT COUNT(*) FROM user_activity WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def test_keeps_newest_messages(connection):
+    add_messages(connection, 150)
+
+    assert RetentionEngine(messages_limit=100).apply(connection) == (50, 0)
+
+    texts = [row[0] for row in connection.execute("SELECT message_text FROM messages ORDER BY sent_at")]
+    assert texts == [f"m{i}" for i in range(50, 150)]
+
+
+def test_trims_activity_of_marked_users_only(connection):
+    add_activity(connection, 1, 60)
+    add_activity(connection, 2, 10)
+    add_activity(connection, 3, 80)
+    engine = RetentionEngine(activity_limit=50)
+
+    engine.mark_activity([1, 2])
+
+    assert engine.apply(connection) == (0, 10)
+    assert activity_count(connection, 1) == 50
+    assert activity_count(connection, 2) == 10
+    # Пользователь без новой активности не затрагивается
+    assert activity_count(connection, 3) == 80
+    # Остаются самые новые записи
+    oldest = connection.execute(
+        "SELECT MIN(request_time) FROM user_activity WHERE user_id = 1"
+    ).fetchone()[0]
+    assert oldest == connection.execute("SELECT datetime(1700000010, 'unixepoch')").fetchone()[0]
+
+    # Отметки сбрасываются после прохода
+    assert engine.apply(connection) == (0, 0)
+
+
+def test_pass_is_bounded_by_max_users(connection):
+    for user_id in range(5):
+        add_activity(connection, user_id, 55)
+    engine = RetentionEngine(activity_limit=50, max_users_per_pass=2)
+    engine.mark_activity(range(5))
+
+    passes = []
+    while True:
+        deleted = engine.apply(connection)[1]
+        if not deleted:
+            break
+        passes.append(deleted)
+
+    assert passes == [10, 10, 5]
+    assert all(activity_count(connection, user_id) == 50 for user_id in range(5))